@@ -1,7 +1,14 @@
 import logging
+from typing import Iterable, Iterator, Optional
 
+import pandas as pd
+
+from multi_market_qt_system.core.bar_store import ADJUSTMENTS, BarStore, apply_adjustment, normalize_bars
+from multi_market_qt_system.core.cost_model import CostModel
 from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.market_calendar import MarketCalendar, calendar_for
 from multi_market_qt_system.core.risk_manager import RiskManager
+from multi_market_qt_system.core.scheduler import EventScheduler
 from multi_market_qt_system.core.strategy_base import StrategyBase
 from multi_market_qt_system.core.order import Order, OrderType, OrderStyle
 from multi_market_qt_system.core.portfolio import Portfolio
@@ -10,6 +17,67 @@ from multi_market_qt_system.core.performance import PerformanceMetrics
 logger = logging.getLogger(__name__)
 
 
+def signal_order_type(action: str) -> OrderType:
+    """回测中信号方向到订单类型的映射：'BUY' 买入，其余一律按 SELL 卖出（回测账户只做多）"""
+    return OrderType.BUY if action == 'BUY' else OrderType.SELL
+
+
+def iter_bar_frames(
+        data_client: DataClient,
+        symbol: str,
+        start: str,
+        end: str,
+        provider: str = 'yfinance',
+        bar_store: Optional[BarStore] = None,
+        chunk_size: int = 100_000,
+        price_dtype: str = 'float64',
+        volume_dtype: str = 'float64',
+        adjustment: str = 'raw'
+) -> Iterator[pd.DataFrame]:
+    """
+    产出标准化后的行情块：提供 bar_store 时按块流式读取（缺数据时先拉取并入库一次），
+    否则整段拉取并标准化为单个块。
+    :param adjustment: 复权方式 'raw'（数据源原样价格）/ 'split' / 'total_return'；后两者请求未复权 K 线后在本地复权，
+        公司行为随行情入库时拉取，之后切换复权方式只在读取时重算，不再访问网络
+    """
+    if adjustment not in ADJUSTMENTS:
+        raise ValueError(f"Unknown adjustment mode: {adjustment}")
+    if bar_store is not None:
+        stored_unadjusted = bar_store.is_unadjusted(symbol)
+        # 本地复权要求未复权价格；仓库一旦存了未复权价格，之后补数据也保持同一口径
+        unadjusted = adjustment != 'raw' or stored_unadjusted
+        # 已入库的是数据源默认口径（如 yfinance 已拆股复权），需整段换成未复权价格，否则拆股会被复权两次
+        rebuild = adjustment != 'raw' and bar_store.has(symbol) and not stored_unadjusted
+        need_actions = adjustment != 'raw' and not bar_store.has_actions(symbol)
+        # 只拉取尚未入库的空档（可能有多段）
+        gaps = [(start, end)] if rebuild else bar_store.missing(symbol, start, end)
+        if gaps:
+            # 已入库过公司行为的标的随行情一起重新拉取，保证新行情之后的拆股/分红不会遗漏
+            refresh = need_actions or bar_store.has_actions(symbol)
+            actions = data_client.get_corporate_actions(symbol, provider, refresh=True) if refresh else None
+            for i, (gap_start, gap_end) in enumerate(gaps):
+                raw = data_client.get_historical(symbol, gap_start, gap_end, provider, unadjusted=unadjusted)
+                bar_store.ingest(symbol, raw, gap_start, gap_end, actions=actions, unadjusted=unadjusted,
+                                 replace=rebuild and i == 0)
+        elif need_actions:
+            bar_store.set_actions(symbol, data_client.get_corporate_actions(symbol, provider))
+        yield from bar_store.iter_chunks(
+            symbol, start, end,
+            chunk_size=chunk_size,
+            price_dtype=price_dtype,
+            volume_dtype=volume_dtype,
+            adjustment=adjustment
+        )
+        return
+
+    df = normalize_bars(data_client.get_historical(symbol, start, end, provider, unadjusted=adjustment != 'raw'))
+    if adjustment != 'raw':
+        df = apply_adjustment(df, data_client.get_corporate_actions(symbol, provider), adjustment)
+    logger.debug("DataFrame tail:\n%s", df.tail(3))
+    print(df.tail(3), "\n")
+    yield df
+
+
 class Backtester:
     """
     回测引擎：集成数据获取、策略执行、风控检查与交易模拟。
@@ -22,14 +90,40 @@ class Backtester:
             risk_manager: RiskManager,
             initial_cash: float = 1_000_000,
             commission: float = 0.0005,
-            slippage: float = 0.0002
+            slippage: float = 0.0002,
+            bar_store: Optional[BarStore] = None,
+            chunk_size: int = 100_000,
+            price_dtype: str = 'float64',
+            volume_dtype: str = 'float64',
+            calendar: Optional[MarketCalendar] = None,
+            cost_model: Optional[CostModel] = None,
+            adjustment: str = 'raw'
     ):
+        """
+        :param bar_store: 本地 K 线仓库；提供时数据只在首次入库时标准化，回测按块流式读取
+        :param chunk_size: 流式读取的块大小（行）
+        :param price_dtype: 价格列类型，'float32' 可减半内存
+        :param volume_dtype: 成交量列类型
+        :param adjustment: 复权方式 'raw' / 'split' / 'total_return'
+        :param calendar: 交易日历，用于年化；None 时按标的代码推断市场
+        :param cost_model: 交易成本模型；None 时按 commission/slippage 两个标量计费
+        """
         self.data_client = data_client
         self.strategy = strategy
         self.risk_manager = risk_manager
         self.initial_cash = initial_cash
         self.commission = commission
         self.slippage = slippage
+        self.bar_store = bar_store
+        self.chunk_size = chunk_size
+        self.price_dtype = price_dtype
+        self.volume_dtype = volume_dtype
+        self.calendar = calendar
+        self.cost_model = cost_model
+        self.adjustment = adjustment
+        self.portfolio: Portfolio = None  # 最近一次 run 的资产组合
+        self.scheduler: Optional[EventScheduler] = None  # 最近一次 run 的定时事件调度器
+        self._last_bar: Optional[tuple] = None  # 上一根 bar 的 (收盘价, 成交量)，定时信号按它撮合
         logger.info("Backtester initialized: initial_cash=%s, commission=%s, slippage=%s", initial_cash, commission, slippage)
 
     def run(
@@ -48,29 +142,68 @@ class Backtester:
         :return: Portfolio 对象（包含现金、持仓、交易记录等）
         """
         logger.info("Backtest run started for %s [%s - %s]", symbol, start, end)
+        return self.run_frames(symbol, self._iter_frames(symbol, start, end, provider))
 
-        # 1. 获取历史数据并标准化
-        df = self.data_client.get_historical(symbol, start, end, provider)
-        df = (
-            df.rename(columns=lambda col: col.lower())  # 或者 .columns = [c.lower() for c in df.columns]
-            .reset_index()
-            .rename(columns={'date': 'timestamp'})
-            .set_index('timestamp', drop=False)
-            .sort_index()
-        )
-        logger.debug("DataFrame tail:\n%s", df.tail(3))
-        print(df.tail(3), "\n")
+    def run_frames(self, symbol: str, frames: Iterable[pd.DataFrame]) -> PerformanceMetrics:
+        """
+        在已标准化的行情块上回测（数据已在内存中时使用，如参数寻优、滚动样本外检验）。
+        :param frames: 按时间顺序的行情 DataFrame 块
+        """
+        # 1. 初始化资产组合与定时事件
+        portfolio = Portfolio(cash=self.initial_cash, cost_model=self.cost_model)
+        index_parts = []
+        self.scheduler = EventScheduler()
+        self._last_bar = None
+        self.strategy.schedule_events(self.scheduler)
 
-        # 2. 初始化资产组合
-        portfolio = Portfolio(cash=self.initial_cash)
+        # 2. 按块读取行情并推进回测
+        for chunk in frames:
+            if chunk.empty:
+                continue
+            if not index_parts:
+                # 记录初始快照：用首日开盘价或收盘价估算市值 (防止"计算绩效指标"结果为 NAN%)
+                first_price = chunk.iloc[0].close
+                portfolio._log_state(chunk.index[0], {symbol: first_price})
+                logger.debug("Initial portfolio state logged with price %s", first_price)
+            index_parts.append(chunk.index)
+            self._run_chunk(symbol, chunk, portfolio)
 
-        # 2.1 记录初始快照：用首日开盘价或收盘价估算市值 (防止"计算绩效指标"结果为 NAN%)
-        first_price = df.iloc[0].close
-        portfolio._log_state(df.index[0], {symbol: first_price})
-        logger.debug("Initial portfolio state logged with price %s", first_price)
+        if not index_parts:
+            raise ValueError(f"No historical data for {symbol}")
+        price_index = index_parts[0].append(index_parts[1:]) if len(index_parts) > 1 else index_parts[0]
+        self.portfolio = portfolio
 
-        # 3. 回测主循环
+        # 3. 计算绩效指标（按标的所属市场年化：美股 252、加密货币 365 等）
+        calendar = self.calendar or calendar_for(symbol)
+        perf = PerformanceMetrics.from_portfolio(
+            portfolio,
+            price_index=price_index,
+            trading_days=calendar.periods_per_year(price_index)
+        )
+        stats = portfolio.summary()
+        logger.info("Backtest completed for %s: stats=%s", symbol, stats)
+        print("\nstats: ", stats)
+        return perf
+
+    def _iter_frames(self, symbol: str, start: str, end: str, provider: str) -> Iterator[pd.DataFrame]:
+        """按本引擎的 BarStore/分块配置产出行情块，见 iter_bar_frames。"""
+        return iter_bar_frames(
+            self.data_client, symbol, start, end, provider,
+            bar_store=self.bar_store,
+            chunk_size=self.chunk_size,
+            price_dtype=self.price_dtype,
+            volume_dtype=self.volume_dtype,
+            adjustment=self.adjustment
+        )
+
+    def _run_chunk(self, symbol: str, df: pd.DataFrame, portfolio: Portfolio) -> None:
+        """回测主循环：逐根 bar 生成信号，经风控校验后撮合。"""
+        accrue_borrow = self.cost_model is not None and self.cost_model.borrow_rate > 0
+        scheduler = self.scheduler
         for row in df.itertuples():  # 比 for idx, row in df.iterrows() 性能更快
+            # 0. 先触发不晚于本根 bar 的定时事件（无到期事件时只是一次整数比较）
+            if row.timestamp.value >= scheduler.next_ns:
+                self._fire_scheduled(symbol, row.timestamp, portfolio)
             bar = {
                 'timestamp': row.timestamp,
                 'open': row.open,
@@ -81,45 +214,54 @@ class Backtester:
                 'symbol': symbol
             }
             logger.debug("Processing bar for %s at %s: close=%.2f", symbol, row.timestamp, row.close)
-            # 3.1 生成信号
+            if accrue_borrow:
+                portfolio.accrue_borrow(row.timestamp, {symbol: row.close})
+            # 1. 生成信号
             signals = self.strategy.on_bar(bar)
 
-            # 3.2 依次处理信号：风控 + 执行
-            for sig in signals:
-                logger.info("Processing signal: %s", sig)
-                # 临时打印 signal 的类型和内容
-                print(">> signal:", sig)
-
-                # 构造 Order
-                order = Order(
-                    timestamp=sig['timestamp'],
-                    symbol=sig['symbol'],
-                    quantity=sig['quantity'],
-                    price=sig['price'],
-                    order_type=OrderType.BUY if sig['action'] == 'BUY' else OrderType.SELL,
-                    style=OrderStyle.MARKET,
-                    commission=self.commission,
-                    slippage=self.slippage
-                )
-
-                # 当前市价
-                market_price = {symbol: row.close}
-
-                # 风控校验
-                if not self.risk_manager.validate(order, market_price, portfolio):
-                    logger.info("Order blocked by risk manager: %s", order)
-                    continue
-
-                # 执行订单
-                portfolio.execute_order(order, market_prices=market_price)
-                logger.debug("Order executed: %s", order)
-
-        # 4. 计算绩效指标
-        perf = PerformanceMetrics.from_portfolio(
-            portfolio,
-            price_index=df.index
-        )
-        stats = portfolio.summary()
-        logger.info("Backtest completed for %s: stats=%s", symbol, stats)
-        print("\nstats: ", stats)
-        return perf
+            # 2. 依次处理信号：风控 + 执行
+            self._process_signals(symbol, signals, row.close, row.volume, portfolio)
+            self._last_bar = (row.close, row.volume)
+
+    def _fire_scheduled(self, symbol: str, ts: pd.Timestamp, portfolio: Portfolio) -> None:
+        """推进调度器到 ts，定时回调产生的信号按上一根 bar 的收盘价撮合（此时本根 bar 尚未到达）"""
+        self.scheduler.advance_to(ts)
+        signals = self.strategy.drain_signals()
+        if not signals:
+            return
+        if self._last_bar is None:
+            logger.warning("Dropped %d scheduled signals before the first bar", len(signals))
+            return
+        self._process_signals(symbol, signals, *self._last_bar, portfolio)
+
+    def _process_signals(self, symbol: str, signals, close: float, volume: float, portfolio: Portfolio) -> None:
+        """按给定市价逐个处理信号：风控校验后撮合"""
+        for sig in signals:
+            logger.info("Processing signal: %s", sig)
+            # 临时打印 signal 的类型和内容
+            print(">> signal:", sig)
+
+            # 构造 Order
+            order = Order(
+                timestamp=sig['timestamp'],
+                symbol=sig['symbol'],
+                quantity=sig['quantity'],
+                price=sig['price'],
+                order_type=signal_order_type(sig['action']),
+                style=OrderStyle.MARKET,
+                commission=self.commission,
+                slippage=self.slippage
+            )
+
+            # 当前市价
+            market_price = {symbol: close}
+
+            # 风控校验
+            if not self.risk_manager.validate(order, market_price, portfolio):
+                logger.info("Order blocked by risk manager: %s", order)
+                continue
+
+            # 执行订单
+            portfolio.execute_order(order, market_prices=market_price, market_volumes={symbol: volume})
+            self.risk_manager.settle(order)
+            logger.debug("Order executed: %s", order)
@@ -0,0 +1,93 @@
+import logging
+from typing import List, Optional
+
+from multi_market_qt_system.backtest.backtester import Backtester
+from multi_market_qt_system.backtest.multi_runner import MultiStrategyRunner
+from multi_market_qt_system.core.bar_store import BarStore
+from multi_market_qt_system.core.cost_model import build_cost_model
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.risk_manager import RiskManager, RiskLimits
+from multi_market_qt_system.core.shared_risk import SharedRiskManager
+from multi_market_qt_system.core.strategy_base import StrategyBase
+from multi_market_qt_system.strategies.dual_ma_strategy import DualMAStrategy, DualMAStrategyConfig
+
+logger = logging.getLogger(__name__)
+
+
+def build_strategy(conf: dict) -> DualMAStrategy:
+    """根据配置构造新的策略实例（每次调用状态独立）。"""
+    strat_cfg = DualMAStrategyConfig(**conf['strategy']['params'])
+    strat_name = conf['strategy']['name']
+    strategy = DualMAStrategy(name=strat_name, config=strat_cfg)
+    logger.debug("Strategy %s initialized with config %s", strat_name, strat_cfg)
+    return strategy
+
+
+def build_risk_manager(conf: dict) -> RiskManager:
+    """根据配置构造新的风控管理器；risk_control.shared 为 true 时构造线程安全的 SharedRiskManager。"""
+    rc_conf = conf.get('risk_control', {})
+    limits = RiskLimits(
+        max_position=rc_conf.get('max_position', 100),
+        max_drawdown=rc_conf.get('max_drawdown', 0.2),
+        max_daily_loss=rc_conf.get('max_daily_loss'),
+        max_daily_trades=rc_conf.get('max_daily_trades')
+    )
+    logger.debug("RiskManager limits from config: %s", limits)
+    if rc_conf.get('shared'):
+        return SharedRiskManager(limits, stripes=rc_conf.get('stripes', 64))
+    return RiskManager(limits)
+
+
+def build_backtester(conf: dict, data_client: Optional[DataClient] = None) -> Backtester:
+    """
+    根据配置构造带全新策略与风控实例的回测引擎。
+    :param data_client: 可复用的数据客户端，None 时新建
+    """
+    if data_client is None:
+        data_client = DataClient(conf['mode'], conf)
+    store_conf = conf.get('bar_store') or {}
+    bt = Backtester(
+        data_client=data_client,
+        strategy=build_strategy(conf),
+        risk_manager=build_risk_manager(conf),
+        initial_cash=conf.get('initial_cash', 1_000_000),
+        commission=conf.get('commission', 0.0005),
+        slippage=conf.get('slippage', 0.0002),
+        bar_store=BarStore(store_conf['dir']) if store_conf.get('dir') else None,
+        chunk_size=store_conf.get('chunk_size', 100_000),
+        price_dtype=store_conf.get('price_dtype', 'float64'),
+        volume_dtype=store_conf.get('volume_dtype', 'float64'),
+        cost_model=build_cost_model(conf),
+        adjustment=(conf.get('market_data') or {}).get('adjustment', 'raw')
+    )
+    return bt
+
+
+def build_multi_runner(
+        conf: dict,
+        strategies: List[StrategyBase],
+        shared_account: bool = False,
+        data_client: Optional[DataClient] = None
+) -> MultiStrategyRunner:
+    """
+    根据配置构造单遍多策略回测器（风控、成本模型、BarStore 与 build_backtester 一致）。
+    :param strategies: 待比较的策略实例，name 需唯一
+    """
+    if data_client is None:
+        data_client = DataClient(conf['mode'], conf)
+    store_conf = conf.get('bar_store') or {}
+    return MultiStrategyRunner(
+        data_client=data_client,
+        strategies=strategies,
+        risk_factory=lambda: build_risk_manager(conf),
+        initial_cash=conf.get('initial_cash', 1_000_000),
+        commission=conf.get('commission', 0.0005),
+        slippage=conf.get('slippage', 0.0002),
+        shared_account=shared_account,
+        bar_store=BarStore(store_conf['dir']) if store_conf.get('dir') else None,
+        chunk_size=store_conf.get('chunk_size', 100_000),
+        price_dtype=store_conf.get('price_dtype', 'float64'),
+        volume_dtype=store_conf.get('volume_dtype', 'float64'),
+        cost_model=build_cost_model(conf),
+        adjustment=(conf.get('market_data') or {}).get('adjustment', 'raw')
+    )
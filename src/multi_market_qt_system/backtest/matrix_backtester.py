@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from multi_market_qt_system.core.cost_model import CostModel, month_key
+from multi_market_qt_system.core.market_calendar import MarketCalendar, UnifiedClock
+from multi_market_qt_system.core.performance import PerformanceMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class CrossSectionalStrategy(ABC):
+    """
+    截面策略基类：一次性基于 时间×标的 价格矩阵给出调仓日的目标权重矩阵。
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        logger.info("Initialized cross-sectional strategy: %s", name)
+
+    @abstractmethod
+    def target_weights(self, prices: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """
+        :param prices: T×N 前向填充后的价格矩阵（未上市部分为 NaN）
+        :param rows: 调仓行号（升序），第 k 个调仓日只能使用 prices[:rows[k] + 1] 的信息
+        :return: K×N 目标权重矩阵，K = len(rows)；NaN 视为 0，权重和 < 1 的部分为现金
+        """
+        ...
+
+
+@dataclass
+class MatrixBacktestResult:
+    """
+    矩阵回测结果：
+    - equity: 组合净值
+    - turnover: 每个调仓日的单边换手（权重绝对变化之和）
+    - costs: 每个调仓日扣除的交易成本（金额）
+    - performance: 基于 equity 的绩效指标
+    - borrow: 每个持仓段（调仓日至下一调仓日/结束）的融券费用（金额），成本模型未设置 borrow_rate 时全为 0
+    """
+    equity: pd.Series
+    turnover: pd.Series
+    costs: pd.Series
+    performance: PerformanceMetrics
+    borrow: Optional[pd.Series] = None
+
+
+def build_price_matrix(
+        frames: Dict[str, pd.DataFrame],
+        field: str = 'close',
+        dtype: Union[str, np.dtype] = np.float64,
+        calendars: Optional[Dict[str, MarketCalendar]] = None
+) -> Tuple[pd.DatetimeIndex, List[str], np.ndarray]:
+    """
+    将多个单标的行情 DataFrame 对齐为稠密的 时间×标的 矩阵（经 UnifiedClock 合并时间线，不做 pandas 对齐）。
+    :param frames: symbol -> DataFrame（时间索引，列名大小写不敏感）
+    :param field: 取用的价格列
+    :return: (时间索引, 标的列表, T×N 矩阵，无 bar 处为 NaN)
+    """
+    clock = UnifiedClock.build(_lower_columns(frames), calendars, field=field)
+    return clock.index, clock.symbols, clock.raw_prices.astype(dtype, copy=False)
+
+
+def _lower_columns(frames: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    return {sym: df.rename(columns=lambda col: str(col).lower()) for sym, df in frames.items()}
+
+
+def ffill_matrix(values: np.ndarray) -> np.ndarray:
+    """沿时间轴前向填充 NaN（纯 NumPy，不经过 pandas reindex）。"""
+    mask = np.isnan(values)
+    if not mask.any():
+        return values
+    idx = np.where(mask, 0, np.arange(values.shape[0])[:, None])
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    filled = values[idx, np.arange(values.shape[1])]
+    # 首个有效值之前仍保持 NaN
+    first_valid = np.argmax(~mask, axis=0)
+    filled[np.arange(values.shape[0])[:, None] < first_valid] = np.nan
+    return filled
+
+
+class MatrixBacktester:
+    """
+    截面矩阵回测引擎：价格与权重均为稠密 NumPy 矩阵，调仓、换手、成本与净值全部向量化计算。
+    在调仓日收盘按目标权重调仓，之后到下一个调仓日之间持仓随价格漂移（不做隐式再平衡）。
+    """
+
+    def __init__(
+            self,
+            initial_cash: float = 1_000_000,
+            commission: float = 0.0005,
+            slippage: float = 0.0002,
+            rebalance_every: int = 1,
+            chunk_rows: int = 1024,
+            trading_days: Optional[float] = None,
+            cost_model: Optional[CostModel] = None
+    ):
+        """
+        :param rebalance_every: 每隔多少期调仓一次
+        :param chunk_rows: 分块计算时每块的行数，控制峰值内存
+        :param trading_days: 年化因子；None 时传入 UnifiedClock 则取其按市场推断的值，否则为 252
+        :param cost_model: 交易成本模型（走批量路径）；None 时按 换手 × (commission + slippage) 计费
+        """
+        if rebalance_every < 1:
+            raise ValueError("rebalance_every must be >= 1")
+        self.initial_cash = initial_cash
+        self.commission = commission
+        self.slippage = slippage
+        self.rebalance_every = rebalance_every
+        self.chunk_rows = chunk_rows
+        self.trading_days = trading_days
+        self.cost_model = cost_model
+        logger.info("MatrixBacktester initialized: initial_cash=%s, commission=%s, slippage=%s, rebalance_every=%d",
+                    initial_cash, commission, slippage, rebalance_every)
+
+    def run(
+            self,
+            prices: Union[np.ndarray, pd.DataFrame, UnifiedClock],
+            strategy: CrossSectionalStrategy,
+            index: Optional[Sequence] = None,
+            volumes: Union[np.ndarray, pd.DataFrame, None] = None
+    ) -> MatrixBacktestResult:
+        """
+        :param prices: T×N 价格矩阵、以时间为索引且标的为列的 DataFrame，或多市场统一时钟
+            （取其合并时间线与前向填充价格，年化因子按各标的日历推断；调仓日休市的标的不成交，
+            目标权重改为沿用漂移后的持仓，与事件驱动路径按 is_open 过滤一致）
+        :param strategy: 截面策略
+        :param index: prices 为 ndarray 时的时间索引
+        :param volumes: T×N 成交量矩阵，成本模型计算市场冲击时使用
+        """
+        trading_days = self.trading_days
+        open_mask = None
+        if isinstance(prices, UnifiedClock):
+            index = prices.index
+            open_mask = prices.open_mask
+            if trading_days is None:
+                trading_days = prices.periods_per_year
+            prices = prices.price_matrix()
+        elif isinstance(prices, pd.DataFrame):
+            index = prices.index if index is None else index
+            prices = prices.to_numpy(dtype=np.float64)
+        if index is None:
+            raise ValueError("index is required when prices is an ndarray")
+        index = pd.DatetimeIndex(index)
+        n_periods, n_symbols = prices.shape
+        logger.info("Matrix backtest started: strategy=%s, %d periods x %d symbols",
+                    strategy.name, n_periods, n_symbols)
+
+        prices = ffill_matrix(np.asarray(prices, dtype=np.float64))
+        rows = np.arange(0, n_periods, self.rebalance_every)
+
+        # 1. 目标权重（仅调仓日），不可交易（无价格）的标的权重强制为 0，休市标的沿用漂移后的权重
+        weights = np.asarray(strategy.target_weights(prices, rows), dtype=np.float64)
+        if weights.shape != (len(rows), n_symbols):
+            raise ValueError(f"target_weights must return shape {(len(rows), n_symbols)}, got {weights.shape}")
+        base = prices[rows]
+        tradable = ~np.isnan(base)
+        weights = np.where(tradable & ~np.isnan(weights), weights, 0.0)
+        base = np.where(tradable, base, 1.0)
+        borrow_rate = self.cost_model.borrow_rate if self.cost_model is not None else 0.0
+        stamps = index.as_unit('ns').asi8
+        closed = ~open_mask[rows] if open_mask is not None else None
+        if closed is not None and closed.any():
+            weights = self._hold_closed(weights, closed, prices[rows], base, stamps[rows], borrow_rate)
+        else:
+            closed = None
+        cash_weight = 1.0 - weights.sum(axis=1)
+
+        # 2. 每期相对所在调仓段起点的净值倍数 R_t = Σ w·P_t/P_base + 现金 - 融券费
+        # 融券费与 Portfolio.accrue_borrow 同口径（年化费率按 360 天、按自然日计息），
+        # 以调仓日的空头权重（占当时净值）在段内线性计提
+        segment = np.searchsorted(rows, np.arange(n_periods), side='right') - 1
+        short_weight = np.maximum(-weights, 0.0).sum(axis=1)
+        growth = np.empty(n_periods)
+        for start in range(0, n_periods, self.chunk_rows):
+            stop = min(start + self.chunk_rows, n_periods)
+            seg = segment[start:stop]
+            ratio = prices[start:stop] / base[seg]
+            ratio = np.where(np.isnan(ratio), 1.0, ratio)
+            growth[start:stop] = np.einsum('ij,ij->i', weights[seg], ratio) + cash_weight[seg]
+            if borrow_rate:
+                elapsed_days = (stamps[start:stop] - stamps[rows[seg]]) / 86_400e9
+                growth[start:stop] -= short_weight[seg] * borrow_rate * elapsed_days / 360.0
+        # 各段整段的融券费率（占段首净值），段末并入漂移倍数
+        segment_days = np.diff(np.append(stamps[rows], stamps[-1])) / 86_400e9
+        borrow_frac = short_weight * borrow_rate * segment_days / 360.0
+
+        # 3. 调仓日前一刻的漂移权重与换手
+        trades = np.empty_like(weights) if self.cost_model is not None else None  # 每个调仓日的权重变动
+        turnover = np.empty(len(rows))
+        turnover[0] = np.abs(weights[0]).sum()
+        if trades is not None:
+            trades[0] = weights[0]
+        carry = np.ones(len(rows))  # 上一段持仓在本调仓日的净值倍数
+        for start in range(1, len(rows), self.chunk_rows):
+            stop = min(start + self.chunk_rows, len(rows))
+            ratio = prices[rows[start:stop]] / base[start - 1:stop - 1]
+            ratio = np.where(np.isnan(ratio), 1.0, ratio)
+            held = weights[start - 1:stop - 1] * ratio
+            carry[start:stop] = held.sum(axis=1) + cash_weight[start - 1:stop - 1] - borrow_frac[start - 1:stop - 1]
+            drifted = held / carry[start:stop, None]
+            delta = weights[start:stop] - drifted
+            if closed is not None:
+                # 休市标的的权重已等于漂移权重，显式置零以免浮点残差被最低收费放大
+                delta[closed[start:stop]] = 0.0
+            turnover[start:stop] = np.abs(delta).sum(axis=1)
+            if trades is not None:
+                trades[start:stop] = delta
+
+        # 4. 成本与净值：调仓日净值 = 上一调仓日净值 × 漂移倍数 × (1 - 成本率)
+        cost_rate = turnover * (self.commission + self.slippage)
+        rebalance_equity = self.initial_cash * np.cumprod(carry * (1.0 - cost_rate))
+        equity = rebalance_equity[segment] * growth
+        pre_cost_equity = np.concatenate(([self.initial_cash], rebalance_equity[:-1])) * carry
+        if trades is not None:
+            # 成本模型按金额计费（最低收费、平方根冲击等非线性项），以线性成本下的调仓前净值估算成交量后再算一遍净值
+            cost_rate = self._model_cost_rate(trades, base, pre_cost_equity, rows, volumes, index[rows])
+            rebalance_equity = self.initial_cash * np.cumprod(carry * (1.0 - cost_rate))
+            equity = rebalance_equity[segment] * growth
+            pre_cost_equity = np.concatenate(([self.initial_cash], rebalance_equity[:-1])) * carry
+        costs = pre_cost_equity * cost_rate
+        borrow = rebalance_equity * borrow_frac
+
+        equity_series = pd.Series(equity, index=index, name=strategy.name)
+        reb_index = index[rows]
+        result = MatrixBacktestResult(
+            equity=equity_series,
+            turnover=pd.Series(turnover, index=reb_index, name='turnover'),
+            costs=pd.Series(costs, index=reb_index, name='costs'),
+            performance=PerformanceMetrics.from_equity(equity_series, trading_days=trading_days or 252),
+            borrow=pd.Series(borrow, index=reb_index, name='borrow')
+        )
+        logger.info("Matrix backtest completed: final_equity=%.2f, avg_turnover=%.4f, total_costs=%.2f, borrow=%.2f",
+                    equity[-1], turnover.mean(), costs.sum(), borrow.sum())
+        return result
+
+    @staticmethod
+    def _hold_closed(
+            weights: np.ndarray,
+            closed: np.ndarray,
+            reb_prices: np.ndarray,
+            base: np.ndarray,
+            reb_stamps: np.ndarray,
+            borrow_rate: float
+    ) -> np.ndarray:
+        """
+        调仓日休市的标的不能成交：目标权重改为上一段持仓漂移到该日的权重（首个调仓日尚无持仓，为 0）。
+        漂移权重依赖上一调仓日的最终权重，按调仓日顺序逐行修正，只处理含休市标的的行。
+        :param closed: K×N，调仓日各标的是否休市
+        :param reb_prices: K×N，调仓日的前向填充价格
+        :param reb_stamps: 调仓日的纳秒时间戳，用于计提段内融券费（与 carry 同口径）
+        """
+        weights = weights.copy()
+        weights[0, closed[0]] = 0.0
+        for k in np.flatnonzero(closed[1:].any(axis=1)) + 1:
+            prev = weights[k - 1]
+            ratio = reb_prices[k] / base[k - 1]
+            held = prev * np.where(np.isnan(ratio), 1.0, ratio)
+            days = (reb_stamps[k] - reb_stamps[k - 1]) / 86_400e9
+            carry = held.sum() + 1.0 - prev.sum() - np.maximum(-prev, 0.0).sum() * borrow_rate * days / 360.0
+            weights[k, closed[k]] = held[closed[k]] / carry
+        return weights
+
+    def _model_cost_rate(
+            self,
+            trades: np.ndarray,
+            base: np.ndarray,
+            pre_cost_equity: np.ndarray,
+            rows: np.ndarray,
+            volumes: Union[np.ndarray, pd.DataFrame, None],
+            reb_index: pd.DatetimeIndex
+    ) -> np.ndarray:
+        """
+        按成本模型的批量路径计算每个调仓日的成本率（成本 / 调仓前净值）。
+        费率按账户当月累计成交量分档时，逐调仓日累计全部标的的成交股数与成交额（跨月清零）。
+        """
+        if isinstance(volumes, pd.DataFrame):
+            volumes = volumes.to_numpy(dtype=np.float64)
+        monthly_volume = self.cost_model.uses_monthly_volume
+        months = [month_key(ts) for ts in reb_index] if monthly_volume else None
+        month, shares_mtd, notional_mtd = None, 0.0, 0.0
+        cost_rate = np.empty(len(rows))
+        for start in range(0, len(rows), self.chunk_rows):
+            stop = min(start + self.chunk_rows, len(rows))
+            delta = trades[start:stop]
+            price = base[start:stop]
+            quantity = np.abs(delta) * pre_cost_equity[start:stop, None] / price
+            volume = None
+            if volumes is not None:
+                volume = np.nan_to_num(np.asarray(volumes[rows[start:stop]], dtype=np.float64))
+            monthly = None
+            if monthly_volume:
+                row_shares = quantity.sum(axis=1)
+                row_notional = (quantity * price).sum(axis=1)
+                shares = np.empty(stop - start)
+                notional = np.empty(stop - start)
+                for i in range(stop - start):
+                    if months[start + i] != month:
+                        month, shares_mtd, notional_mtd = months[start + i], 0.0, 0.0
+                    shares_mtd += row_shares[i]
+                    notional_mtd += row_notional[i]
+                    shares[i], notional[i] = shares_mtd, notional_mtd
+                monthly = {'share': shares[:, None], 'notional': notional[:, None]}
+            cost = self.cost_model.batch_cost(np.sign(delta), price, quantity, volume, monthly)
+            cost_rate[start:stop] = cost.sum(axis=1) / pre_cost_equity[start:stop]
+        return cost_rate
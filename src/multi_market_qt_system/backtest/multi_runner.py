@@ -0,0 +1,224 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from multi_market_qt_system.backtest.backtester import iter_bar_frames, signal_order_type
+from multi_market_qt_system.core.bar_store import BarStore
+from multi_market_qt_system.core.cost_model import CostModel
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.market_calendar import MarketCalendar, calendar_for
+from multi_market_qt_system.core.order import Order, OrderStyle, OrderType
+from multi_market_qt_system.core.performance import PerformanceMetrics
+from multi_market_qt_system.core.portfolio import Portfolio
+from multi_market_qt_system.core.risk_manager import RiskManager
+from multi_market_qt_system.core.scheduler import EventScheduler
+from multi_market_qt_system.core.strategy_base import StrategyBase
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_KEY = 'account'  # 共享账户模式下账户整体绩效的键
+
+
+@dataclass
+class _Slot:
+    strategy: StrategyBase
+    risk_manager: RiskManager
+    account: Portfolio  # 风控校验与撮合所用的账户
+    portfolio: Portfolio  # 该策略自己的组合（共享模式下为只记录本策略成交的归因组合）
+
+
+class MultiStrategyRunner:
+    """
+    单遍多策略回测：行情只加载、标准化、遍历一次，每根 bar 构造一次后依次分发给 N 个策略。
+    - 独立账户模式：每个策略有自己的 Portfolio 与 RiskManager，结果等价于逐个跑 Backtester；
+    - 共享账户模式：所有策略的订单经同一个 RiskManager 校验后在同一个 Portfolio 撮合，
+      另为每个策略维护只记录其成交的归因组合（策略只能卖出自己的持仓，成交价与费用取自账户），用于计算分策略绩效。
+    注意：同一个 bar dict 会传给所有策略，策略不应修改它。
+    """
+
+    def __init__(
+            self,
+            data_client: DataClient,
+            strategies: List[StrategyBase],
+            risk_factory: Callable[[], RiskManager],
+            initial_cash: float = 1_000_000,
+            commission: float = 0.0005,
+            slippage: float = 0.0002,
+            shared_account: bool = False,
+            bar_store: Optional[BarStore] = None,
+            chunk_size: int = 100_000,
+            price_dtype: str = 'float64',
+            volume_dtype: str = 'float64',
+            calendar: Optional[MarketCalendar] = None,
+            cost_model: Optional[CostModel] = None,
+            adjustment: str = 'raw'
+    ):
+        """
+        :param strategies: 策略实例列表，name 需唯一（作为结果的键）
+        :param risk_factory: 构造风控实例的工厂；独立模式下每个策略调用一次，共享模式下只调用一次
+        :param shared_account: 是否所有策略共用一个账户
+        其余参数与 Backtester 相同。
+        """
+        names = [s.name for s in strategies]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Strategy names must be unique: {names}")
+        if shared_account and ACCOUNT_KEY in names:
+            raise ValueError(f"Strategy name '{ACCOUNT_KEY}' is reserved in shared account mode")
+        self.data_client = data_client
+        self.strategies = strategies
+        self.risk_factory = risk_factory
+        self.initial_cash = initial_cash
+        self.commission = commission
+        self.slippage = slippage
+        self.shared_account = shared_account
+        self.bar_store = bar_store
+        self.chunk_size = chunk_size
+        self.price_dtype = price_dtype
+        self.volume_dtype = volume_dtype
+        self.calendar = calendar
+        self.cost_model = cost_model
+        self.adjustment = adjustment
+        self.portfolios: Dict[str, Portfolio] = {}  # 最近一次 run 的组合，键同结果
+        self.scheduler: Optional[EventScheduler] = None  # 所有策略共用的定时事件调度器（一个堆）
+        self._last_bar: Optional[tuple] = None
+        logger.info("MultiStrategyRunner initialized with %d strategies, shared_account=%s",
+                    len(strategies), shared_account)
+
+    def _make_slots(self) -> List[_Slot]:
+        if not self.shared_account:
+            slots = []
+            for strategy in self.strategies:
+                portfolio = Portfolio(cash=self.initial_cash, cost_model=self.cost_model)
+                slots.append(_Slot(strategy, self.risk_factory(), portfolio, portfolio))
+            return slots
+        account = Portfolio(cash=self.initial_cash, cost_model=self.cost_model)
+        risk_manager = self.risk_factory()
+        return [_Slot(strategy, risk_manager, account, Portfolio(cash=self.initial_cash, cost_model=self.cost_model))
+                for strategy in self.strategies]
+
+    def run(
+            self,
+            symbol: str,
+            start: str,
+            end: str,
+            interval: str = '1d',
+            provider: str = 'yfinance'
+    ) -> Dict[str, PerformanceMetrics]:
+        """
+        :return: 策略名 -> 绩效；共享账户模式下另含 ACCOUNT_KEY -> 账户整体绩效
+        """
+        logger.info("Multi-strategy run started for %s [%s - %s], %d strategies",
+                    symbol, start, end, len(self.strategies))
+        slots = self._make_slots()
+        self.scheduler = EventScheduler()
+        self._last_bar = None
+        for slot in slots:
+            slot.strategy.schedule_events(self.scheduler)
+        portfolios = {slot.strategy.name: slot.portfolio for slot in slots}
+        if self.shared_account:
+            portfolios[ACCOUNT_KEY] = slots[0].account
+        index_parts = []
+
+        frames = iter_bar_frames(
+            self.data_client, symbol, start, end, provider,
+            bar_store=self.bar_store,
+            chunk_size=self.chunk_size,
+            price_dtype=self.price_dtype,
+            volume_dtype=self.volume_dtype,
+            adjustment=self.adjustment
+        )
+        for chunk in frames:
+            if chunk.empty:
+                continue
+            if not index_parts:
+                first_price = float(chunk['close'].iloc[0])
+                for portfolio in portfolios.values():
+                    portfolio._log_state(chunk.index[0], {symbol: first_price})
+            index_parts.append(chunk.index)
+            self._run_chunk(symbol, chunk, slots)
+
+        if not index_parts:
+            raise ValueError(f"No historical data for {symbol} [{start} - {end}]")
+        price_index = index_parts[0].append(index_parts[1:]) if len(index_parts) > 1 else index_parts[0]
+        self.portfolios = portfolios
+
+        trading_days = (self.calendar or calendar_for(symbol)).periods_per_year(price_index)
+        results = {
+            name: PerformanceMetrics.from_portfolio(portfolio, price_index=price_index, trading_days=trading_days)
+            for name, portfolio in portfolios.items()
+        }
+        logger.info("Multi-strategy run completed for %s: %s", symbol,
+                    {name: round(perf.total_return, 4) for name, perf in results.items()})
+        return results
+
+    def _run_chunk(self, symbol: str, df: pd.DataFrame, slots: List[_Slot]) -> None:
+        """每根 bar 只构造一次 bar / 市价 / 成交量 dict，依次分发给各策略。"""
+        accrue_borrow = self.cost_model is not None and self.cost_model.borrow_rate > 0
+        shared = self.shared_account
+        accounts = [slots[0].account] if shared else []
+        scheduler = self.scheduler
+        columns = (df.index, df['open'].to_numpy(), df['high'].to_numpy(), df['low'].to_numpy(),
+                   df['close'].to_numpy(), df['volume'].to_numpy())
+        for ts, open_, high, low, close, volume in zip(*columns):
+            # 先触发不晚于本根 bar 的定时事件，信号按上一根 bar 的价格撮合
+            if ts.value >= scheduler.next_ns:
+                scheduler.advance_to(ts)
+                for slot in slots:
+                    signals = slot.strategy.drain_signals()
+                    if signals and self._last_bar is None:
+                        logger.warning("Dropped %d scheduled signals from %s before the first bar",
+                                       len(signals), slot.strategy.name)
+                    elif signals:
+                        self._submit(slot, signals, *self._last_bar)
+            bar = {
+                'timestamp': ts,
+                'open': open_,
+                'high': high,
+                'low': low,
+                'close': close,
+                'volume': volume,
+                'symbol': symbol
+            }
+            market_price = {symbol: close}
+            market_volume = {symbol: volume}
+            if accrue_borrow:
+                for account in accounts:
+                    account.accrue_borrow(ts, market_price)
+                for slot in slots:
+                    slot.portfolio.accrue_borrow(ts, market_price)
+
+            for slot in slots:
+                self._submit(slot, slot.strategy.on_bar(bar), market_price, market_volume)
+            self._last_bar = (market_price, market_volume)
+
+    def _submit(self, slot: _Slot, signals: List[dict], market_price: Dict[str, float],
+                market_volume: Dict[str, float]) -> None:
+        """把一个策略的信号转为订单，经风控校验后在其账户撮合"""
+        shared = self.shared_account
+        for sig in signals:
+            order = Order(
+                timestamp=sig['timestamp'],
+                symbol=sig['symbol'],
+                quantity=sig['quantity'],
+                price=sig['price'],
+                order_type=signal_order_type(sig['action']),
+                style=OrderStyle.MARKET,
+                commission=self.commission,
+                slippage=self.slippage
+            )
+            # 共享模式：只能平本策略自己持有的多头，不能卖出其他策略的持仓
+            if shared and order.order_type == OrderType.SELL \
+                    and slot.portfolio.get_position(order.symbol) < order.quantity:
+                logger.info("Order from %s exceeds its own position: %s", slot.strategy.name, order)
+                continue
+            if not slot.risk_manager.validate(order, market_price, slot.account):
+                logger.info("Order from %s blocked by risk manager: %s", slot.strategy.name, order)
+                continue
+            fill = slot.account.execute_order(order, market_prices=market_price, market_volumes=market_volume)
+            slot.risk_manager.settle(order)
+            # 共享模式：账户实际成交后，按账户的成交价与费用原样记入该策略的归因组合
+            if shared and fill is not None:
+                slot.portfolio.book_fill(order.timestamp, order.symbol, order.order_type.name, order.quantity,
+                                         *fill, market_prices=market_price)
@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from multi_market_qt_system.backtest.factory import build_backtester
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.strategy_base import StrategyBase
+
+logger = logging.getLogger(__name__)
+
+
+# —— 参数空间 —— #
+@dataclass(frozen=True)
+class IntParam:
+    low: int
+    high: int
+    step: int = 1
+
+    def from_unit(self, u: float) -> int:
+        n = (self.high - self.low) // self.step
+        return self.low + self.step * int(min(round(u * n), n))
+
+    def to_unit(self, value: int) -> float:
+        n = (self.high - self.low) // self.step
+        return (value - self.low) / self.step / n if n else 0.5
+
+
+@dataclass(frozen=True)
+class FloatParam:
+    low: float
+    high: float
+    log: bool = False
+
+    def from_unit(self, u: float) -> float:
+        if self.log:
+            return float(math.exp(math.log(self.low) + u * (math.log(self.high) - math.log(self.low))))
+        return float(self.low + u * (self.high - self.low))
+
+    def to_unit(self, value: float) -> float:
+        if self.log:
+            return (math.log(value) - math.log(self.low)) / (math.log(self.high) - math.log(self.low))
+        return (value - self.low) / (self.high - self.low)
+
+
+@dataclass(frozen=True)
+class ChoiceParam:
+    options: Tuple[Any, ...]
+
+
+Param = Union[IntParam, FloatParam, ChoiceParam]
+
+
+def param_space_from_conf(space_conf: Dict[str, Any]) -> Dict[str, Param]:
+    """
+    由配置构造参数空间：
+    - [low, high] 两个整数 -> IntParam，两个浮点数 -> FloatParam
+    - {low, high, step} / {low, high, log} -> IntParam / FloatParam
+    - {choices: [...]} -> ChoiceParam
+    """
+    space: Dict[str, Param] = {}
+    for name, spec in space_conf.items():
+        if isinstance(spec, dict) and 'choices' in spec:
+            space[name] = ChoiceParam(tuple(spec['choices']))
+        elif isinstance(spec, dict):
+            if isinstance(spec['low'], int) and isinstance(spec['high'], int) and not spec.get('log'):
+                space[name] = IntParam(spec['low'], spec['high'], spec.get('step', 1))
+            else:
+                space[name] = FloatParam(float(spec['low']), float(spec['high']), spec.get('log', False))
+        elif all(isinstance(v, int) for v in spec):
+            space[name] = IntParam(spec[0], spec[1])
+        else:
+            space[name] = FloatParam(float(spec[0]), float(spec[1]))
+    return space
+
+
+# —— 评估（在工作进程中执行） —— #
+_worker_ctx: Dict[str, Any] = {}
+
+
+def _init_worker(conf: dict, symbol: str, bars: pd.DataFrame, strategy_cls: Type[StrategyBase],
+                 config_cls: type, metric: str) -> None:
+    _worker_ctx.update(
+        conf=conf, symbol=symbol, bars=bars, strategy_cls=strategy_cls, config_cls=config_cls, metric=metric,
+        data_client=DataClient(conf.get('mode', 'backtest'), conf)
+    )
+
+
+def _evaluate(params: Dict[str, Any], fraction: float) -> float:
+    """在前 fraction 比例的历史上回测一组参数；非法参数或回测失败返回 -inf。"""
+    ctx = _worker_ctx
+    bars = ctx['bars']
+    n_rows = max(int(round(len(bars) * fraction)), 2)
+    try:
+        strategy = ctx['strategy_cls'](ctx['conf']['strategy']['name'], ctx['config_cls'](**params))
+        bt = build_backtester(ctx['conf'], data_client=ctx['data_client'])
+        bt.strategy = strategy
+        perf = bt.run_frames(ctx['symbol'], [bars.iloc[:n_rows]])
+        score = float(getattr(perf, ctx['metric']))
+    except Exception as e:
+        logger.debug("Trial %s invalid: %r", params, e)
+        return float('-inf')
+    return score if math.isfinite(score) else float('-inf')
+
+
+@dataclass
+class Trial:
+    params: Dict[str, Any]
+    fraction: float  # 使用的历史比例（保真度）
+    score: float
+    stage: str  # 'halving' / 'tpe'
+
+
+@dataclass
+class OptimizationResult:
+    best_params: Dict[str, Any]
+    best_score: float
+    trials: List[Trial] = field(repr=False)
+    n_backtests: int  # 实际回测次数（不同保真度各算一次）
+    budget: float  # 折合完整历史回测次数（各次回测的 fraction 之和）
+
+    def table(self) -> pd.DataFrame:
+        """全部试验明细，按保真度与得分降序"""
+        df = pd.DataFrame([{**t.params, 'fraction': t.fraction, 'score': t.score, 'stage': t.stage}
+                           for t in self.trials])
+        return df.sort_values(['fraction', 'score'], ascending=False) if not df.empty else df
+
+
+def _key(params: Dict[str, Any]) -> Tuple:
+    return tuple(sorted(params.items()))
+
+
+class HalvingTPEOptimizer:
+    """
+    策略参数寻优：
+    1. 逐次减半（successive halving）：随机采样 n_initial 组参数，在前 min_fraction 的历史上回测，
+       只保留得分最高的 1/eta 进入下一档（历史长度 ×eta），直到完整历史；
+    2. TPE：剩余预算按 Tree-structured Parzen Estimator 提议参数（好/坏两组观测的核密度比最大者），
+       在完整历史上回测；被淘汰的参数计入“坏”组，早期剪枝的信息不浪费。
+    同一批次的回测在进程池中并行执行；非法参数（如 short_window >= long_window）得分为 -inf。
+    """
+
+    def __init__(
+            self,
+            conf: dict,
+            strategy_cls: Type[StrategyBase],
+            config_cls: type,
+            space: Dict[str, Param],
+            metric: str = 'sharpe_ratio',
+            n_initial: int = 27,
+            eta: int = 3,
+            min_fraction: float = 1 / 9,
+            n_tpe: int = 20,
+            gamma: float = 0.25,
+            n_candidates: int = 64,
+            workers: Optional[int] = None,
+            seed: Optional[int] = None
+    ):
+        """
+        :param conf: YAML 配置 dict（风控、成本等与普通回测一致）
+        :param strategy_cls: 策略类，构造签名为 (name, config)
+        :param config_cls: 策略参数 dataclass，如 DualMAStrategyConfig
+        :param space: 参数名 -> IntParam / FloatParam / ChoiceParam，未列出的参数取 config_cls 默认值
+        :param metric: 最大化的 PerformanceMetrics 字段
+        :param n_initial: 逐次减半的初始候选数
+        :param eta: 每档保留 1/eta，历史长度扩大 eta 倍
+        :param min_fraction: 第一档使用的历史比例
+        :param n_tpe: TPE 阶段在完整历史上的试验数
+        :param gamma: TPE 中“好”观测的比例
+        :param n_candidates: TPE 每次提议时从“好”密度中抽样的候选数
+        :param workers: 并行进程数，默认 CPU 核数；1 表示在当前进程执行
+        """
+        self.conf = conf
+        self.strategy_cls = strategy_cls
+        self.config_cls = config_cls
+        self.space = space
+        self.metric = metric
+        self.n_initial = n_initial
+        self.eta = eta
+        self.min_fraction = min_fraction
+        self.n_tpe = n_tpe
+        self.gamma = gamma
+        self.n_candidates = n_candidates
+        self.workers = workers or os.cpu_count() or 1
+        self.rng = np.random.default_rng(seed)
+        self.names = list(space)
+
+    def fractions(self) -> List[float]:
+        """逐次减半各档的历史比例：eta 的负整数次幂，最低一档取最接近 min_fraction 的一档，最后一档为 1"""
+        n = max(0, int(round(math.log(1 / self.min_fraction) / math.log(self.eta))))
+        return [float(self.eta) ** (i - n) for i in range(n + 1)]
+
+    # —— 单位超立方体与参数之间的映射 —— #
+    def _decode(self, u: np.ndarray) -> Dict[str, Any]:
+        params = {}
+        for name, x in zip(self.names, u):
+            p = self.space[name]
+            if isinstance(p, ChoiceParam):
+                params[name] = p.options[min(int(x * len(p.options)), len(p.options) - 1)]
+            else:
+                params[name] = p.from_unit(float(x))
+        return params
+
+    def _encode(self, params: Dict[str, Any]) -> np.ndarray:
+        u = np.empty(len(self.names))
+        for i, name in enumerate(self.names):
+            p = self.space[name]
+            if isinstance(p, ChoiceParam):
+                u[i] = (p.options.index(params[name]) + 0.5) / len(p.options)
+            else:
+                u[i] = p.to_unit(params[name])
+        return u
+
+    def _sample_random(self, n: int, seen: set) -> List[Dict[str, Any]]:
+        out = []
+        for _ in range(n * 20):
+            params = self._decode(self.rng.random(len(self.names)))
+            if _key(params) not in seen:
+                seen.add(_key(params))
+                out.append(params)
+                if len(out) == n:
+                    break
+        return out
+
+    def _log_density(self, x: np.ndarray, obs: np.ndarray) -> np.ndarray:
+        """
+        各维独立的 Parzen 核密度（高斯核，带宽按 Scott 规则，混入 1 个均匀先验分量），返回 log 密度之和。
+        :param x: M×D 候选（单位超立方体）
+        :param obs: K×D 观测
+        """
+        k = len(obs)
+        bw = np.clip(np.std(obs, axis=0) * k ** (-1 / (len(self.names) + 4)), 0.05, 0.5) if k > 1 \
+            else np.full(x.shape[1], 0.25)
+        z = (x[:, None, :] - obs[None, :, :]) / bw  # M×K×D
+        kern = np.exp(-0.5 * z ** 2) / (bw * math.sqrt(2 * math.pi))
+        dens = (kern.sum(axis=1) + 1.0) / (k + 1)  # 均匀先验在 [0,1] 上密度为 1
+        return np.log(dens).sum(axis=1)
+
+    def _propose(self, good: np.ndarray, bad: np.ndarray, n: int, seen: set) -> List[Dict[str, Any]]:
+        if len(good) == 0:
+            return self._sample_random(n, seen)
+        # 从“好”密度中抽样候选：随机选一个好观测加高斯扰动
+        idx = self.rng.integers(0, len(good), self.n_candidates)
+        bw = np.clip(np.std(good, axis=0), 0.05, 0.5) if len(good) > 1 else np.full(good.shape[1], 0.25)
+        cand = np.clip(good[idx] + self.rng.normal(0, 1, (self.n_candidates, good.shape[1])) * bw, 0.0, 1.0)
+        ratio = self._log_density(cand, good) - self._log_density(cand, bad if len(bad) else good[:0])
+        out = []
+        for i in np.argsort(-ratio):
+            params = self._decode(cand[i])
+            if _key(params) not in seen:
+                seen.add(_key(params))
+                out.append(params)
+                if len(out) == n:
+                    break
+        if len(out) < n:
+            out += self._sample_random(n - len(out), seen)
+        return out
+
+    def optimize(self, symbol: str, bars: pd.DataFrame) -> OptimizationResult:
+        """
+        :param symbol: 标的代码
+        :param bars: 标准化后的完整历史 K 线（normalize_bars 的输出）
+        """
+        trials: List[Trial] = []
+        cache: Dict[Tuple, float] = {}
+        args = (self.conf, symbol, bars, self.strategy_cls, self.config_cls, self.metric)
+        executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=args) \
+            if self.workers > 1 else None
+        if executor is None:
+            _init_worker(*args)
+
+        def evaluate(batch: List[Dict[str, Any]], fraction: float, stage: str) -> List[float]:
+            todo = [p for p in batch if (_key(p), fraction) not in cache]
+            if executor is not None:
+                scores = list(executor.map(_evaluate, todo, [fraction] * len(todo)))
+            else:
+                scores = [_evaluate(p, fraction) for p in todo]
+            for p, s in zip(todo, scores):
+                cache[(_key(p), fraction)] = s
+                trials.append(Trial(p, fraction, s, stage))
+            return [cache[(_key(p), fraction)] for p in batch]
+
+        try:
+            # 1. 逐次减半
+            seen: set = set()
+            survivors = self._sample_random(self.n_initial, seen)
+            pruned: List[Dict[str, Any]] = []
+            fractions = self.fractions()
+            for rung, fraction in enumerate(fractions):
+                scores = evaluate(survivors, fraction, 'halving')
+                logger.info("Halving rung %d: %d candidates on %.0f%% of history, best %s=%.4f",
+                            rung, len(survivors), fraction * 100, self.metric, max(scores, default=float('nan')))
+                if rung == len(fractions) - 1:
+                    break
+                order = np.argsort(scores)[::-1]
+                keep = max(1, len(survivors) // self.eta)
+                kept = [i for i in order[:keep] if math.isfinite(scores[i])] or [order[0]]
+                pruned += [survivors[i] for i in order if i not in kept]
+                survivors = [survivors[i] for i in kept]
+
+            # 2. TPE 在完整历史上继续搜索
+            remaining = self.n_tpe
+            while remaining > 0:
+                full = [t for t in trials if t.fraction == 1.0 and math.isfinite(t.score)]
+                full.sort(key=lambda t: t.score, reverse=True)
+                n_good = max(1, int(math.ceil(self.gamma * len(full))))
+                good = np.array([self._encode(t.params) for t in full[:n_good]]).reshape(-1, len(self.names))
+                bad_params = [t.params for t in full[n_good:]] + pruned
+                bad = np.array([self._encode(p) for p in bad_params]).reshape(-1, len(self.names))
+                batch = self._propose(good, bad, min(self.workers, remaining), seen)
+                if not batch:
+                    break
+                evaluate(batch, 1.0, 'tpe')
+                remaining -= len(batch)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        full = [t for t in trials if t.fraction == 1.0]
+        best = max(full, key=lambda t: t.score)
+        result = OptimizationResult(
+            best_params=best.params,
+            best_score=best.score,
+            trials=trials,
+            n_backtests=len(trials),
+            budget=sum(t.fraction for t in trials)
+        )
+        logger.info("Optimization done: best %s=%.4f with %s, %d backtests (%.1f full-history equivalents)",
+                    self.metric, best.score, best.params, result.n_backtests, result.budget)
+        return result
+
+
+def grid_points(space: Dict[str, Param], per_axis: int = 10) -> List[Dict[str, Any]]:
+    """参数空间的规则网格（用于与全网格搜索对照）"""
+    axes = []
+    for name, p in space.items():
+        if isinstance(p, ChoiceParam):
+            axes.append(list(p.options))
+        else:
+            values = [p.from_unit(u) for u in np.linspace(0, 1, per_axis)]
+            axes.append(list(dict.fromkeys(values)))
+    return [dict(zip(space, combo)) for combo in itertools.product(*axes)]
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from multi_market_qt_system.backtest.factory import build_backtester
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.market_calendar import configure_calendars
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_FIELDS = ('total_return', 'annual_return', 'annual_volatility', 'sharpe_ratio',
+                  'max_drawdown', 'sortino_ratio', 'calmar_ratio')
+
+# 随任务一起序列化的配置段：结果只取决于提交方的配置，不受各 worker 本机配置影响
+TASK_CONF_KEYS = ('strategy', 'risk_control', 'initial_cash', 'commission', 'slippage', 'cost_model',
+                  'market_data')
+
+# 工作进程内复用的数据客户端（由进程池 initializer 创建）及其行情配置
+_worker_data_client: Optional[DataClient] = None
+_worker_market_data: Optional[dict] = None
+
+
+def _init_worker(conf: dict) -> None:
+    global _worker_data_client, _worker_market_data
+    configure_calendars(conf)
+    _worker_data_client = DataClient(conf['mode'], conf)
+    _worker_market_data = conf.get('market_data')
+
+
+def task_conf(conf: dict) -> Dict[str, Any]:
+    """抽取随队列任务提交的配置段（需可 JSON 序列化）"""
+    return {key: conf[key] for key in TASK_CONF_KEYS if key in conf}
+
+
+def run_symbol(conf: dict, symbol: str, start: str, end: str, provider: str) -> Dict[str, Any]:
+    """
+    在当前进程中回测单个标的，返回可序列化的汇总 dict（不回传净值序列，降低进程间传输量）。
+    每次调用都会构造独立的策略与风控实例，标的之间不共享状态。
+    """
+    # 任务的行情配置与本进程初始化时不同（复权方式、缓存目录等）时不复用数据客户端
+    reuse = _worker_data_client if conf.get('market_data') == _worker_market_data else None
+    bt = build_backtester(conf, data_client=reuse)
+    result: Dict[str, Any] = {'symbol': symbol, 'worker': f"{socket.gethostname()}:{os.getpid()}"}
+    try:
+        perf = bt.run(symbol=symbol, start=start, end=end, provider=provider)
+    except Exception as e:
+        logger.exception("Backtest failed for %s: %s", symbol, e)
+        result['error'] = repr(e)
+        return result
+    result.update({name: float(getattr(perf, name)) for name in SUMMARY_FIELDS})
+    result['total_trades'] = len(bt.portfolio.trades)
+    result['rejected_orders'] = len(bt.portfolio.rejected)
+    return result
+
+
+def summary_table(results: Iterable[Dict[str, Any]]) -> pd.DataFrame:
+    """把各标的汇总 dict 聚合成以 symbol 为索引、按 Sharpe 降序的表。"""
+    df = pd.DataFrame(list(results))
+    if df.empty:
+        return df
+    df = df.set_index('symbol')
+    if 'sharpe_ratio' in df:
+        df = df.sort_values('sharpe_ratio', ascending=False)
+    return df
+
+
+class ShardedBacktestRunner:
+    """
+    分片并行回测：把标的列表分发到进程池，每个工作进程复用自己的 DataClient（读本地缓存），
+    每个标的使用独立的策略与风控实例，完成一个即回传一个。
+    """
+
+    def __init__(self, conf: dict, workers: Optional[int] = None):
+        """
+        :param conf: YAML 配置 dict（需可 pickle）
+        :param workers: 进程数，默认 CPU 核数
+        """
+        self.conf = conf
+        self.workers = workers or os.cpu_count() or 1
+        logger.info("ShardedBacktestRunner initialized with %d workers", self.workers)
+
+    def run(self, symbols: List[str], start: str, end: str, provider: str) -> Iterator[Dict[str, Any]]:
+        """
+        :return: 按完成顺序产出的各标的汇总 dict
+        """
+        logger.info("Sharded backtest started: %d symbols over %d workers", len(symbols), self.workers)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.conf,)) as pool:
+            futures = [pool.submit(run_symbol, self.conf, sym, start, end, provider) for sym in symbols]
+            for done, fut in enumerate(as_completed(futures), 1):
+                result = fut.result()
+                logger.info("Sharded backtest progress %d/%d: %s", done, len(symbols), result['symbol'])
+                yield result
+
+
+class FileWorkQueue:
+    """
+    基于共享目录的简易工作队列，可跨多台机器使用（目录需位于共享文件系统上）：
+    pending/ 中的任务通过原子 rename 被某个 worker 认领到 running/，结果写入 done/。
+    认领即租约：worker 定期 heartbeat（更新 running/ 文件的 mtime），超过 lease_seconds 未续约的任务
+    视为 worker 已崩溃，由 claim/gather 移回 pending/ 重新分配（各机器时钟需大致同步）。
+    """
+
+    def __init__(self, directory: str, lease_seconds: float = 300.0):
+        """
+        :param lease_seconds: 租约时长（秒），worker 的 heartbeat 间隔应明显短于它
+        """
+        self.root = Path(directory)
+        self.lease_seconds = lease_seconds
+        self.pending = self.root / 'pending'
+        self.running = self.root / 'running'
+        self.done = self.root / 'done'
+        for d in (self.pending, self.running, self.done):
+            d.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _atomic_write(path: Path, payload: Dict[str, Any]) -> None:
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(payload), encoding='utf-8')
+        os.replace(tmp, path)
+
+    def enqueue(self, task: Dict[str, Any]) -> str:
+        """提交任务，返回任务 id。"""
+        task_id = uuid.uuid4().hex
+        self._atomic_write(self.pending / f"{task_id}.json", {'id': task_id, **task})
+        return task_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """认领一个待处理任务（先回收过期租约），队列为空时返回 None。"""
+        self.requeue_stale()
+        for path in sorted(self.pending.glob('*.json')):
+            target = self.running / path.name
+            try:
+                os.rename(path, target)
+                os.utime(target)  # rename 不更新 mtime，认领时刻即租约起点
+            except FileNotFoundError:
+                continue  # 已被其他 worker 认领
+            return json.loads(target.read_text(encoding='utf-8'))
+        return None
+
+    def heartbeat(self, task_ids: Iterable[str]) -> None:
+        """为正在执行的任务续约；已被回收或完成的任务忽略。"""
+        for task_id in task_ids:
+            try:
+                os.utime(self.running / f"{task_id}.json")
+            except FileNotFoundError:
+                pass
+
+    def requeue_stale(self) -> int:
+        """
+        把租约过期的 running/ 任务移回 pending/。
+        :return: 回收的任务数
+        """
+        deadline = time.time() - self.lease_seconds
+        requeued = 0
+        for path in self.running.glob('*.json'):
+            try:
+                if path.stat().st_mtime >= deadline or (self.done / path.name).exists():
+                    continue
+                os.rename(path, self.pending / path.name)
+            except FileNotFoundError:
+                continue  # 刚完成或已被其他进程回收
+            requeued += 1
+            logger.warning("Requeued stale task %s (lease expired)", path.stem)
+        return requeued
+
+    def complete(self, task_id: str, result: Dict[str, Any]) -> None:
+        """写入任务结果并移出 running（租约过期后被重新排队的副本一并移除）。"""
+        self._atomic_write(self.done / f"{task_id}.json", result)
+        (self.running / f"{task_id}.json").unlink(missing_ok=True)
+        (self.pending / f"{task_id}.json").unlink(missing_ok=True)
+
+    def gather(
+            self,
+            task_ids: Iterable[str],
+            poll_interval: float = 1.0,
+            timeout: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """按完成顺序产出指定任务的结果（等待期间回收过期租约），超时抛出 TimeoutError。"""
+        remaining = set(task_ids)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while remaining:
+            for task_id in list(remaining):
+                path = self.done / f"{task_id}.json"
+                if path.exists():
+                    remaining.discard(task_id)
+                    yield json.loads(path.read_text(encoding='utf-8'))
+            if remaining:
+                self.requeue_stale()
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"{len(remaining)} tasks not completed")
+                time.sleep(poll_interval)
+
+
+def serve_queue(
+        conf: dict,
+        queue_dir: str,
+        workers: Optional[int] = None,
+        poll_interval: float = 1.0,
+        exit_when_empty: bool = False,
+        lease_seconds: float = 300.0
+) -> int:
+    """
+    worker 主循环：持续从 FileWorkQueue 认领回测任务并用本机进程池执行。
+    任务自带的配置段（见 TASK_CONF_KEYS）覆盖本机配置；执行期间每 lease_seconds/3 续约一次。
+    :param exit_when_empty: 队列空且本机任务全部完成后退出
+    :param lease_seconds: 租约时长，需与提交方一致
+    :return: 本机完成的任务数
+    """
+    queue = FileWorkQueue(queue_dir, lease_seconds=lease_seconds)
+    heartbeat_interval = lease_seconds / 3
+    workers = workers or os.cpu_count() or 1
+    completed = 0
+    logger.info("Queue worker started: dir=%s, workers=%d", queue_dir, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(conf,)) as pool:
+        inflight = {}
+        while True:
+            # 只认领与空闲进程数相当的任务，其余留给其他机器
+            while len(inflight) < workers:
+                task = queue.claim()
+                if task is None:
+                    break
+                fut = pool.submit(run_symbol, {**conf, **task.get('conf', {})},
+                                  task['symbol'], task['start'], task['end'], task['provider'])
+                inflight[fut] = task['id']
+            if not inflight:
+                if exit_when_empty:
+                    break
+                time.sleep(poll_interval)
+                continue
+            finished, _ = wait(inflight, timeout=heartbeat_interval, return_when=FIRST_COMPLETED)
+            queue.heartbeat(inflight.values())
+            for fut in finished:
+                queue.complete(inflight.pop(fut), fut.result())
+                completed += 1
+    logger.info("Queue worker finished: %d tasks completed", completed)
+    return completed
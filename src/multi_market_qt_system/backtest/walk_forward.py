@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Type
+
+import pandas as pd
+
+from multi_market_qt_system.backtest.factory import build_backtester
+from multi_market_qt_system.backtest.optimizer import HalvingTPEOptimizer, IntParam, Param
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.market_calendar import calendar_for
+from multi_market_qt_system.core.performance import PerformanceMetrics
+from multi_market_qt_system.core.strategy_base import StrategyBase
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Fold:
+    """一个滚动窗口：样本内 [train_start, train_end)，样本外 [test_start, test_end)，均为行号"""
+    index: int
+    train_start: int
+    train_end: int
+    test_start: int
+    test_end: int
+
+
+def build_folds(n_rows: int, train_size: int, test_size: int, step: Optional[int] = None,
+                anchored: bool = False) -> List[Fold]:
+    """
+    生成滚动（或锚定起点的扩张）窗口，样本外窗口首尾相接、互不重叠。
+    :param n_rows: 总行数
+    :param train_size: 样本内行数（锚定模式下为首个窗口的行数）
+    :param test_size: 样本外行数（最后一个窗口可能更短）
+    :param step: 窗口前移行数，默认等于 test_size
+    :param anchored: True 时样本内起点固定为 0
+    """
+    step = step or test_size
+    folds = []
+    test_start = train_size
+    while test_start < n_rows:
+        train_start = 0 if anchored else test_start - train_size
+        folds.append(Fold(len(folds), train_start, test_start, test_start, min(test_start + test_size, n_rows)))
+        test_start += step
+    return folds
+
+
+@dataclass
+class FoldResult:
+    fold: Fold
+    best_params: Dict[str, Any]
+    in_sample_score: float
+    oos_equity: pd.Series
+    oos_performance: PerformanceMetrics
+
+
+@dataclass
+class WalkForwardResult:
+    folds: List[FoldResult]
+    equity: pd.Series  # 拼接后的样本外净值
+    performance: PerformanceMetrics
+
+    def table(self) -> pd.DataFrame:
+        """各窗口的最优参数、样本内得分与样本外表现"""
+        return pd.DataFrame([{
+            'fold': r.fold.index,
+            'test_start': r.oos_equity.index[0],
+            'test_end': r.oos_equity.index[-1],
+            **r.best_params,
+            'in_sample_score': r.in_sample_score,
+            'oos_return': r.oos_performance.total_return,
+            'oos_sharpe': r.oos_performance.sharpe_ratio,
+        } for r in self.folds]).set_index('fold')
+
+
+def warm_up(strategy: StrategyBase, symbol: str, bars: pd.DataFrame) -> None:
+    """用样本外窗口之前的 bar 推进策略状态（信号丢弃），使指标在窗口起点已就绪"""
+    for row in bars.itertuples():
+        strategy.on_bar({
+            'timestamp': row.timestamp,
+            'open': row.open,
+            'high': row.high,
+            'low': row.low,
+            'close': row.close,
+            'volume': row.volume,
+            'symbol': symbol
+        })
+
+
+# —— 工作进程 —— #
+_worker_ctx: Dict[str, Any] = {}
+
+
+def _init_worker(conf: dict, symbol: str, bars: pd.DataFrame, strategy_cls: Type[StrategyBase],
+                 config_cls: type) -> None:
+    # 完整行情每个进程只传一次，各窗口用 iloc 位置切片（写时复制下为零拷贝视图）
+    _worker_ctx.update(conf=conf, symbol=symbol, bars=bars, strategy_cls=strategy_cls, config_cls=config_cls,
+                       data_client=DataClient(conf.get('mode', 'backtest'), conf))
+
+
+def _run_fold(fold: Fold, space: Dict[str, Param], optimizer_kwargs: Dict[str, Any],
+              warmup: Optional[int]) -> FoldResult:
+    ctx = _worker_ctx
+    conf, symbol, bars = ctx['conf'], ctx['symbol'], ctx['bars']
+
+    # 1. 样本内寻优（窗口之间已并行，窗口内串行）
+    optimizer = HalvingTPEOptimizer(conf, ctx['strategy_cls'], ctx['config_cls'], space, workers=1,
+                                    **optimizer_kwargs)
+    opt = optimizer.optimize(symbol, bars.iloc[fold.train_start:fold.train_end])
+
+    # 2. 预热：默认取最优参数中最大的整型参数（通常是最长回看窗口）
+    strategy = ctx['strategy_cls'](conf['strategy']['name'], ctx['config_cls'](**opt.best_params))
+    if warmup is None:
+        warmup = max([v for k, v in opt.best_params.items() if isinstance(space.get(k), IntParam)], default=0)
+    warm_start = max(fold.test_start - warmup, 0)
+    warm_up(strategy, symbol, bars.iloc[warm_start:fold.test_start])
+
+    # 3. 样本外回测
+    bt = build_backtester(conf, data_client=ctx['data_client'])
+    bt.strategy = strategy
+    perf = bt.run_frames(symbol, [bars.iloc[fold.test_start:fold.test_end]])
+    logger.info("Fold %d: params=%s, in-sample %.4f, OOS return %.2f%%", fold.index, opt.best_params,
+                opt.best_score, perf.total_return * 100)
+    return FoldResult(fold, opt.best_params, opt.best_score, perf.equity_curve, perf)
+
+
+def stitch_equity(curves: List[pd.Series], initial: float) -> pd.Series:
+    """按收益率拼接各样本外净值曲线，使每段从上一段的期末净值继续复利"""
+    returns = pd.concat([c.pct_change(fill_method=None).dropna() for c in curves])
+    start = pd.Series([initial], index=[curves[0].index[0]])
+    return pd.concat([start, initial * (1 + returns).cumprod()])
+
+
+class WalkForwardAnalyzer:
+    """
+    滚动样本外检验：在每个样本内窗口上用 HalvingTPEOptimizer 寻优，用最优参数回测紧随其后的样本外窗口
+    （跨窗口边界预热策略状态），最后把各样本外净值拼接为一条曲线并计算绩效。
+    各窗口在进程池中并行执行。
+    """
+
+    def __init__(
+            self,
+            conf: dict,
+            strategy_cls: Type[StrategyBase],
+            config_cls: type,
+            space: Dict[str, Param],
+            train_size: int,
+            test_size: int,
+            step: Optional[int] = None,
+            anchored: bool = False,
+            warmup: Optional[int] = None,
+            workers: Optional[int] = None,
+            **optimizer_kwargs
+    ):
+        """
+        :param train_size: 样本内行数
+        :param test_size: 样本外行数
+        :param step: 窗口前移行数，默认 test_size
+        :param anchored: 是否锚定样本内起点（扩张窗口）
+        :param warmup: 样本外起点前用于预热的行数，None 时取最优参数中最大的整型参数
+        :param workers: 并行进程数，默认 CPU 核数
+        :param optimizer_kwargs: 透传给 HalvingTPEOptimizer（metric、n_initial、n_tpe、seed 等）
+        """
+        self.conf = conf
+        self.strategy_cls = strategy_cls
+        self.config_cls = config_cls
+        self.space = space
+        self.train_size = train_size
+        self.test_size = test_size
+        self.step = step
+        self.anchored = anchored
+        self.warmup = warmup
+        self.workers = workers or os.cpu_count() or 1
+        self.optimizer_kwargs = optimizer_kwargs
+
+    def run(self, symbol: str, bars: pd.DataFrame) -> WalkForwardResult:
+        """
+        :param bars: 标准化后的完整历史 K 线
+        """
+        folds = build_folds(len(bars), self.train_size, self.test_size, self.step, self.anchored)
+        if not folds:
+            raise ValueError(f"Not enough bars ({len(bars)}) for train_size={self.train_size}")
+        logger.info("Walk-forward for %s: %d folds, train=%d, test=%d, anchored=%s, workers=%d",
+                    symbol, len(folds), self.train_size, self.test_size, self.anchored, self.workers)
+        args = (self.conf, symbol, bars, self.strategy_cls, self.config_cls)
+        fold_args = (self.space, self.optimizer_kwargs, self.warmup)
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(min(self.workers, len(folds)), initializer=_init_worker, initargs=args) as ex:
+                futures = [ex.submit(_run_fold, fold, *fold_args) for fold in folds]
+                results = [f.result() for f in as_completed(futures)]
+        else:
+            _init_worker(*args)
+            results = [_run_fold(fold, *fold_args) for fold in folds]
+        results.sort(key=lambda r: r.fold.index)
+
+        equity = stitch_equity([r.oos_equity for r in results], self.conf.get('initial_cash', 1_000_000))
+        trading_days = calendar_for(symbol).periods_per_year(bars.index)
+        perf = PerformanceMetrics.from_equity(equity, trading_days=trading_days)
+        logger.info("Walk-forward done for %s: OOS total_return=%.2f%%, sharpe=%.2f", symbol,
+                    perf.total_return * 100, perf.sharpe_ratio)
+        return WalkForwardResult(results, equity, perf)
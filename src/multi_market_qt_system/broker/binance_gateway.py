@@ -1,5 +1,6 @@
 class BinanceGateway:
     def __init__(self, conf):
         pass
-    def send_order(self, symbol, action, price, qty):
+    def send_order(self, order, client_order_id=None):
+        # 按 order.symbol / order.order_type / order.price / order.quantity 下单，client_order_id 即 newClientOrderId
         pass
\ No newline at end of file
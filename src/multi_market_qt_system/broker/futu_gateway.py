@@ -2,5 +2,6 @@ class FutuGateway:
     def __init__(self, conf):
         # 初始化 OpenD
         pass
-    def send_order(self, symbol, action, price, qty):
+    def send_order(self, order, client_order_id=None):
+        # 按 order.symbol / order.order_type / order.price / order.quantity 下单，client_order_id 作为订单备注
         pass
\ No newline at end of file
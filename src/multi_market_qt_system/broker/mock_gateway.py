@@ -0,0 +1,96 @@
+import logging
+import random
+from typing import Callable, Dict, List, Optional
+
+from multi_market_qt_system.core.cost_model import order_side
+from multi_market_qt_system.core.order import Order
+from multi_market_qt_system.execution.order_state import AccountSnapshot, ExecutionReport, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+
+class MockBroker:
+    """
+    本地模拟券商：接受订单、随机部分成交/撤单并推送累计回报，可按比例丢弃回报以模拟断线，
+    提供紧凑账户快照用于对账。用于在没有真实网关时测试订单状态缓存与对账吞吐。
+    """
+
+    def __init__(self, drop_rate: float = 0.0, seed: Optional[int] = None):
+        """
+        :param drop_rate: 回报丢失概率（丢失的回报只能靠对账补回）
+        :param seed: 随机种子
+        """
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        # client_order_id -> [symbol, side, quantity, price, status, filled_qty]
+        self.orders: Dict[str, list] = {}
+        self.open_ids: List[str] = []
+        self.positions: Dict[str, float] = {}
+        self._callbacks: List[Callable[[ExecutionReport], None]] = []
+        self._ids = 0
+        self.reports_sent = 0
+        self.reports_dropped = 0
+
+    def subscribe_reports(self, callback: Callable[[ExecutionReport], None]) -> None:
+        self._callbacks.append(callback)
+
+    def _emit(self, coid: str) -> None:
+        symbol, side, quantity, price, status, filled = self.orders[coid]
+        if self.drop_rate and self.rng.random() < self.drop_rate:
+            self.reports_dropped += 1
+            return
+        report = ExecutionReport(coid, status, filled, price if filled else 0.0)
+        self.reports_sent += 1
+        for callback in self._callbacks:
+            callback(report)
+
+    def send_order(self, order: Order, client_order_id: str = None) -> str:
+        """接受订单并回报 NEW，返回客户端订单号"""
+        if client_order_id is None:
+            self._ids += 1
+            client_order_id = f"mock-{self._ids}"
+        self.orders[client_order_id] = [order.symbol, order_side(order.order_type), order.quantity, order.price,
+                                        OrderStatus.NEW, 0.0]
+        self.open_ids.append(client_order_id)
+        self._emit(client_order_id)
+        return client_order_id
+
+    def step(self, n_events: int = 1, fill_ratio: float = 0.8) -> int:
+        """
+        随机处理 n_events 个在途订单事件：按 fill_ratio 概率部分/全部成交，否则撤单。
+        :return: 实际处理的事件数
+        """
+        done = 0
+        rng = self.rng
+        for _ in range(n_events):
+            if not self.open_ids:
+                break
+            i = rng.randrange(len(self.open_ids))
+            coid = self.open_ids[i]
+            rec = self.orders[coid]
+            symbol, side, quantity, _, _, filled = rec
+            if rng.random() < fill_ratio:
+                fill = quantity - filled if rng.random() < 0.5 else max(1, (quantity - filled) // 2)
+                rec[5] = filled + fill
+                self.positions[symbol] = self.positions.get(symbol, 0.0) + fill * side
+                rec[4] = OrderStatus.FILLED if rec[5] >= quantity else OrderStatus.PARTIALLY_FILLED
+            else:
+                rec[4] = OrderStatus.CANCELLED
+            if rec[4] in (OrderStatus.FILLED, OrderStatus.CANCELLED):
+                # 交换删除，O(1)
+                self.open_ids[i] = self.open_ids[-1]
+                self.open_ids.pop()
+            self._emit(coid)
+            done += 1
+        return done
+
+    def positions_nonzero(self) -> Dict[str, float]:
+        return {s: q for s, q in self.positions.items() if q}
+
+    def snapshot(self) -> AccountSnapshot:
+        """紧凑快照：在途订单 (状态, 累计成交, 均价) 与净持仓"""
+        orders = {}
+        for coid in self.open_ids:
+            _, _, _, price, status, filled = self.orders[coid]
+            orders[coid] = (status, filled, price if filled else 0.0)
+        return AccountSnapshot(orders, self.positions_nonzero())
@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+BAR_COLUMNS = PRICE_COLUMNS + ('volume',)
+ACTION_COLUMNS = ('split_ratio', 'dividend')
+ADJUSTMENTS = ('raw', 'split', 'total_return')
+
+
+def normalize_bars(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    把数据源返回的 K 线统一为：小写列名、DatetimeIndex 名为 timestamp、按时间升序且去重。
+    """
+    df = df.rename(columns=lambda col: str(col).lower())
+    if 'timestamp' not in df.columns:
+        if 'date' in df.columns:
+            df = df.rename(columns={'date': 'timestamp'})
+        else:
+            df = df.reset_index()
+            df = df.rename(columns={df.columns[0]: 'timestamp'})
+    index = pd.DatetimeIndex(df['timestamp'], name='timestamp')
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    df = df.set_index(index).assign(timestamp=index)
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    return df
+
+
+def normalize_actions(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """
+    把公司行为统一为：DatetimeIndex 名为 ex_date（除权除息日，无时区），列 split_ratio（每股拆为几股，默认 1）
+    与 dividend（每股现金分红，与未复权价格同一单位，默认 0）；同日多条合并。
+    """
+    if df is None or df.empty:
+        return pd.DataFrame({col: pd.Series(dtype=np.float64) for col in ACTION_COLUMNS},
+                            index=pd.DatetimeIndex([], name='ex_date'))
+    index = pd.DatetimeIndex(df.index, name='ex_date')
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    out = pd.DataFrame({
+        'split_ratio': df['split_ratio'].to_numpy(dtype=np.float64) if 'split_ratio' in df else 1.0,
+        'dividend': df['dividend'].to_numpy(dtype=np.float64) if 'dividend' in df else 0.0,
+    }, index=index.normalize())
+    out['split_ratio'] = out['split_ratio'].fillna(1.0)
+    out['dividend'] = out['dividend'].fillna(0.0)
+    return out.groupby(level=0).agg({'split_ratio': 'prod', 'dividend': 'sum'})
+
+
+def adjustment_factors(ts_ns: np.ndarray, close: np.ndarray, actions: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    由公司行为计算逐行累计后复权因子（以最后一根 bar 为基准，不复权到数据末尾之后的事件）。
+    除权日之前的各行：拆股因子乘 1/split_ratio，分红因子乘 (1 - dividend / 除权前一行的未复权收盘价)。
+    :param ts_ns: 升序时间戳（int64 纳秒）
+    :param close: 未复权收盘价
+    :return: (split_factor, dividend_factor)，与 ts_ns 等长
+    """
+    n = len(ts_ns)
+    split_mult = np.ones(n + 1)
+    div_mult = np.ones(n + 1)
+    if n and len(actions):
+        ex_ns = actions.index.as_unit('ns').asi8
+        pos = np.searchsorted(ts_ns, ex_ns, side='left')
+        # 除权日在首行之前（无可调整的行）或末行之后（尚未发生）的事件忽略
+        keep = (pos > 0) & (ex_ns <= ts_ns[-1])
+        pos = pos[keep]
+        ratio = actions['split_ratio'].to_numpy()[keep]
+        dividend = actions['dividend'].to_numpy()[keep]
+        np.multiply.at(split_mult, pos, np.where(ratio > 0, 1.0 / ratio, 1.0))
+        prev_close = np.asarray(close, dtype=np.float64)[pos - 1]
+        valid = (dividend > 0) & (dividend < prev_close)
+        if (dividend[~valid] > 0).any():
+            logger.warning("Ignored %d dividends not below the previous close", int((dividend[~valid] > 0).sum()))
+        np.multiply.at(div_mult, pos[valid], 1.0 - dividend[valid] / prev_close[valid])
+    # 第 i 行的因子 = 所有除权位置 > i 的乘数之积（反向累乘）
+    split_factor = np.cumprod(split_mult[::-1])[::-1][1:]
+    dividend_factor = np.cumprod(div_mult[::-1])[::-1][1:]
+    return split_factor, dividend_factor
+
+
+def _adjust(prices: dict, volume: np.ndarray, split_factor: np.ndarray, dividend_factor: np.ndarray,
+            adjustment: str) -> Tuple[dict, np.ndarray]:
+    if adjustment == 'raw':
+        return prices, volume
+    price_factor = split_factor if adjustment == 'split' else split_factor * dividend_factor
+    return ({col: values * price_factor for col, values in prices.items()},
+            volume / split_factor)
+
+
+def apply_adjustment(df: pd.DataFrame, actions: pd.DataFrame, adjustment: str) -> pd.DataFrame:
+    """
+    对内存中已标准化的 K 线做复权（不使用 BarStore 时的等价路径）。
+    :param adjustment: 'raw' / 'split' / 'total_return'
+    """
+    if adjustment not in ADJUSTMENTS:
+        raise ValueError(f"Unknown adjustment mode: {adjustment}")
+    if adjustment == 'raw' or df.empty:
+        return df
+    split_factor, dividend_factor = adjustment_factors(df.index.as_unit('ns').asi8, df['close'].to_numpy(),
+                                                       normalize_actions(actions))
+    prices, volume = _adjust({col: df[col].to_numpy(dtype=np.float64) for col in PRICE_COLUMNS},
+                             df['volume'].to_numpy(dtype=np.float64), split_factor, dividend_factor, adjustment)
+    return df.assign(**prices, volume=volume)
+
+
+def _half_open(start, end) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """闭区间 [start, end] 转为左闭右开；end 为日期时包含当日全部 bar（与 BarStore.row_range 一致）"""
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    return start, end + (pd.Timedelta(days=1) if end == end.normalize() else pd.Timedelta(1, 'ns'))
+
+
+def _closed_end(end_exclusive: pd.Timestamp) -> str:
+    """左闭右开区间的右端转回闭区间的 end 字符串（日期边界时为前一天）"""
+    if end_exclusive == end_exclusive.normalize():
+        return (end_exclusive - pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    return (end_exclusive - pd.Timedelta(1, 'ns')).isoformat()
+
+
+def _merge_intervals(intervals: List[Tuple[pd.Timestamp, pd.Timestamp]]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """合并重叠或首尾相接的左闭右开区间"""
+    merged = []
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+class BarStore:
+    """
+    本地列式 K 线仓库：每个标的一个目录，每列一个 .npy 文件（timestamp 为 int64 纳秒）。
+    入库时完成一次标准化；读取时按内存映射切片分块产出，峰值内存只与块大小相关。
+    需要本地复权时只存未复权价格（meta 中 unadjusted 标记）；公司行为（拆股、分红）与逐行累计复权因子另存为列，
+    读取时按 adjustment 对块做一次向量乘法，切换复权方式无需重新拉取。
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        logger.info("BarStore initialized at %s", self.root)
+
+    def _dir(self, symbol: str) -> Path:
+        return self.root / symbol
+
+    def _meta(self, symbol: str) -> Optional[dict]:
+        path = self._dir(symbol) / 'meta.json'
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding='utf-8'))
+
+    def has(self, symbol: str) -> bool:
+        return self._meta(symbol) is not None
+
+    def is_unadjusted(self, symbol: str) -> bool:
+        """已入库的 K 线是否为显式请求的未复权价格（否则为数据源默认口径，不能再做本地复权）"""
+        meta = self._meta(symbol)
+        return bool(meta and meta.get('unadjusted'))
+
+    def has_actions(self, symbol: str) -> bool:
+        """是否已拉取过该标的的公司行为（可能为空，即从未拆股/分红）"""
+        meta = self._meta(symbol)
+        return bool(meta and meta.get('actions'))
+
+    def actions(self, symbol: str) -> pd.DataFrame:
+        """已入库的公司行为（normalize_actions 格式）"""
+        path = self._dir(symbol) / 'actions.npy'
+        if not path.exists():
+            return normalize_actions(None)
+        arr = np.load(path)
+        return pd.DataFrame({col: arr[col] for col in ACTION_COLUMNS},
+                            index=pd.DatetimeIndex(arr['ex_ns'].view('datetime64[ns]'), name='ex_date'))
+
+    @staticmethod
+    def _write_actions(directory: Path, actions: pd.DataFrame, ts_ns: np.ndarray, close: np.ndarray) -> None:
+        arr = np.empty(len(actions), dtype=[('ex_ns', '<i8'), ('split_ratio', '<f8'), ('dividend', '<f8')])
+        arr['ex_ns'] = actions.index.as_unit('ns').asi8
+        arr['split_ratio'] = actions['split_ratio'].to_numpy()
+        arr['dividend'] = actions['dividend'].to_numpy()
+        split_factor, dividend_factor = adjustment_factors(ts_ns, close, actions)
+        # 每个文件先写临时名再原子替换，正在读的内存映射仍指向旧文件
+        for name, values in (('actions', arr), ('split_factor', split_factor), ('dividend_factor', dividend_factor)):
+            tmp = directory / f'.{name}.{os.getpid()}.tmp.npy'
+            np.save(tmp, values)
+            os.replace(tmp, directory / f'{name}.npy')
+
+    def set_actions(self, symbol: str, actions: pd.DataFrame) -> None:
+        """
+        写入（与已有记录按除权日合并）公司行为并重算复权因子，不改动 K 线列。
+        :param actions: 任意来源的公司行为，列 split_ratio / dividend，索引为除权日
+        """
+        if not self.has(symbol):
+            raise KeyError(f"No bars stored for {symbol}")
+        merged = self._merge_actions(symbol, actions)
+        ts = np.asarray(self._open(symbol, 'timestamp'))
+        self._write_actions(self._dir(symbol), merged, ts, np.asarray(self._open(symbol, 'close')))
+        meta_path = self._dir(symbol) / 'meta.json'
+        meta = self._meta(symbol)
+        meta['actions'] = True
+        tmp = meta_path.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp, meta_path)
+        logger.info("Stored %d corporate actions for %s", len(merged), symbol)
+
+    def _merge_actions(self, symbol: str, actions: Optional[pd.DataFrame]) -> pd.DataFrame:
+        existing = self.actions(symbol)
+        if actions is None:
+            return existing
+        merged = pd.concat([existing, normalize_actions(actions)])
+        return merged[~merged.index.duplicated(keep='last')].sort_index()
+
+    @staticmethod
+    def _coverage(meta: Optional[dict]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """已拉取过的区间（左闭右开、互不相交）；兼容旧版只记录一个 [start, end] 的 meta"""
+        if meta is None:
+            return []
+        coverage = meta['coverage']
+        if coverage and isinstance(coverage[0], str):
+            return [_half_open(*coverage)]
+        return [(pd.Timestamp(lo), pd.Timestamp(hi)) for lo, hi in coverage]
+
+    def missing(self, symbol: str, start: str, end: str) -> List[Tuple[str, str]]:
+        """
+        [start, end] 中尚未拉取过的子区间（闭区间，可直接作为 get_historical 的起止日期）。
+        已拉取区间按多段分别记录，两段之间的空档不会被当作已覆盖。
+        """
+        lo, hi = _half_open(start, end)
+        gaps = []
+        cursor = lo
+        for cov_lo, cov_hi in self._coverage(self._meta(symbol)):
+            if cov_hi <= cursor or cov_lo >= hi:
+                continue
+            if cov_lo > cursor:
+                gaps.append((cursor, cov_lo))
+            cursor = max(cursor, cov_hi)
+        if cursor < hi:
+            gaps.append((cursor, hi))
+        return [(gap_lo.strftime('%Y-%m-%d') if gap_lo == gap_lo.normalize() else gap_lo.isoformat(),
+                 _closed_end(gap_hi)) for gap_lo, gap_hi in gaps]
+
+    def covers(self, symbol: str, start: str, end: str) -> bool:
+        """仓库中该标的的已拉取区间是否完整覆盖 [start, end]。"""
+        return not self.missing(symbol, start, end)
+
+    def ingest(self, symbol: str, df: pd.DataFrame, start: str = None, end: str = None,
+               actions: Optional[pd.DataFrame] = None, unadjusted: bool = False, replace: bool = False) -> int:
+        """
+        标准化并写入（与已有数据按时间合并去重），同时按全部 K 线重算复权因子。
+        :param df: K 线
+        :param start: 本次拉取的请求起点，用于记录覆盖区间，默认取数据首行
+        :param end: 本次拉取的请求终点，默认取数据末行
+        :param actions: 随本次拉取得到的公司行为，None 时沿用已入库的记录
+        :param unadjusted: df 是否为显式请求的未复权价格；与已入库口径不同时不能合并
+        :param replace: True 时丢弃已入库的 K 线与覆盖区间（如把默认口径整段换成未复权价格）
+        :return: 入库后的总行数（df 为空时不写入，返回已有行数）
+        """
+        df = normalize_bars(df)
+        meta = None if replace else self._meta(symbol)
+        if df.empty:
+            logger.warning("No bars to ingest for %s [%s - %s]", symbol, start, end)
+            return meta['rows'] if meta is not None else 0
+        start = start or str(df.index[0])
+        end = end or str(df.index[-1])
+        if meta is not None and bool(meta.get('unadjusted')) != unadjusted:
+            raise ValueError(f"Cannot merge {'unadjusted' if unadjusted else 'provider-adjusted'} bars into the "
+                             f"stored bars of {symbol}; ingest with replace=True")
+        merged_actions = self._merge_actions(symbol, actions) if meta is not None else normalize_actions(actions)
+        if meta is not None:
+            existing = self.read(symbol)
+            df = pd.concat([existing, df[list(BAR_COLUMNS)]])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+        coverage = _merge_intervals(self._coverage(meta) + [_half_open(start, end)])
+
+        # 先写到临时目录，再整体替换，避免读者看到半更新的列
+        target = self._dir(symbol)
+        tmp = self.root / f".{symbol}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        ts_ns = df.index.as_unit('ns').asi8
+        np.save(tmp / 'timestamp.npy', ts_ns)
+        for col in BAR_COLUMNS:
+            np.save(tmp / f'{col}.npy', df[col].to_numpy(dtype=np.float64))
+        self._write_actions(tmp, merged_actions, ts_ns, df['close'].to_numpy(dtype=np.float64))
+        (tmp / 'meta.json').write_text(json.dumps({
+            'rows': len(df),
+            'coverage': [[lo.isoformat(), hi.isoformat()] for lo, hi in coverage],
+            'actions': actions is not None or bool(meta and meta.get('actions')),
+            'unadjusted': unadjusted,
+        }), encoding='utf-8')
+        if target.exists():
+            old = self.root / f".{symbol}.{os.getpid()}.old"
+            os.replace(target, old)
+            os.replace(tmp, target)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, target)
+        logger.info("Ingested %d bars for %s into %s", len(df), symbol, target)
+        return len(df)
+
+    def _open(self, symbol: str, column: str) -> np.ndarray:
+        return np.load(self._dir(symbol) / f'{column}.npy', mmap_mode='r')
+
+    def row_range(self, symbol: str, start: str = None, end: str = None) -> Tuple[int, int]:
+        """[start, end] 对应的行号区间（左闭右开），end 日期包含当日全部 bar。"""
+        ts = self._open(symbol, 'timestamp')
+        lo = 0 if start is None else int(np.searchsorted(ts, pd.Timestamp(start).value, side='left'))
+        if end is None:
+            hi = len(ts)
+        else:
+            end_ts = pd.Timestamp(end)
+            if end_ts == end_ts.normalize():
+                end_ts += pd.Timedelta(days=1)
+                hi = int(np.searchsorted(ts, end_ts.value, side='left'))
+            else:
+                hi = int(np.searchsorted(ts, end_ts.value, side='right'))
+        return lo, hi
+
+    def iter_chunks(
+            self,
+            symbol: str,
+            start: str = None,
+            end: str = None,
+            chunk_size: int = 100_000,
+            price_dtype: Union[str, np.dtype] = np.float64,
+            volume_dtype: Union[str, np.dtype] = np.float64,
+            adjustment: str = 'raw'
+    ) -> Iterator[pd.DataFrame]:
+        """
+        分块产出标准化后的 K 线，每块只从内存映射中复制 chunk_size 行。
+        :param price_dtype: 价格列类型，如 'float32'
+        :param volume_dtype: 成交量列类型，如 'int32'（注意量级溢出）
+        :param adjustment: 'raw' 不复权 / 'split' 拆股复权 / 'total_return' 拆股与分红复权（全收益）
+        """
+        if adjustment not in ADJUSTMENTS:
+            raise ValueError(f"Unknown adjustment mode: {adjustment}")
+        lo, hi = self.row_range(symbol, start, end)
+        ts = self._open(symbol, 'timestamp')
+        cols = {col: self._open(symbol, col) for col in BAR_COLUMNS}
+        if adjustment != 'raw':
+            split_factor = self._open(symbol, 'split_factor')
+            dividend_factor = self._open(symbol, 'dividend_factor')
+        logger.debug("Streaming %d bars for %s in chunks of %d (%s)", hi - lo, symbol, chunk_size, adjustment)
+        for i in range(lo, hi, chunk_size):
+            j = min(i + chunk_size, hi)
+            index = pd.DatetimeIndex(np.asarray(ts[i:j]).view('datetime64[ns]'), name='timestamp')
+            prices = {col: cols[col][i:j] for col in PRICE_COLUMNS}
+            volume = cols['volume'][i:j]
+            if adjustment != 'raw':
+                prices, volume = _adjust(prices, volume, split_factor[i:j], dividend_factor[i:j], adjustment)
+            data = {'timestamp': index}
+            for col in PRICE_COLUMNS:
+                data[col] = np.asarray(prices[col], dtype=price_dtype)
+            data['volume'] = np.asarray(volume, dtype=volume_dtype)
+            yield pd.DataFrame(data, index=index)
+
+    def read(self, symbol: str, start: str = None, end: str = None, **kwargs) -> pd.DataFrame:
+        """一次性读取区间内全部 K 线（内部仍按块拼接）。"""
+        chunks = list(self.iter_chunks(symbol, start, end, **kwargs))
+        if not chunks:
+            return pd.DataFrame(columns=('timestamp',) + BAR_COLUMNS)
+        return pd.concat(chunks)
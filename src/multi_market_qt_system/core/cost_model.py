@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import copy
+import logging
+import math
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+
+from multi_market_qt_system.core.order import Order, OrderStyle, OrderType
+
+logger = logging.getLogger(__name__)
+
+BUY_SIDE = (OrderType.BUY, OrderType.COVER)
+
+
+def order_side(order_type: OrderType) -> int:
+    """买方向 (BUY/COVER) 为 +1，卖方向 (SELL/SHORT) 为 -1"""
+    return 1 if order_type in BUY_SIDE else -1
+
+
+def month_key(timestamp: Any) -> int:
+    """自然月编号（年 × 12 + 月），用于按月累计成交量"""
+    return timestamp.year * 12 + timestamp.month
+
+
+class CostModel(ABC):
+    """
+    交易成本模型：滑点与平方根市场冲击由基类统一处理，子类只实现佣金/规费。
+    每个模型同时提供单笔 O(1) 路径（Portfolio 撮合用）和数组批量路径（矩阵回测用）。
+    """
+
+    def __init__(
+            self,
+            slippage: float = 0.0,
+            impact_coef: float = 0.0,
+            volatility: float = 0.02,
+            borrow_rate: float = 0.0
+    ):
+        """
+        :param slippage: 固定滑点率
+        :param impact_coef: 平方根冲击系数 k，冲击 = k × volatility × sqrt(成交量 / bar 成交量)
+        :param volatility: 冲击公式中的单期波动率
+        :param borrow_rate: 融券年化费率（按 360 天计息），作用于空头市值
+        """
+        self.slippage = slippage
+        self.impact_coef = impact_coef
+        self.volatility = volatility
+        self.borrow_rate = borrow_rate
+
+    # —— 单笔路径 —— #
+    def fill_price(self, order_type: OrderType, price: float, quantity: float, volume: Optional[float] = None) -> float:
+        shift = self.slippage
+        if self.impact_coef and volume:
+            shift += self.impact_coef * self.volatility * math.sqrt(quantity / volume)
+        return price * (1 + shift * order_side(order_type))
+
+    @abstractmethod
+    def commission(self, order: Order, fill_price: float) -> float:
+        """单笔订单的佣金与规费合计"""
+        ...
+
+    @property
+    def uses_monthly_volume(self) -> bool:
+        """费率是否按账户当月累计成交量分档（批量路径需要调用方提供 monthly）"""
+        return False
+
+    def on_fill(self, order: Order, fill_price: float) -> None:
+        """订单成交后由 Portfolio 调用，按月累计成交量的模型在此记账；被拒订单不计入"""
+        pass
+
+    def for_account(self) -> CostModel:
+        """返回供单个账户使用的实例：无状态模型直接共享自身，有账户级累计状态的模型返回一份清零的副本"""
+        return self
+
+    def order_cost(self, order: Order, price: float, volume: Optional[float] = None) -> Tuple[float, float]:
+        """
+        :param price: 撮合基准价
+        :param volume: 当前 bar 成交量，用于市场冲击
+        :return: (成交价, 费用)
+        """
+        fill = self.fill_price(order.order_type, price, order.quantity, volume)
+        return fill, self.commission(order, fill)
+
+    # —— 批量路径 —— #
+    def batch_fill_price(
+            self,
+            side: np.ndarray,
+            price: np.ndarray,
+            quantity: np.ndarray,
+            volume: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        shift = np.full(np.shape(price), self.slippage, dtype=np.float64)
+        if self.impact_coef and volume is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio = np.where(volume > 0, np.abs(quantity) / volume, 0.0)
+            shift = shift + self.impact_coef * self.volatility * np.sqrt(ratio)
+        return price * (1 + shift * side)
+
+    @abstractmethod
+    def batch_commission(self, side: np.ndarray, fill_price: np.ndarray, quantity: np.ndarray,
+                         monthly: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        """逐元素计算佣金与规费，quantity 为 0 的元素费用为 0"""
+        ...
+
+    def batch_cost(
+            self,
+            side: np.ndarray,
+            price: np.ndarray,
+            quantity: np.ndarray,
+            volume: Optional[np.ndarray] = None,
+            monthly: Optional[Dict[str, np.ndarray]] = None
+    ) -> np.ndarray:
+        """
+        逐元素总成本（金额）= 滑点/冲击损失 + 佣金规费。
+        :param side: +1 买 / -1 卖
+        :param quantity: 成交数量（非负）
+        :param monthly: 账户当月累计（含本次）成交量 {'share': 股数, 'notional': 成交额}，数组可广播到 quantity，
+            按月分档的费率使用；None 时只按本次成交量取档
+        """
+        fill = self.batch_fill_price(side, price, quantity, volume)
+        return np.abs(fill - price) * quantity + self.batch_commission(side, fill, quantity, monthly)
+
+    def borrow_cost(self, short_notional: float, days: float) -> float:
+        """持有空头 days 天的融券费用"""
+        return short_notional * self.borrow_rate * days / 360.0
+
+
+class FlatCostModel(CostModel):
+    """固定费率：费用 = 成交额 × commission（与原 Order.commission 口径一致）"""
+
+    def __init__(self, commission: float = 0.0005, **kwargs):
+        super().__init__(**kwargs)
+        self.commission_rate = commission
+
+    def commission(self, order: Order, fill_price: float) -> float:
+        return fill_price * order.quantity * self.commission_rate
+
+    def batch_commission(self, side, fill_price, quantity, monthly=None):
+        return fill_price * quantity * self.commission_rate
+
+
+@dataclass
+class FeeComponent:
+    """
+    单项收费规则：
+    - basis: 'share' 按股数 / 'notional' 按成交额 / 'order' 按笔
+    - rate: 费率（每股金额 / 成交额比例 / 每笔金额）
+    - tiers: 阶梯费率 [(规模上限, 费率), ...]，规模口径与 basis 相同（'order' 按股数），超出最后一档沿用末档
+    - tier_by: 'order' 按单笔规模取档 / 'monthly' 按账户当月累计规模（含本笔）取档，如富途美股平台费按月累计股数
+    - min_fee / max_fee: 单笔下限 / 上限（金额）
+    - max_rate: 单笔上限占成交额比例
+    - side: 'both' / 'buy' / 'sell'，如印花税双边、SEC 费仅卖出
+    """
+    basis: Literal['share', 'notional', 'order']
+    rate: float = 0.0
+    tiers: Optional[Sequence[Tuple[float, float]]] = None
+    min_fee: float = 0.0
+    max_fee: Optional[float] = None
+    max_rate: Optional[float] = None
+    side: Literal['both', 'buy', 'sell'] = 'both'
+    tier_by: Literal['order', 'monthly'] = 'order'
+
+    def __post_init__(self):
+        if self.tiers:
+            self._bounds = np.array([b for b, _ in self.tiers], dtype=np.float64)
+            self._rates = np.array([r for _, r in self.tiers], dtype=np.float64)
+
+    def _rate_for(self, size: float) -> float:
+        if not self.tiers:
+            return self.rate
+        i = int(np.searchsorted(self._bounds, size, side='left'))
+        return float(self._rates[min(i, len(self._rates) - 1)])
+
+    def _monthly_size(self, monthly: Dict[str, Any]) -> Any:
+        return monthly['notional' if self.basis == 'notional' else 'share']
+
+    def fee(self, side: int, price: float, quantity: float, monthly: Optional[Dict[str, float]] = None) -> float:
+        """:param monthly: 账户当月累计（含本笔）成交量，tier_by='monthly' 时用于取档"""
+        if quantity <= 0 or (self.side == 'buy' and side < 0) or (self.side == 'sell' and side > 0):
+            return 0.0
+        notional = price * quantity
+        size = notional if self.basis == 'notional' else quantity
+        tier_size = self._monthly_size(monthly) if self.tier_by == 'monthly' and monthly is not None else size
+        rate = self._rate_for(tier_size)
+        fee = rate if self.basis == 'order' else rate * size
+        fee = max(fee, self.min_fee)
+        if self.max_fee is not None:
+            fee = min(fee, self.max_fee)
+        if self.max_rate is not None:
+            fee = min(fee, notional * self.max_rate)
+        return fee
+
+    def batch_fee(self, side: np.ndarray, price: np.ndarray, quantity: np.ndarray,
+                  monthly: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+        notional = price * quantity
+        size = notional if self.basis == 'notional' else quantity
+        if self.tiers:
+            tier_size = size
+            if self.tier_by == 'monthly' and monthly is not None:
+                tier_size = np.broadcast_to(self._monthly_size(monthly), np.shape(size))
+            idx = np.minimum(np.searchsorted(self._bounds, tier_size, side='left'), len(self._rates) - 1)
+            rate = self._rates[idx]
+        else:
+            rate = self.rate
+        fee = np.broadcast_to(rate, np.shape(size)).astype(np.float64) if self.basis == 'order' else rate * size
+        fee = np.maximum(fee, self.min_fee)
+        if self.max_fee is not None:
+            fee = np.minimum(fee, self.max_fee)
+        if self.max_rate is not None:
+            fee = np.minimum(fee, notional * self.max_rate)
+        active = quantity > 0
+        if self.side == 'buy':
+            active &= side > 0
+        elif self.side == 'sell':
+            active &= side < 0
+        return np.where(active, fee, 0.0)
+
+
+class FeeScheduleCostModel(CostModel):
+    """
+    由多项收费规则叠加的费用表（券商佣金 + 平台费 + 交易所/监管规费）。
+    含按月分档的规则时，单笔路径自行累计账户当月成交股数与成交额（on_fill 记账，跨月清零）；
+    累计状态属于账户，Portfolio 通过 for_account 各持一份，同一模型可安全地传给多个组合或多次回测。
+    """
+
+    def __init__(self, components: List[FeeComponent], **kwargs):
+        super().__init__(**kwargs)
+        self.components = components
+        self._month: Optional[int] = None
+        self._month_shares = 0.0
+        self._month_notional = 0.0
+
+    @property
+    def uses_monthly_volume(self) -> bool:
+        return any(c.tier_by == 'monthly' and c.tiers for c in self.components)
+
+    def _month_to_date(self, timestamp: Any) -> Tuple[float, float]:
+        if self._month != month_key(timestamp):
+            return 0.0, 0.0
+        return self._month_shares, self._month_notional
+
+    def commission(self, order: Order, fill_price: float) -> float:
+        side = order_side(order.order_type)
+        monthly = None
+        if self.uses_monthly_volume:
+            shares, notional = self._month_to_date(order.timestamp)
+            monthly = {'share': shares + order.quantity, 'notional': notional + fill_price * order.quantity}
+        return sum(c.fee(side, fill_price, order.quantity, monthly) for c in self.components)
+
+    def on_fill(self, order: Order, fill_price: float) -> None:
+        if not self.uses_monthly_volume:
+            return
+        shares, notional = self._month_to_date(order.timestamp)
+        self._month = month_key(order.timestamp)
+        self._month_shares = shares + order.quantity
+        self._month_notional = notional + fill_price * order.quantity
+
+    def for_account(self) -> FeeScheduleCostModel:
+        if not self.uses_monthly_volume:
+            return self
+        model = copy.copy(self)
+        model._month = None
+        model._month_shares = 0.0
+        model._month_notional = 0.0
+        return model
+
+    def batch_commission(self, side, fill_price, quantity, monthly=None):
+        total = np.zeros(np.shape(fill_price))
+        for c in self.components:
+            total += c.batch_fee(side, fill_price, quantity, monthly)
+        return total
+
+
+class BinanceCostModel(CostModel):
+    """币安现货：限价单按 maker 费率，市价/止损单按 taker 费率"""
+
+    def __init__(self, maker: float = 0.001, taker: float = 0.001, batch_liquidity: str = 'taker', **kwargs):
+        """
+        :param batch_liquidity: 批量路径无法区分订单类型，统一按 'maker' 或 'taker' 计费
+        """
+        super().__init__(**kwargs)
+        self.maker = maker
+        self.taker = taker
+        self.batch_rate = maker if batch_liquidity == 'maker' else taker
+
+    def commission(self, order: Order, fill_price: float) -> float:
+        rate = self.maker if order.style == OrderStyle.LIMIT else self.taker
+        return fill_price * order.quantity * rate
+
+    def batch_commission(self, side, fill_price, quantity, monthly=None):
+        return fill_price * quantity * self.batch_rate
+
+
+def futu_us_cost_model(**kwargs) -> FeeScheduleCostModel:
+    """富途美股费用表（默认费率仅供参考，以券商最新公示为准）"""
+    return FeeScheduleCostModel([
+        FeeComponent('share', 0.0049, min_fee=0.99, max_rate=0.005),  # 佣金
+        # 平台费：按账户当月累计成交股数分档
+        FeeComponent('share', tiers=[(500, 0.010), (1_000, 0.008), (5_000, 0.007), (10_000, 0.006),
+                                     (50_000, 0.0055), (200_000, 0.005), (500_000, 0.0045),
+                                     (1_000_000, 0.004), (5_000_000, 0.0035), (float('inf'), 0.003)],
+                     min_fee=1.0, max_rate=0.005, tier_by='monthly'),
+        FeeComponent('share', 0.003),  # 交收费
+        FeeComponent('notional', 0.0000278, min_fee=0.01, side='sell'),  # SEC 规费
+        FeeComponent('share', 0.000166, min_fee=0.01, max_fee=8.30, side='sell'),  # FINRA 交易活动费
+    ], **kwargs)
+
+
+def futu_hk_cost_model(**kwargs) -> FeeScheduleCostModel:
+    """富途港股费用表（默认费率仅供参考，以券商最新公示为准）"""
+    return FeeScheduleCostModel([
+        FeeComponent('notional', 0.0003, min_fee=3.0),  # 佣金
+        FeeComponent('order', 15.0),  # 平台费
+        FeeComponent('notional', 0.001),  # 印花税
+        FeeComponent('notional', 0.0000565, min_fee=0.01),  # 交易费
+        FeeComponent('notional', 0.000027, min_fee=0.01),  # 证监会交易征费
+        FeeComponent('notional', 0.0000015),  # 财汇局交易征费
+        FeeComponent('notional', 0.00002, min_fee=2.0, max_fee=100.0),  # 交收费
+    ], **kwargs)
+
+
+def build_cost_model(conf: dict) -> Optional[CostModel]:
+    """
+    按配置构造成本模型，未配置 cost_model 时返回 None（沿用 commission/slippage 两个标量）。
+    :param conf: YAML 配置 dict
+    """
+    cm_conf = conf.get('cost_model') or {}
+    kind = cm_conf.get('type')
+    if not kind:
+        return None
+    params = dict(cm_conf.get('params') or {})
+    params.setdefault('slippage', conf.get('slippage', 0.0))
+    if kind == 'flat':
+        params.setdefault('commission', conf.get('commission', 0.0005))
+        model = FlatCostModel(**params)
+    elif kind == 'futu_us':
+        model = futu_us_cost_model(**params)
+    elif kind == 'futu_hk':
+        model = futu_hk_cost_model(**params)
+    elif kind == 'binance':
+        model = BinanceCostModel(**params)
+    else:
+        raise ValueError(f"Unknown cost model type: {kind}")
+    logger.info("Cost model built: type=%s, params=%s", kind, params)
+    return model
@@ -1,15 +1,32 @@
 from __future__ import annotations
 import logging
+import os
+import time
+from pathlib import Path
 from typing import Callable, Optional, Union
 import pandas as pd
 from pydantic import BaseModel, Field, ValidationError
 from openbb import obb
 
+from multi_market_qt_system.core.bar_store import normalize_actions
+from multi_market_qt_system.core.latency import MetricsRegistry, now_ns
+
 logger = logging.getLogger(__name__)
 
+# 各数据源请求未复权 K 线的参数；不在表中的数据源无法提供未复权价格，不能用于本地复权
+UNADJUSTED_PARAMS = {
+    'yfinance': {'adjustment': 'unadjusted'},
+    'fmp': {'adjustment': 'unadjusted'},
+    'intrinio': {'adjustment': 'unadjusted'},
+    'polygon': {'adjustment': 'unadjusted'},
+}
+
 
 class DataSourceConfig(BaseModel):
     source: str = Field(..., description="数据源名称，如 'openbb' 或 'vnpy'")
+    cache_dir: Optional[str] = Field(None, description="本地历史数据缓存目录，为空则不缓存")
+    actions_ttl_hours: float = Field(24.0, description="公司行为缓存有效期（小时），过期后重新拉取")
+    open_range_ttl_minutes: float = Field(60.0, description="写入时尚未结束的区间（含当日未收盘 bar）的缓存有效期（分钟）")
 
 
 class DataClient:
@@ -25,10 +42,29 @@ class DataClient:
         self.mode = mode
         ds_cfg = DataSourceConfig(**conf.get('market_data', {}))
         self.source = ds_cfg.source.lower()
-        logger.info("DataClient initialized: mode=%s, source=%s", self.mode, self.source)
+        self.cache_dir = Path(ds_cfg.cache_dir) if ds_cfg.cache_dir else None
+        self.actions_ttl = ds_cfg.actions_ttl_hours * 3600
+        self.open_range_ttl = ds_cfg.open_range_ttl_minutes * 60
+        self.metrics: Optional[MetricsRegistry] = None  # 实盘时注入，统计行情吞吐
+        logger.info("DataClient initialized: mode=%s, source=%s, cache_dir=%s", self.mode, self.source, self.cache_dir)
+
+    def _cache_path(self, symbol: str, start: str, end: str, provider: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        return self.cache_dir / provider / f"{symbol}_{start}_{end}.pkl"
+
+    def _historical_cache_valid(self, cache_path: Path, end: str) -> bool:
+        """
+        写入时区间已完全结束（写入晚于 end 次日零点 UTC）的缓存永久有效；
+        否则缓存中可能含未收盘的最后一根 bar 或缺少之后的 bar，只在 open_range_ttl 内复用。
+        """
+        mtime = cache_path.stat().st_mtime
+        if mtime >= (pd.Timestamp(end) + pd.Timedelta(days=1)).timestamp():
+            return True
+        return time.time() - mtime < self.open_range_ttl
 
     def get_historical(
-            self, symbol: str, start: str, end: str, provider: str = 'yfinance'
+            self, symbol: str, start: str, end: str, provider: str = 'yfinance', unadjusted: bool = False
     ) -> pd.DataFrame:
         """
         获取历史 K 线数据
@@ -36,14 +72,33 @@ class DataClient:
         :param start: 起始日期，格式 YYYY-MM-DD
         :param end: 结束日期，格式 YYYY-MM-DD
         :param provider: 数据提供方
+        :param unadjusted: True 时显式请求未复权价格（本地复权需要），数据源不支持时抛出 ValueError；
+            False 时为数据源默认口径（如 yfinance 默认已做拆股复权）
         :return: pandas.DataFrame，包含至少 ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
         """
+        params = {}
+        if unadjusted:
+            if provider not in UNADJUSTED_PARAMS:
+                raise ValueError(f"Provider {provider} cannot supply unadjusted bars; "
+                                 f"use one of {sorted(UNADJUSTED_PARAMS)} or adjustment 'raw'")
+            params = UNADJUSTED_PARAMS[provider]
         logger.info("Loading historical data for %s [%s - %s] via %s", symbol, start, end, self.source)
+        cache_path = self._cache_path(symbol + ('_unadj' if unadjusted else ''), start, end, provider)
+        if cache_path is not None and cache_path.exists() and self._historical_cache_valid(cache_path, end):
+            logger.info("Historical data cache hit: %s", cache_path)
+            return pd.read_pickle(cache_path)
         if self.source == 'openbb':
             try:
-                df = obb.equity.price.historical(symbol, start, end, provider).to_df()
+                df = obb.equity.price.historical(symbol, start, end, provider, **params).to_df()
                 print("Columns:", df.columns.tolist(), "\n")
                 logger.debug("Historical data head for %s:\n%s", symbol, df.head(3))
+                if cache_path is not None:
+                    # 先写临时文件再原子替换，避免并发进程读到半截文件
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+                    df.to_pickle(tmp)
+                    os.replace(tmp, cache_path)
+                    logger.debug("Historical data cached: %s", cache_path)
                 return df
             except Exception as e:
                 logger.exception("Failed to fetch historical data for %s: %s", symbol, e)
@@ -52,6 +107,49 @@ class DataClient:
             logger.error("Unsupported data source: %s", self.source)
             raise NotImplementedError(f"Data source {self.source} not implemented.")
 
+    def get_corporate_actions(self, symbol: str, provider: str = 'yfinance', refresh: bool = False) -> pd.DataFrame:
+        """
+        获取标的全部历史拆股与分红，供 BarStore 计算复权因子。有缓存目录时落盘，
+        缓存超过 actions_ttl_hours 后重新拉取，避免之后发生的拆股/分红永远不可见。
+        某一类数据取不到（如加密货币没有分红）时按空处理。
+        :param refresh: True 时忽略缓存直接拉取（行情刷新入库时使用）
+        :return: DataFrame，索引为除权日，列 split_ratio / dividend（见 normalize_actions）
+        """
+        cache_path = self._cache_path(symbol, 'actions', 'all', provider)
+        if (not refresh and cache_path is not None and cache_path.exists()
+                and time.time() - cache_path.stat().st_mtime < self.actions_ttl):
+            logger.info("Corporate actions cache hit: %s", cache_path)
+            return pd.read_pickle(cache_path)
+        if self.source != 'openbb':
+            logger.error("Unsupported data source: %s", self.source)
+            raise NotImplementedError(f"Data source {self.source} not implemented.")
+
+        frames = []
+        try:
+            splits = obb.equity.fundamental.historical_splits(symbol, provider=provider).to_df()
+            if not splits.empty:
+                splits = splits.set_index('date') if 'date' in splits.columns else splits
+                frames.append(pd.DataFrame({'split_ratio': splits['numerator'] / splits['denominator']}))
+        except Exception as e:
+            logger.warning("No split history for %s via %s: %s", symbol, provider, e)
+        try:
+            dividends = obb.equity.fundamental.dividends(symbol, provider=provider).to_df()
+            if not dividends.empty:
+                if 'ex_dividend_date' in dividends.columns:
+                    dividends = dividends.set_index('ex_dividend_date')
+                frames.append(pd.DataFrame({'dividend': dividends['amount']}))
+        except Exception as e:
+            logger.warning("No dividend history for %s via %s: %s", symbol, provider, e)
+        actions = normalize_actions(pd.concat(frames) if frames else None)
+        logger.info("Loaded %d corporate actions for %s", len(actions), symbol)
+
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            actions.to_pickle(tmp)
+            os.replace(tmp, cache_path)
+        return actions
+
     def subscribe(
             self, symbol: str, callback: Callable[[dict], None]
     ) -> None:
@@ -64,9 +162,25 @@ class DataClient:
             logger.error("Attempt to subscribe in non-live mode: %s", self.mode)
             raise RuntimeError("实盘模式才能订阅实时行情，请将 mode 设置为 'live'.")
         logger.info("Subscribing to live data for %s via %s", symbol, self.source)
+        callback = self._stamped(symbol, callback)
         # TODO: 调用 SDK 的 WebSocket 或 Gateway 接口
         # 示例 （伪代码）:
         # if self.source == 'vnpy':
         #     gateway = VnpyGateway(...) 
         #     gateway.subscribe(symbol, on_tick=callback)
         raise NotImplementedError("实时订阅功能待实现")
+
+    def _stamped(self, symbol: str, callback: Callable[[dict], None]) -> Callable[[dict], None]:
+        """
+        包装行情回调：在收到行情的第一时间打上单调时钟戳 recv_ns，供下游统计 tick-to-decision 延迟。
+        """
+        metrics = self.metrics
+        events = metrics.counter('market_events_total', 'Market data events received', symbol=symbol) if metrics else None
+
+        def _on_data(data: dict) -> None:
+            data['recv_ns'] = now_ns()
+            if events is not None:
+                events.inc()
+            callback(data)
+
+        return _on_data
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import logging
+import mmap
+import struct
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from multi_market_qt_system.core.order import Order, OrderStyle, OrderType
+from multi_market_qt_system.core.scheduler import EventScheduler
+
+logger = logging.getLogger(__name__)
+
+RECORD_SIZE = 64
+
+# 记录类型，0 表示段文件中尚未写入的空位
+KIND_SYMBOL = 1
+KIND_BAR = 2
+KIND_SIGNAL = 3
+KIND_ORDER = 4
+KIND_FILL = 5
+
+ACTIONS = ('BUY', 'SELL', 'SHORT', 'COVER')  # 编码为 1..4，0 表示无方向
+_ACTION_CODE = {name: i + 1 for i, name in enumerate(ACTIONS)}
+
+# 定长 64 字节记录：seq, ts_ns, kind, action, flag, pad, sym_id, qty, f1..f4
+#   BAR:    qty=volume, f1..f4=open/high/low/close
+#   SIGNAL: qty=quantity, f1=price
+#   ORDER:  qty=quantity, f1=price, flag=1 通过风控 / 0 被拒
+#   FILL:   qty=quantity, f1=成交价, f2=费用
+#   SYMBOL: sym_id 与最长 40 字节的 UTF-8 代码（不占用 seq）
+_EVENT = struct.Struct('<QqBBBxI5d')
+_SYMBOL = struct.Struct('<QqBBBxI40s')
+
+JOURNAL_DTYPE = np.dtype([
+    ('seq', '<u8'), ('ts_ns', '<i8'),
+    ('kind', 'u1'), ('action', 'u1'), ('flag', 'u1'), ('pad', 'u1'),
+    ('sym_id', '<u4'),
+    ('qty', '<f8'), ('f1', '<f8'), ('f2', '<f8'), ('f3', '<f8'), ('f4', '<f8'),
+])
+assert _EVENT.size == _SYMBOL.size == JOURNAL_DTYPE.itemsize == RECORD_SIZE
+
+
+def to_ns(ts: Any) -> int:
+    """时间戳统一为纳秒整数（int / pd.Timestamp / datetime / 字符串）"""
+    if isinstance(ts, (int, np.integer)):
+        return int(ts)
+    value = getattr(ts, 'value', None)
+    if isinstance(value, int):
+        return value
+    return pd.Timestamp(ts).value
+
+
+def _stamps(ts_ns: np.ndarray, tz: Optional[str]) -> pd.DatetimeIndex:
+    """日志中的 UTC 纳秒还原为时间戳：tz 为 None 时为无时区的 UTC 时间，否则换算到 tz"""
+    index = pd.DatetimeIndex(ts_ns.view('datetime64[ns]'))
+    return index if tz is None else index.tz_localize('UTC').tz_convert(tz)
+
+
+def _segment_paths(directory: Path) -> List[Path]:
+    return sorted(directory.glob('journal_*.bin'))
+
+
+def _valid_records(path: Path) -> np.ndarray:
+    """内存映射一个段文件，截取到第一个空位之前的有效记录"""
+    if path.stat().st_size < RECORD_SIZE:
+        return np.empty(0, dtype=JOURNAL_DTYPE)
+    records = np.memmap(path, dtype=JOURNAL_DTYPE, mode='r')
+    empty = np.flatnonzero(records['kind'] == 0)
+    return records[:empty[0]] if len(empty) else records
+
+
+def _decode_symbols(records: np.ndarray, symbols: Dict[int, str]) -> None:
+    mask = records['kind'] == KIND_SYMBOL
+    if not mask.any():
+        return
+    raw = records[mask].view(np.uint8).reshape(-1, RECORD_SIZE)
+    for sym_id, name in zip(records['sym_id'][mask].tolist(), raw[:, 24:]):
+        symbols[sym_id] = bytes(name).rstrip(b'\0').decode('utf-8')
+
+
+class EventJournal:
+    """
+    二进制事件日志：行情、信号、订单、成交按定长 64 字节记录追加写入内存映射段文件。
+    热路径上只做一次 struct 打包与 deque 追加；后台线程批量拷入 mmap，段写满时轮转。
+    每个新段开头重写完整的代码表，删除旧段后剩余段仍可独立解码。
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, flush_interval: float = 0.05):
+        """
+        :param directory: 日志目录
+        :param segment_bytes: 单个段文件大小（按记录长度向下取整）
+        :param flush_interval: 后台线程批量落盘的间隔（秒）
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_records = max(segment_bytes // RECORD_SIZE, 16)
+        self.flush_interval = flush_interval
+
+        # 接续已有日志的序号与代码表，重启后总是新开一个段
+        existing = _segment_paths(self.directory)
+        self._symbols: Dict[str, int] = {}
+        seq = 0
+        names: Dict[int, str] = {}
+        for path in existing:
+            records = _valid_records(path)
+            _decode_symbols(records, names)
+            events = records['seq'][records['kind'] != KIND_SYMBOL]
+            if len(events):
+                seq = max(seq, int(events[-1]))
+        self._symbols = {name: sym_id for sym_id, name in names.items()}
+        self._seq = seq
+        self._segment_no = int(existing[-1].stem.split('_')[1]) + 1 if existing else 0
+
+        self._pending: deque = deque()
+        self._seq_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offset = 0
+        self._open_segment()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='journal-writer', daemon=True)
+        self._thread.start()
+        logger.info("EventJournal opened at %s, next seq=%d, segment=%d", self.directory, self._seq + 1,
+                    self._segment_no)
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    # —— 热路径 —— #
+    def _symbol_id(self, symbol: str) -> int:
+        sym_id = self._symbols.get(symbol)
+        if sym_id is None:
+            sym_id = len(self._symbols) + 1
+            self._symbols[symbol] = sym_id
+            self._pending.append(_SYMBOL.pack(0, 0, KIND_SYMBOL, 0, 0, sym_id, symbol.encode('utf-8')[:40]))
+        return sym_id
+
+    def _append(self, ts: Any, kind: int, action: int, flag: int, symbol: str,
+                qty: float, f1: float = 0.0, f2: float = 0.0, f3: float = 0.0, f4: float = 0.0) -> int:
+        with self._seq_lock:
+            sym_id = self._symbol_id(symbol)
+            self._seq += 1
+            seq = self._seq
+            self._pending.append(_EVENT.pack(seq, to_ns(ts), kind, action, flag, sym_id, qty, f1, f2, f3, f4))
+        return seq
+
+    def record_bar(self, bar: Dict[str, Any]) -> int:
+        """:return: 该事件的序号（可直接作为快照的 last_seq）"""
+        close = bar['close']
+        return self._append(bar['timestamp'], KIND_BAR, 0, 0, bar['symbol'], bar.get('volume', 0.0),
+                            bar.get('open', close), bar.get('high', close), bar.get('low', close), close)
+
+    def record_signal(self, sig: Dict[str, Any]) -> int:
+        return self._append(sig['timestamp'], KIND_SIGNAL, _ACTION_CODE[sig['action']], 0, sig['symbol'],
+                            sig['quantity'], sig['price'])
+
+    def record_order(self, order: Order, accepted: bool) -> int:
+        return self._append(order.timestamp, KIND_ORDER, _ACTION_CODE[order.order_type.name], int(accepted),
+                            order.symbol, order.quantity, order.price)
+
+    def record_fill(self, timestamp: Any, symbol: str, action: str, quantity: float, price: float,
+                    fee: float = 0.0) -> int:
+        return self._append(timestamp, KIND_FILL, _ACTION_CODE[action], 0, symbol, quantity, price, fee)
+
+    # —— 后台落盘 —— #
+    def _open_segment(self) -> None:
+        path = self.directory / f'journal_{self._segment_no:06d}.bin'
+        self._file = open(path, 'w+b')
+        self._file.truncate(self.segment_records * RECORD_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), self.segment_records * RECORD_SIZE)
+        self._offset = 0
+        # 段首写入完整代码表
+        for symbol, sym_id in list(self._symbols.items()):
+            self._put(_SYMBOL.pack(0, 0, KIND_SYMBOL, 0, 0, sym_id, symbol.encode('utf-8')[:40]))
+        logger.debug("Journal segment opened: %s", path)
+
+    def _close_segment(self) -> None:
+        self._mmap.flush()
+        self._mmap.close()
+        # 截掉未使用的预分配空间
+        self._file.truncate(self._offset)
+        self._file.close()
+
+    def _put(self, record: bytes) -> None:
+        if self._offset + RECORD_SIZE > len(self._mmap):
+            self._close_segment()
+            self._segment_no += 1
+            self._open_segment()
+        self._mmap[self._offset:self._offset + RECORD_SIZE] = record
+        self._offset += RECORD_SIZE
+
+    def _drain(self) -> int:
+        n = 0
+        with self._write_lock:
+            pending = self._pending
+            while pending:
+                self._put(pending.popleft())
+                n += 1
+        return n
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._drain()
+            except Exception:
+                logger.exception("Journal write failed")
+
+    def flush(self) -> None:
+        """把缓冲区中的记录写入 mmap 并同步到磁盘"""
+        self._drain()
+        with self._write_lock:
+            self._mmap.flush()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._drain()
+        with self._write_lock:
+            self._close_segment()
+        logger.info("EventJournal closed at seq=%d", self._seq)
+
+
+class JournalReader:
+    """
+    日志读取：按段内存映射并一次性向量化解码为结构化数组，代码表还原为 sym_id -> symbol。
+    """
+
+    def __init__(self, directory: str, tz: Optional[str] = 'UTC'):
+        """
+        :param tz: 还原时间戳所用的时区（日志只存 UTC 纳秒），应与实盘行情时间戳一致；None 表示无时区的 UTC 时间
+        """
+        self.directory = Path(directory)
+        self.tz = tz
+        self.symbols: Dict[int, str] = {}
+        parts = []
+        for path in _segment_paths(self.directory):
+            records = _valid_records(path)
+            _decode_symbols(records, self.symbols)
+            parts.append(np.asarray(records[records['kind'] != KIND_SYMBOL]))
+        self.records = np.concatenate(parts) if parts else np.empty(0, dtype=JOURNAL_DTYPE)
+        logger.info("Journal loaded from %s: %d events, %d symbols", self.directory, len(self.records),
+                    len(self.symbols))
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def select(self, kind: int, after_seq: int = 0) -> np.ndarray:
+        rec = self.records
+        return rec[(rec['kind'] == kind) & (rec['seq'] > after_seq)]
+
+    def bars(self, symbol: Optional[str] = None) -> pd.DataFrame:
+        """行情记录还原为 DataFrame（列与 normalize_bars 一致，另带 seq/symbol）"""
+        rec = self.select(KIND_BAR)
+        if symbol is not None:
+            sym_ids = [i for i, s in self.symbols.items() if s == symbol]
+            rec = rec[np.isin(rec['sym_id'], sym_ids)]
+        index = _stamps(rec['ts_ns'], self.tz).rename('timestamp')
+        return pd.DataFrame({
+            'seq': rec['seq'],
+            'symbol': [self.symbols[i] for i in rec['sym_id'].tolist()],
+            'timestamp': index,
+            'open': rec['f1'], 'high': rec['f2'], 'low': rec['f3'], 'close': rec['f4'],
+            'volume': rec['qty'],
+        }, index=index)
+
+    def decisions(self, after_seq: int = 0) -> List[Tuple]:
+        """日志中的信号与订单决策，按序号排列，用于与重放结果逐条比对"""
+        rec = self.records
+        rec = rec[((rec['kind'] == KIND_SIGNAL) | (rec['kind'] == KIND_ORDER)) & (rec['seq'] > after_seq)]
+        return list(zip(rec['kind'].tolist(), rec['ts_ns'].tolist(), rec['sym_id'].tolist(),
+                        rec['action'].tolist(), rec['flag'].tolist(), rec['qty'].tolist(), rec['f1'].tolist()))
+
+    def events(self, after_seq: int = 0, fills: bool = False) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        逐条产出 (seq, bar) 行情事件，可直接作为 SnapshotManager.recover 的 events。
+        :param fills: 同时按原顺序产出成交事件 {'timestamp', 'symbol', 'action', 'quantity', 'price', 'fee'}
+            （以 'action' 键区分），恢复时据此把快照之后的成交补记入组合
+        """
+        rec = self.records
+        kinds = rec['kind']
+        mask = (kinds == KIND_BAR) | (kinds == KIND_FILL) if fills else kinds == KIND_BAR
+        rec = rec[mask & (rec['seq'] > after_seq)]
+        stamps = _stamps(rec['ts_ns'], self.tz)
+        symbols = self.symbols
+        for seq, ts, kind, action, sym_id, o, h, l, c, v in zip(
+                rec['seq'].tolist(), stamps, rec['kind'].tolist(), rec['action'].tolist(), rec['sym_id'].tolist(),
+                rec['f1'].tolist(), rec['f2'].tolist(), rec['f3'].tolist(), rec['f4'].tolist(), rec['qty'].tolist()):
+            if kind == KIND_FILL:
+                yield seq, {'timestamp': ts, 'symbol': symbols[sym_id], 'action': ACTIONS[action - 1],
+                            'quantity': v, 'price': o, 'fee': h}
+            else:
+                yield seq, {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+                            'symbol': symbols[sym_id]}
+
+
+@dataclass
+class ReplayResult:
+    events: int
+    signals: int
+    orders: int
+    fills: int
+    elapsed: float
+    mismatches: int = 0
+    first_mismatch: Optional[Tuple[Tuple, Optional[Tuple]]] = None  # (重放决策, 日志决策)
+    decisions: List[Tuple] = field(default_factory=list, repr=False)
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.elapsed if self.elapsed > 0 else float('inf')
+
+
+class JournalReplayer:
+    """
+    确定性重放：把日志中的行情按原顺序送入 定时事件 → 策略 → 风控 → 组合，路径与实盘 on_bar 一致；
+    成交默认取日志中的 FILL 记录（与实盘入账一致），也可按 bar 收盘价模拟撮合。
+    重放产生的信号/订单决策与日志逐条比对，用于回归测试与事后复盘。
+    """
+
+    def __init__(self, strategy, risk_manager, portfolio, commission: float = 0.0, slippage: float = 0.0,
+                 scheduler: Optional[EventScheduler] = None):
+        """
+        :param commission: 构造订单时使用的费率（应与实盘配置一致）
+        :param slippage: 构造订单时使用的滑点（应与实盘配置一致）
+        :param scheduler: 定时事件调度器；None 时新建并由策略登记定时事件（从头重放），
+            从快照接续重放时应传入随快照恢复的调度器
+        """
+        self.strategy = strategy
+        self.risk_manager = risk_manager
+        self.portfolio = portfolio
+        self.commission = commission
+        self.slippage = slippage
+        if scheduler is None:
+            scheduler = EventScheduler()
+            strategy.schedule_events(scheduler)
+        self.scheduler = scheduler
+
+    def replay(self, reader: JournalReader, after_seq: int = 0, fills: str = 'journal',
+               verify: bool = True) -> ReplayResult:
+        """
+        :param after_seq: 只重放序号大于该值的事件（从快照恢复后接续）
+        :param fills: 'journal' 使用日志成交入账 / 'simulate' 通过风控即按收盘价撮合 / 'none' 不入账
+        :param verify: 是否与日志中的决策逐条比对
+        """
+        if fills not in ('journal', 'simulate', 'none'):
+            raise ValueError(f"Unknown fills mode: {fills}")
+        rec = reader.records
+        rec = rec[(rec['seq'] > after_seq) & ((rec['kind'] == KIND_BAR) | (rec['kind'] == KIND_FILL))]
+        symbols = reader.symbols
+        sym_ids = {name: sym_id for sym_id, name in symbols.items()}
+        stamps = list(_stamps(rec['ts_ns'], reader.tz))
+        strategy, risk, portfolio, scheduler = self.strategy, self.risk_manager, self.portfolio, self.scheduler
+        decisions: List[Tuple] = []
+        n_bars = n_signals = n_orders = n_fills = 0
+
+        start = time.perf_counter()
+        for ts, ts_ns, kind, action, sym_id, qty, f1, f2, f3, f4 in zip(
+                stamps, rec['ts_ns'].tolist(), rec['kind'].tolist(), rec['action'].tolist(),
+                rec['sym_id'].tolist(), rec['qty'].tolist(), rec['f1'].tolist(), rec['f2'].tolist(),
+                rec['f3'].tolist(), rec['f4'].tolist()):
+            symbol = symbols[sym_id]
+            if kind == KIND_FILL:
+                if fills == 'journal':
+                    portfolio.book_fill(ts, symbol, ACTIONS[action - 1], qty, f1, f2)
+                    n_fills += 1
+                continue
+
+            n_bars += 1
+            bar = {'timestamp': ts, 'open': f1, 'high': f2, 'low': f3, 'close': f4, 'volume': qty,
+                   'symbol': symbol}
+            market_price = {symbol: f4}
+            # 与实盘一致：先触发不晚于本根 bar 的定时事件，其信号排在本根 bar 的信号之前
+            timed = []
+            if ts_ns >= scheduler.next_ns:
+                scheduler.advance_to(ts)
+                timed = strategy.drain_signals()
+            for sig in timed + strategy.on_bar(bar):
+                n_signals += 1
+                sig_sym = sym_ids.get(sig['symbol'], 0)
+                decisions.append((KIND_SIGNAL, to_ns(sig['timestamp']), sig_sym, _ACTION_CODE[sig['action']], 0,
+                                  float(sig['quantity']), float(sig['price'])))
+                order = Order(
+                    timestamp=sig['timestamp'],
+                    symbol=sig['symbol'],
+                    quantity=sig['quantity'],
+                    price=sig['price'],
+                    order_type=OrderType[sig['action']],
+                    style=OrderStyle.MARKET,
+                    commission=self.commission,
+                    slippage=self.slippage
+                )
+                accepted = risk.validate(order, market_price, portfolio)
+                n_orders += 1
+                decisions.append((KIND_ORDER, to_ns(order.timestamp), sig_sym, _ACTION_CODE[order.order_type.name],
+                                  int(accepted), float(order.quantity), float(order.price)))
+                if accepted and fills == 'simulate':
+                    portfolio.execute_order(order, market_prices=market_price,
+                                            market_volumes={symbol: qty})
+                    n_fills += 1
+                if accepted:
+                    risk.settle(order)
+        elapsed = time.perf_counter() - start
+
+        result = ReplayResult(n_bars, n_signals, n_orders, n_fills, elapsed, decisions=decisions)
+        if verify:
+            expected = reader.decisions(after_seq)
+            for i in range(max(len(decisions), len(expected))):
+                got = decisions[i] if i < len(decisions) else None
+                want = expected[i] if i < len(expected) else None
+                if got != want:
+                    result.mismatches += 1
+                    if result.first_mismatch is None:
+                        result.first_mismatch = (got, want)
+            if result.mismatches:
+                logger.warning("Replay diverged from journal: %d mismatches, first=%s", result.mismatches,
+                               result.first_mismatch)
+        logger.info("Replay finished: %d bars, %d signals, %d orders in %.3fs (%.0f events/s)",
+                    n_bars, n_signals, n_orders, elapsed, result.events_per_second)
+        return result
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+now_ns = time.perf_counter_ns  # 单调时钟，纳秒
+
+QUANTILES = (0.5, 0.99, 0.999)
+
+
+class LatencyHistogram:
+    """
+    HDR 风格的对数-线性直方图（纳秒）：每个 2 的幂区间再均分为 2^(precision_bits-1) 个子桶，
+    相对误差约 1/2^(precision_bits-1)。record 只有位运算和一次列表自增，无锁（依赖 GIL，极少数并发丢计数可接受）。
+    """
+
+    def __init__(self, precision_bits: int = 6, max_value_ns: int = 60 * 10 ** 9):
+        self.bits = precision_bits
+        self.half = 1 << (precision_bits - 1)
+        self.max_value = max_value_ns
+        max_shift = max(max_value_ns.bit_length() - precision_bits, 0)
+        self.counts: List[int] = [0] * ((max_shift + 2) * self.half)
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        shift = value.bit_length() - self.bits
+        if shift <= 0:
+            return value
+        return shift * self.half + (value >> shift)
+
+    def _lower_bound(self, idx: int) -> int:
+        shift = max(idx // self.half - 1, 0)
+        return (idx - shift * self.half) << shift
+
+    def record(self, value_ns: int) -> None:
+        if value_ns < 0:
+            value_ns = 0
+        elif value_ns > self.max_value:
+            value_ns = self.max_value
+        # 与 _index 相同，内联以省去一次方法调用
+        shift = value_ns.bit_length() - self.bits
+        self.counts[value_ns if shift <= 0 else shift * self.half + (value_ns >> shift)] += 1
+        self.total += value_ns
+        if self.count == 0:
+            self.min = self.max = value_ns
+        elif value_ns > self.max:
+            self.max = value_ns
+        elif value_ns < self.min:
+            self.min = value_ns
+        self.count += 1
+
+    def percentile(self, q: float) -> int:
+        """返回分位数 q (0~1) 所在桶的下界（纳秒）"""
+        if self.count == 0:
+            return 0
+        rank = max(1, int(round(q * self.count)))
+        seen = 0
+        for idx, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return min(max(self._lower_bound(idx), self.min), self.max)
+        return self.max
+
+    def reset(self) -> None:
+        self.counts = [0] * len(self.counts)
+        self.count = self.total = self.min = self.max = 0
+
+
+class Counter:
+    """单调递增计数器（吞吐量）"""
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        self.value += n
+
+
+class Gauge:
+    """瞬时值（如队列深度）"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in sorted(labels.items())) + '}'
+
+
+class MetricsRegistry:
+    """
+    实盘指标注册表：按 (名称, 标签) 管理直方图、计数器与仪表，
+    导出为 Prometheus 文本格式（文件或本地 HTTP 端点）。
+    直方图以 summary 类型导出 p50/p99/p999（单位秒）。
+    """
+
+    def __init__(self, prefix: str = 'mmqt'):
+        self.prefix = prefix
+        self._metrics: Dict[Tuple[str, str], Tuple[str, str, object]] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def _get(self, kind: str, factory, name: str, help_text: str, labels: Dict[str, str]):
+        key = (name, _labels(labels))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, (kind, help_text, factory()))
+        return metric[2]
+
+    def histogram(self, name: str, help_text: str = '', **labels) -> LatencyHistogram:
+        return self._get('summary', LatencyHistogram, name, help_text, labels)
+
+    def counter(self, name: str, help_text: str = '', **labels) -> Counter:
+        return self._get('counter', Counter, name, help_text, labels)
+
+    def gauge(self, name: str, help_text: str = '', **labels) -> Gauge:
+        return self._get('gauge', Gauge, name, help_text, labels)
+
+    def render(self) -> str:
+        """生成 Prometheus 文本格式"""
+        lines: List[str] = []
+        declared = set()
+        for (name, label_str), (kind, help_text, metric) in sorted(self._metrics.items()):
+            full = f"{self.prefix}_{name}"
+            if full not in declared:
+                declared.add(full)
+                if help_text:
+                    lines.append(f"# HELP {full} {help_text}")
+                lines.append(f"# TYPE {full} {kind}")
+            if kind == 'summary':
+                inner = label_str[1:-1] if label_str else ''
+                for q in QUANTILES:
+                    q_labels = '{' + (inner + ',' if inner else '') + f'quantile="{q}"' + '}'
+                    lines.append(f"{full}{q_labels} {metric.percentile(q) / 1e9:.9f}")
+                lines.append(f"{full}_sum{label_str} {metric.total / 1e9:.9f}")
+                lines.append(f"{full}_count{label_str} {metric.count}")
+            else:
+                lines.append(f"{full}{label_str} {metric.value}")
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        """原子写出文本文件（供 node_exporter textfile collector 采集）"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding='utf-8')
+        os.replace(tmp, target)
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """在后台线程中启动本地 /metrics HTTP 端点"""
+        registry = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                logger.debug("metrics endpoint: " + fmt, *args)
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info("Metrics endpoint serving on http://%s:%d/metrics", host, port)
+        return self._server
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
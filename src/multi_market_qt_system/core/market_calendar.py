@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from datetime import date, time
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, EasterMonday, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay,
+                                    nearest_workday, sunday_to_monday)
+
+logger = logging.getLogger(__name__)
+
+_NS_PER_DAY = 86_400 * 10 ** 9
+
+
+@lru_cache(maxsize=None)
+def _holiday_days(holidays: FrozenSet[date]) -> np.ndarray:
+    return np.array(sorted(holidays), dtype='datetime64[D]').astype(np.int64)
+
+
+@dataclass(frozen=True)
+class MarketCalendar:
+    """
+    交易日历：交易日（星期 + 节假日）与日内交易时段。
+    时间戳均按交易所当地时间的无时区时间解释（与 normalize_bars 的输出一致）。
+    """
+    name: str
+    weekdays: Tuple[int, ...] = (0, 1, 2, 3, 4)
+    sessions: Tuple[Tuple[time, time], ...] = ((time(0, 0), time(23, 59, 59, 999999)),)
+    trading_days_per_year: int = 252
+    holidays: FrozenSet[date] = field(default_factory=frozenset)
+
+    @property
+    def session_seconds(self) -> float:
+        """每个交易日的交易时长（秒）"""
+        return sum((e.hour * 3600 + e.minute * 60 + e.second + e.microsecond / 1e6)
+                   - (s.hour * 3600 + s.minute * 60 + s.second) for s, e in self.sessions)
+
+    def with_holidays(self, holidays: Iterable) -> MarketCalendar:
+        """返回附加节假日后的新日历"""
+        extra = frozenset(pd.Timestamp(d).date() for d in holidays)
+        return MarketCalendar(self.name, self.weekdays, self.sessions, self.trading_days_per_year,
+                              self.holidays | extra)
+
+    def session_days(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """向量化判断每个时间戳所在日期是否为交易日"""
+        mask = np.isin(index.dayofweek, self.weekdays)
+        if self.holidays:
+            # 按自 1970 起的日序号比较（整数 isin），避免逐行构造 date 对象
+            days = index.as_unit('ns').asi8 // _NS_PER_DAY
+            mask &= ~np.isin(days, _holiday_days(self.holidays))
+        return mask
+
+    def session_mask(self, index: pd.DatetimeIndex) -> np.ndarray:
+        """
+        向量化判断每个时间戳是否处于交易时段。日线（时间均为零点）只判断交易日。
+        """
+        mask = self.session_days(index)
+        ns = index.as_unit('ns').asi8
+        tod = ns - (ns // _NS_PER_DAY) * _NS_PER_DAY
+        if not tod.any():
+            return mask
+        in_session = np.zeros(len(index), dtype=bool)
+        for start, end in self.sessions:
+            lo = pd.Timedelta(hours=start.hour, minutes=start.minute, seconds=start.second).value
+            hi = pd.Timedelta(hours=end.hour, minutes=end.minute, seconds=end.second,
+                              microseconds=end.microsecond).value
+            in_session |= (tod >= lo) & (tod <= hi)
+        return mask & in_session
+
+    def is_open(self, ts) -> bool:
+        return bool(self.session_mask(pd.DatetimeIndex([ts]))[0])
+
+    def periods_per_year(self, index: Optional[pd.DatetimeIndex] = None) -> float:
+        """
+        年化因子：日线及以上为每年交易日数，日内 bar 再乘以每个交易日的 bar 数。
+        :param index: 行情时间索引，用于推断 bar 周期；为空时按日线处理
+        """
+        if index is None or len(index) < 2:
+            return float(self.trading_days_per_year)
+        step = np.median(np.diff(index.as_unit('ns').asi8))
+        if step >= _NS_PER_DAY:
+            return float(self.trading_days_per_year)
+        bars_per_day = max(self.session_seconds * 1e9 / step, 1.0)
+        return self.trading_days_per_year * bars_per_day
+
+
+_HOLIDAY_RANGE = ('1990-01-01', '2060-12-31')
+
+
+def _boxing_day(dt):
+    """12/26 落在周日，或圣诞节落在周日（12/26 周一已用于补假）时顺延一天"""
+    return dt + pd.Timedelta(days=1) if dt.weekday() in (6, 0) else dt
+
+
+class _NYSEHolidays(AbstractHolidayCalendar):
+    # 元旦落在周六时前一个周五照常交易，其余节日按最近工作日补假
+    rules = [
+        Holiday('NewYearsDay', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr, USPresidentsDay, GoodFriday, USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('IndependenceDay', month=7, day=4, observance=nearest_workday),
+        USLaborDay, USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+class _HKEXHolidays(AbstractHolidayCalendar):
+    # 只含按公历/复活节规则可推算的假日；农历假日（春节、清明、佛诞、端午、中秋翌日、重阳）由配置补充
+    rules = [
+        Holiday('NewYearsDay', month=1, day=1, observance=sunday_to_monday),
+        GoodFriday, EasterMonday,
+        Holiday('LabourDay', month=5, day=1, observance=sunday_to_monday),
+        Holiday('HKSARDay', month=7, day=1, observance=sunday_to_monday),
+        Holiday('NationalDay', month=10, day=1, observance=sunday_to_monday),
+        Holiday('Christmas', month=12, day=25, observance=sunday_to_monday),
+        Holiday('BoxingDay', month=12, day=26, observance=_boxing_day),
+    ]
+
+
+def _rule_holidays(calendar: AbstractHolidayCalendar, extra: Iterable = ()) -> FrozenSet[date]:
+    days = calendar.holidays(*_HOLIDAY_RANGE)
+    return frozenset(d.date() for d in days) | frozenset(pd.Timestamp(d).date() for d in extra)
+
+
+US_EQUITY = MarketCalendar(
+    name='us_equity',
+    sessions=((time(9, 30), time(16, 0)),),
+    trading_days_per_year=252,
+    # 规则假日 + 特殊休市（9·11、前总统国葬日、飓风桑迪）
+    holidays=_rule_holidays(_NYSEHolidays(), ('2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',
+                                              '2004-06-11', '2007-01-02', '2012-10-29', '2012-10-30',
+                                              '2018-12-05', '2025-01-09'))
+)
+HK_EQUITY = MarketCalendar(
+    name='hk_equity',
+    sessions=((time(9, 30), time(12, 0)), (time(13, 0), time(16, 0))),
+    trading_days_per_year=247,
+    holidays=_rule_holidays(_HKEXHolidays())
+)
+CRYPTO = MarketCalendar(
+    name='crypto',
+    weekdays=(0, 1, 2, 3, 4, 5, 6),
+    trading_days_per_year=365
+)
+
+CALENDARS: Dict[str, MarketCalendar] = {c.name: c for c in (US_EQUITY, HK_EQUITY, CRYPTO)}
+
+_CRYPTO_QUOTES = ('USDT', 'USDC', 'BUSD')
+
+
+def infer_market(symbol: str) -> str:
+    """
+    按代码格式推断市场：'BTC-USD' / 'BTCUSDT' / 'BTC/USDT' 为加密货币，
+    'HK.00700' / '0700.HK' 为港股，其余（含 'US.AAPL'）为美股。
+    """
+    sym = symbol.upper()
+    if sym.startswith('HK.') or sym.endswith('.HK'):
+        return 'hk_equity'
+    if '/' in sym or sym.endswith('-USD') or any(sym.endswith(q) and len(sym) > len(q) for q in _CRYPTO_QUOTES):
+        return 'crypto'
+    return 'us_equity'
+
+
+def configure_calendars(conf: dict) -> None:
+    """
+    按配置 market_calendars.<日历名>.holidays 为内置日历追加休市日（如港股农历假日、临时休市），
+    进程启动时调用一次。
+    """
+    for name, cal_conf in (conf.get('market_calendars') or {}).items():
+        if name not in CALENDARS:
+            raise ValueError(f"Unknown market calendar: {name}")
+        holidays = (cal_conf or {}).get('holidays') or []
+        if holidays:
+            CALENDARS[name] = CALENDARS[name].with_holidays(holidays)
+            logger.info("Calendar %s: added %d configured holidays", name, len(holidays))
+
+
+def calendar_for(symbol: str, overrides: Optional[Dict[str, str]] = None) -> MarketCalendar:
+    """
+    :param overrides: symbol -> 市场名，优先于自动推断
+    """
+    market = (overrides or {}).get(symbol) or infer_market(symbol)
+    return CALENDARS[market]
+
+
+class UnifiedClock:
+    """
+    多市场统一时钟：预先把一次运行中所有标的的时间戳合并为一条时间线，
+    并一次性计算 时间×标的 的开市标志、是否有 bar 以及最近有效价格的行号。
+    之后每一步的查询都是数组下标访问（O(1)），不再逐步做 pandas reindex。
+    """
+
+    def __init__(
+            self,
+            index: pd.DatetimeIndex,
+            symbols: List[str],
+            raw_prices: np.ndarray,
+            last_row: np.ndarray,
+            open_mask: np.ndarray,
+            calendars: Dict[str, MarketCalendar]
+    ):
+        self.index = index
+        self.symbols = symbols
+        self.columns = {sym: j for j, sym in enumerate(symbols)}
+        self.raw_prices = raw_prices
+        self.last_row = last_row
+        self.open_mask = open_mask
+        self.calendars = calendars
+        self._cols = np.arange(len(symbols))
+
+    @classmethod
+    def build(
+            cls,
+            frames: Dict[str, pd.DataFrame],
+            calendars: Optional[Dict[str, MarketCalendar]] = None,
+            field: str = 'close'
+    ) -> UnifiedClock:
+        """
+        :param frames: symbol -> 标准化后的行情 DataFrame（DatetimeIndex）
+        :param calendars: symbol -> 日历，缺省按代码推断
+        :param field: 作为标记价格的列
+        """
+        symbols = list(frames)
+        calendars = {sym: (calendars or {}).get(sym) or calendar_for(sym) for sym in symbols}
+        stamps = {sym: pd.DatetimeIndex(frames[sym].index).as_unit('ns').asi8 for sym in symbols}
+        timeline = np.unique(np.concatenate(list(stamps.values()))) if symbols else np.array([], dtype=np.int64)
+        index = pd.DatetimeIndex(timeline.view('datetime64[ns]'))
+        n_periods, n_symbols = len(timeline), len(symbols)
+
+        raw_prices = np.full((n_periods, n_symbols), np.nan)
+        last_row = np.full((n_periods, n_symbols), -1, dtype=np.int64)
+        open_mask = np.empty((n_periods, n_symbols), dtype=bool)
+        for j, sym in enumerate(symbols):
+            rows = np.searchsorted(timeline, stamps[sym])
+            raw_prices[rows, j] = frames[sym][field].to_numpy(dtype=np.float64)
+            last_row[rows, j] = rows
+            open_mask[:, j] = calendars[sym].session_mask(index)
+        # 前向填充“最近一次有 bar 的行号”，-1 表示尚无数据
+        np.maximum.accumulate(last_row, axis=0, out=last_row)
+        logger.info("UnifiedClock built: %d steps x %d symbols, markets=%s",
+                    n_periods, n_symbols, sorted({c.name for c in calendars.values()}))
+        return cls(index, symbols, raw_prices, last_row, open_mask, calendars)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def step_of(self, ts) -> int:
+        """时间戳所在（或之前最近）的步号，早于时间线起点时为 -1"""
+        return int(np.searchsorted(self.index.asi8, pd.Timestamp(ts).as_unit('ns').value, side='right')) - 1
+
+    def is_open(self, step: int, symbol: str) -> bool:
+        return bool(self.open_mask[step, self.columns[symbol]])
+
+    def has_bar(self, step: int, symbol: str) -> bool:
+        """该步该标的是否有新 bar（而不是沿用旧价格）"""
+        j = self.columns[symbol]
+        return self.last_row[step, j] == step
+
+    def last_price(self, step: int, symbol: str) -> float:
+        """截至该步的最近有效价格，无数据时为 NaN"""
+        j = self.columns[symbol]
+        row = self.last_row[step, j]
+        return float(self.raw_prices[row, j]) if row >= 0 else float('nan')
+
+    def marks(self, step: int) -> np.ndarray:
+        """该步所有标的的前向填充标记价格（长度 N 的数组）"""
+        rows = self.last_row[step]
+        return np.where(rows >= 0, self.raw_prices[np.maximum(rows, 0), self._cols], np.nan)
+
+    def price_matrix(self) -> np.ndarray:
+        """T×N 前向填充价格矩阵，可直接交给 MatrixBacktester"""
+        safe = np.maximum(self.last_row, 0)
+        return np.where(self.last_row >= 0, self.raw_prices[safe, self._cols], np.nan)
+
+    @property
+    def periods_per_year(self) -> float:
+        """
+        合并时间线的年化因子：取各标的日历在该时间线上的最大值
+        （例如美股日线与 BTC 日线混合时，时间线按 365 天推进）。
+        """
+        if not self.calendars:
+            return 252.0
+        return max(cal.periods_per_year(self.index) for cal in self.calendars.values())
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from multi_market_qt_system.core.journal import to_ns
+from multi_market_qt_system.core.latency import now_ns
+
+logger = logging.getLogger(__name__)
+
+KIND_BAR = 1
+KIND_TICK = 2
+
+# 定长 128 字节槽位（两个缓存行）；tick 的成交价放在 close，盘口放在 bid/ask
+SLOT_DTYPE = np.dtype([
+    ('seq', '<i8'), ('ts_ns', '<i8'), ('pub_ns', '<i8'),
+    ('sym_id', '<i4'), ('kind', '<i4'),
+    ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+    ('bid', '<f8'), ('ask', '<f8'), ('bid_size', '<f8'), ('ask_size', '<f8'),
+    ('_pad', 'V24'),
+])
+assert SLOT_DTYPE.itemsize == 128
+
+_MAGIC = 0x4D4D51544255531  # 布局版本标识
+_SYMBOL_LEN = 32
+
+# 头部（int64）：magic, capacity, max_consumers, max_symbols, write_seq, n_symbols
+_H_MAGIC, _H_CAPACITY, _H_CONSUMERS, _H_SYMBOLS, _H_WRITE_SEQ, _H_N_SYMBOLS = range(6)
+_HEADER_BYTES = 64
+
+
+def _layout(capacity: int, max_consumers: int, max_symbols: int):
+    """各区域在共享内存中的偏移：头部 | 消费者游标 | 代码表 | 槽位"""
+    cursors = _HEADER_BYTES
+    symbols = cursors + ((max_consumers * 8 + 63) // 64) * 64
+    slots = symbols + ((max_symbols * _SYMBOL_LEN + 127) // 128) * 128
+    total = slots + capacity * SLOT_DTYPE.itemsize
+    return cursors, symbols, slots, total
+
+
+class MarketDataBus:
+    """
+    共享内存行情总线：单个行情进程写入定长二进制环形缓冲区，任意多个策略进程按各自游标零拷贝读取。
+    - 单写者、无锁：写者先把槽位 seq 置为 -1、写字段、再写回 seq，最后推进头部 write_seq；
+      读者拷贝一段槽位后重读 write_seq 复核（seqlock），可能在拷贝途中被覆盖的槽位一律视为丢失，
+      再按 seq 校验（依赖 x86 等平台的存储/加载顺序）；
+    - 每个读者把游标发布在共享内存中，写者/监控可据此发现慢消费者；
+    - 读者落后超过容量时自动跳到最旧的有效数据并计入 dropped。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        buf = shm.buf
+        self.header = np.ndarray((8,), dtype=np.int64, buffer=buf)
+        if self.header[_H_MAGIC] != _MAGIC:
+            raise ValueError(f"Shared memory {shm.name} is not a market data bus")
+        self.capacity = int(self.header[_H_CAPACITY])
+        self.max_consumers = int(self.header[_H_CONSUMERS])
+        self.max_symbols = int(self.header[_H_SYMBOLS])
+        cursors, symbols, slots, _ = _layout(self.capacity, self.max_consumers, self.max_symbols)
+        self.cursors = np.ndarray((self.max_consumers,), dtype=np.int64, buffer=buf, offset=cursors)
+        self.symbol_table = np.ndarray((self.max_symbols,), dtype=f'S{_SYMBOL_LEN}', buffer=buf, offset=symbols)
+        self.slots = np.ndarray((self.capacity,), dtype=SLOT_DTYPE, buffer=buf, offset=slots)
+        self._seqs = self.slots['seq']
+        self._symbol_ids: Dict[str, int] = {}
+        self._symbol_names: List[Optional[str]] = [None] * self.max_symbols
+
+    @classmethod
+    def create(cls, name: str, capacity: int = 1 << 16, max_consumers: int = 64,
+               max_symbols: int = 4096) -> MarketDataBus:
+        """
+        创建总线（行情进程调用）。
+        :param capacity: 槽位数，取 2 的幂
+        :param max_consumers: 最多读者数（游标槽位数）
+        :param max_symbols: 代码表容量
+        """
+        if capacity & (capacity - 1):
+            raise ValueError("capacity must be a power of two")
+        total = _layout(capacity, max_consumers, max_symbols)[3]
+        shm = shared_memory.SharedMemory(name=name, create=True, size=total)
+        header = np.ndarray((8,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_H_CAPACITY], header[_H_CONSUMERS], header[_H_SYMBOLS] = capacity, max_consumers, max_symbols
+        header[_H_MAGIC] = _MAGIC
+        bus = cls(shm, owner=True)
+        bus.cursors[:] = -1  # -1 表示该读者槽位未占用
+        bus.slots['seq'] = -1
+        logger.info("MarketDataBus %s created: %d slots x %dB, %d consumers", name, capacity,
+                    SLOT_DTYPE.itemsize, max_consumers)
+        return bus
+
+    @classmethod
+    def attach(cls, name: str) -> MarketDataBus:
+        """连接到已存在的总线（策略进程调用）"""
+        return cls(shared_memory.SharedMemory(name=name), owner=False)
+
+    # —— 写端 —— #
+    @property
+    def write_seq(self) -> int:
+        """已发布的消息数（下一条消息的序号）"""
+        return int(self.header[_H_WRITE_SEQ])
+
+    def _symbol_id(self, symbol: str) -> int:
+        sym_id = self._symbol_ids.get(symbol)
+        if sym_id is None:
+            n = int(self.header[_H_N_SYMBOLS])
+            if n >= self.max_symbols:
+                raise ValueError(f"Symbol table full ({self.max_symbols})")
+            self.symbol_table[n] = symbol.encode('utf-8')[:_SYMBOL_LEN]
+            self.header[_H_N_SYMBOLS] = n + 1  # 先写代码再发布数量
+            sym_id = self._symbol_ids[symbol] = n
+        return sym_id
+
+    def publish(self, bar: Dict[str, Any], kind: int = KIND_BAR) -> int:
+        """
+        发布一条行情（bar 或 tick），字段同 DataClient 回调的 dict。
+        :return: 消息序号
+        """
+        seq = int(self.header[_H_WRITE_SEQ])
+        i = seq & (self.capacity - 1)
+        close = bar['close']
+        get = bar.get
+        # 整槽一次写入（seq 先为 -1，读者会把它视为无效），再单独写回 seq 完成发布
+        self.slots[i] = (-1, to_ns(bar['timestamp']), now_ns(), self._symbol_id(bar['symbol']), kind,
+                         get('open', close), get('high', close), get('low', close), close, get('volume', 0.0),
+                         get('bid', np.nan), get('ask', np.nan), get('bid_size', 0.0), get('ask_size', 0.0), b'')
+        self._seqs[i] = seq
+        self.header[_H_WRITE_SEQ] = seq + 1
+        return seq
+
+    def consumer_lag(self) -> Dict[int, int]:
+        """各已注册读者落后的消息数"""
+        head = self.write_seq
+        return {i: head - int(c) for i, c in enumerate(self.cursors) if c >= 0}
+
+    def slow_consumers(self, threshold: float = 0.5) -> List[int]:
+        """落后超过 threshold × 容量 的读者（再落后就会丢数据）"""
+        limit = threshold * self.capacity
+        return [i for i, lag in self.consumer_lag().items() if lag > limit]
+
+    def symbol(self, sym_id: int) -> str:
+        name = self._symbol_names[sym_id]
+        if name is None:
+            name = self._symbol_names[sym_id] = self.symbol_table[sym_id].decode('utf-8')
+        return name
+
+    def close(self) -> None:
+        # 释放对共享内存的 numpy 视图后才能关闭
+        self.header = self.cursors = self.symbol_table = self.slots = self._seqs = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+            logger.info("MarketDataBus %s unlinked", self.shm.name)
+
+
+class BusReader:
+    """
+    总线读者：持有自己的游标（发布在共享内存中的 consumer_id 槽位），批量读取新消息。
+    """
+
+    def __init__(self, bus: MarketDataBus, consumer_id: int, from_start: bool = False):
+        """
+        :param consumer_id: 读者编号（0 ~ max_consumers-1），由部署方分配，各读者互不相同
+        :param from_start: True 时从缓冲区中最旧的有效消息开始，否则只读此后发布的消息
+        """
+        if not 0 <= consumer_id < bus.max_consumers:
+            raise ValueError(f"consumer_id must be in [0, {bus.max_consumers})")
+        self.bus = bus
+        self.consumer_id = consumer_id
+        head = bus.write_seq
+        self.cursor = max(head - bus.capacity, 0) if from_start else head
+        self.dropped = 0  # 因落后被覆盖而丢失的消息数
+        bus.cursors[consumer_id] = self.cursor
+
+    def poll(self, max_items: int = 4096) -> np.ndarray:
+        """
+        读取游标之后的新消息（结构化数组副本，一次内存拷贝），没有新消息时返回空数组。
+        被写者覆盖的消息会被跳过并计入 dropped。
+        """
+        bus = self.bus
+        cap = bus.capacity
+        head = bus.write_seq
+        if head - self.cursor > cap:
+            lost = head - cap - self.cursor
+            self.dropped += lost
+            logger.warning("Consumer %d overrun: %d messages dropped", self.consumer_id, lost)
+            self.cursor = head - cap
+        n = min(head - self.cursor, max_items)
+        if n <= 0:
+            return bus.slots[:0].copy()
+        start = self.cursor & (cap - 1)
+        end = start + n
+        if end <= cap:
+            batch = bus.slots[start:end].copy()
+        else:
+            batch = np.concatenate((bus.slots[start:], bus.slots[:end - cap]))
+        # seqlock 式复核：拷贝结束后重读写序号。写者写第 w 条消息时覆盖序号 w - cap 的槽位，
+        # 因此序号 <= 新写序号 - cap 的槽位可能在拷贝途中被改写（拷贝时读到的 seq 仍是旧的有效值），一律丢弃
+        expected = np.arange(self.cursor, self.cursor + n)
+        stale = max(0, min(n, bus.write_seq - cap + 1 - self.cursor))
+        valid = batch['seq'][stale:] == expected[stale:]
+        keep = n if valid.all() else stale + int(np.argmin(valid))
+        if stale:
+            self.dropped += stale
+            logger.warning("Consumer %d overrun during read: %d messages dropped", self.consumer_id, stale)
+        batch = batch[stale:keep]
+        self.cursor += keep
+        bus.cursors[self.consumer_id] = self.cursor
+        return batch
+
+    def wait(self, timeout: Optional[float] = None, spin: int = 1000) -> np.ndarray:
+        """
+        阻塞直到有新消息：先自旋 spin 次（微秒级唤醒），再逐步退避 sleep。
+        :param timeout: 超时秒数，None 表示一直等待
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        spins = 0
+        while True:
+            batch = self.poll()
+            if len(batch):
+                return batch
+            if deadline is not None and time.monotonic() >= deadline:
+                return batch
+            spins += 1
+            if spins > spin:
+                time.sleep(min(0.0001 * (spins - spin), 0.001))
+
+    def bars(self, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        逐条产出 bar dict（字段同 DataClient 回调，另带 seq 与 recv_ns），超时无数据时结束。
+        """
+        symbol = self.bus.symbol
+        while True:
+            batch = self.wait(timeout)
+            if not len(batch):
+                return
+            stamps = pd.DatetimeIndex(batch['ts_ns'].view('datetime64[ns]'))
+            recv_ns = now_ns()
+            for ts, seq, sym_id, o, h, l, c, v in zip(stamps, batch['seq'].tolist(), batch['sym_id'].tolist(),
+                                                      batch['open'].tolist(), batch['high'].tolist(),
+                                                      batch['low'].tolist(), batch['close'].tolist(),
+                                                      batch['volume'].tolist()):
+                yield {'timestamp': ts, 'symbol': symbol(sym_id), 'open': o, 'high': h, 'low': l, 'close': c,
+                       'volume': v, 'seq': seq, 'recv_ns': recv_ns}
+
+    def close(self) -> None:
+        """注销读者（释放游标槽位）"""
+        self.bus.cursors[self.consumer_id] = -1
@@ -4,7 +4,9 @@ import logging
 from dataclasses import dataclass
 import pandas as pd
 import numpy as np
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from multi_market_qt_system.core.market_calendar import MarketCalendar, UnifiedClock
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +25,7 @@ class PerformanceMetrics:
     - max_drawdown: 最大回撤
     - sortino_ratio: 年化 Sortino 比率
     - calmar_ratio: Calmar 比率
+    - trading_days: 年化因子（每年周期数）
     """
     equity_curve: pd.Series
     period_returns: pd.Series
@@ -34,6 +37,7 @@ class PerformanceMetrics:
     max_drawdown: float
     sortino_ratio: float
     calmar_ratio: float
+    trading_days: int = 252
 
     @classmethod
     def from_portfolio(
@@ -50,7 +54,9 @@ class PerformanceMetrics:
             .assign(timestamp=lambda d: pd.to_datetime(d['timestamp']))
             .set_index('timestamp')
         )
-        equity = df['total_value'].sort_index()
+        equity = df['total_value'].sort_index(kind='stable')
+        # 同一时间戳多笔成交（多信号/多策略共享账户）时取该时刻最后一次快照
+        equity = equity[~equity.index.duplicated(keep='last')]
         logger.debug("Equity series head:% s", equity.head())
 
         # —— 插入回测/首日初始净值点 —— #
@@ -73,6 +79,19 @@ class PerformanceMetrics:
             equity = equity.reindex(price_index).ffill()
             logger.debug("Equity after reindex/ffill head: %s", equity.head())
 
+        return cls.from_equity(equity, trading_days=trading_days, risk_free_rate=risk_free_rate)
+
+    @classmethod
+    def from_equity(
+            cls,
+            equity: pd.Series,
+            trading_days: int = 252,
+            risk_free_rate: float = 0.0
+    ) -> PerformanceMetrics:
+        """
+        直接由净值序列计算绩效指标（矩阵回测、拼接的样本外曲线等不经过 Portfolio 的场景）。
+        :param equity: 时间索引的净值序列
+        """
         # 3. 计算周期收益（剔除 NaN）
         period_returns = equity.pct_change(fill_method=None).dropna()
 
@@ -83,8 +102,8 @@ class PerformanceMetrics:
         total_return = equity.iloc[-1] / equity.iloc[0] - 1
 
         # 6. 年化收益率（基于日历天数折算）
-        days = max((equity.index[-1] - equity.index[0]).days, 1)
-        annual_return = (1 + total_return) ** (365.0 / days) - 1
+        days = (equity.index[-1] - equity.index[0]).total_seconds() / 86400
+        annual_return = (1 + total_return) ** (365.0 / days) - 1 if days > 0 else 0.0
 
         # 7. 年化波动率
         annual_volatility = period_returns.std() * np.sqrt(trading_days)
@@ -127,5 +146,74 @@ class PerformanceMetrics:
             sharpe_ratio=sharpe_ratio,
             max_drawdown=max_drawdown,
             sortino_ratio=sortino_ratio,
-            calmar_ratio=calmar_ratio
+            calmar_ratio=calmar_ratio,
+            trading_days=trading_days
         )
+
+    @classmethod
+    def from_equity_curves(
+            cls,
+            curves: Dict[str, pd.Series],
+            calendars: Optional[Dict[str, MarketCalendar]] = None,
+            risk_free_rate: float = 0.0
+    ) -> PerformanceMetrics:
+        """
+        等权组合多个标的（可跨市场，如美股日线与 7×24 加密货币）的净值曲线：经 UnifiedClock 合并时间线，
+        各曲线按自身起点归一后前向填充（首个 bar 之前按现金 1.0 计），年化因子按各标的日历推断。
+        :param curves: symbol -> 净值序列
+        """
+        clock = UnifiedClock.build({sym: curve.to_frame('close') for sym, curve in curves.items()}, calendars)
+        marks = clock.price_matrix()
+        first = marks[np.argmax(~np.isnan(marks), axis=0), np.arange(marks.shape[1])]
+        growth = np.nan_to_num(marks / first, nan=1.0)
+        initial = float(sum(curve.iloc[0] for curve in curves.values()))
+        equity = pd.Series(initial * growth.mean(axis=1), index=clock.index, name='equal_weight')
+        return cls.from_equity(equity, trading_days=clock.periods_per_year, risk_free_rate=risk_free_rate)
+
+    def rolling_metrics(
+            self,
+            window: int,
+            benchmark_returns: Optional[pd.Series] = None,
+            risk_free_rate: float = 0.0
+    ) -> pd.DataFrame:
+        """
+        滚动窗口绩效序列，全部基于 pandas 的单遍滑动窗口统计，总体 O(n)，适用于多年分钟级净值。
+        :param window: 窗口长度（周期数）
+        :param benchmark_returns: 基准每期收益，提供时计算滚动 beta
+        :param risk_free_rate: 年化无风险利率
+        :return: DataFrame，列为 rolling_sharpe / rolling_volatility / rolling_drawdown [/ rolling_beta]
+        """
+        if window < 2:
+            raise ValueError("window must be >= 2")
+        returns = self.period_returns
+        ann = np.sqrt(self.trading_days)
+
+        # 1. 滚动波动率与 Sharpe，口径与 from_equity 一致：窗口内净值增长按日历天数折算的年化收益 / 年化波动率
+        std = returns.rolling(window).std()
+        rolling_volatility = std * ann
+        full = self.equity_curve
+        start_value = full.shift(window).loc[returns.index]
+        start_time = pd.Series(full.index, index=full.index).shift(window).loc[returns.index]
+        days = ((returns.index.to_series() - start_time).dt.total_seconds() / 86400).where(lambda d: d > 0)
+        rolling_return = (full.loc[returns.index] / start_value) ** (365.0 / days) - 1
+        rolling_sharpe = (rolling_return - risk_free_rate) / rolling_volatility.where(rolling_volatility > 0)
+
+        # 2. 滚动回撤：相对窗口内净值高点的回撤
+        equity = full.loc[returns.index]
+        window_peak = equity.rolling(window, min_periods=1).max()
+        rolling_drawdown = equity / window_peak - 1
+
+        result = pd.DataFrame({
+            'rolling_sharpe': rolling_sharpe,
+            'rolling_volatility': rolling_volatility,
+            'rolling_drawdown': rolling_drawdown,
+        })
+
+        # 3. 滚动 beta = Cov(r, b) / Var(b)
+        if benchmark_returns is not None:
+            bench = benchmark_returns.reindex(returns.index)
+            var = bench.rolling(window).var()
+            result['rolling_beta'] = returns.rolling(window).cov(bench) / var.where(var > 0)
+
+        logger.debug("Rolling metrics computed: window=%d, rows=%d", window, len(result))
+        return result
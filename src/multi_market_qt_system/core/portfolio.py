@@ -1,38 +1,65 @@
 import logging
 from collections import defaultdict
 from datetime import datetime
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-from multi_market_qt_system.core.order import Order, OrderType
+from multi_market_qt_system.core.cost_model import CostModel, order_side
+from multi_market_qt_system.core.order import Order, OrderStyle, OrderType
+from multi_market_qt_system.core.trade_ledger import TradeLedger
 
 logger = logging.getLogger(__name__)
 
+# 只增不改的历史记录：快照只记录其长度，内容由 SnapshotManager 增量追加落盘
+HISTORY_FIELDS = ('trades', 'rejected', 'trade_log', 'round_trips')
+
 
 class Portfolio:
-    def __init__(self, cash: float):
+    def __init__(self, cash: float, cost_model: Optional[CostModel] = None, lot_method: str = 'fifo'):
+        """
+        :param cash: 初始资金
+        :param cost_model: 交易成本模型；None 时使用订单上的 commission/slippage 标量。
+            按月累计成交量分档的模型会复制一份（for_account），当月累计量只记本组合的成交
+        :param lot_method: 成交台账的批次匹配顺序 'fifo' / 'lifo'
+        """
         self.cash = cash
+        self.cost_model = cost_model.for_account() if cost_model is not None else None
         self.positions: Dict[str, int] = defaultdict(int)  # 当前持仓 symbol -> quantity
         self.trades: list[Order] = []  # 成交订单列表 已执行订单记录
         self.rejected: list[Dict] = []  # 被拒绝的订单及原因
         self.trade_log: list[Dict] = []  # 每次成交后或状态改变时的资产快照
+        self.borrow_paid: float = 0.0  # 累计融券费用
+        self._last_borrow_ts: Optional[datetime] = None
+        self.ledger = TradeLedger(method=lot_method)  # 开平回合配对与已实现盈亏统计
         logger.info("Portfolio initialized with cash: %.2f", cash)
 
     def get_position(self, symbol: str) -> int:
         return self.positions[symbol]
 
-    def execute_order(self, order: Order, market_prices: Dict[str, float]) -> None:
+    def execute_order(
+            self,
+            order: Order,
+            market_prices: Dict[str, float],
+            market_volumes: Optional[Dict[str, float]] = None
+    ) -> Optional[Tuple[float, float]]:
         """
         执行订单并更新现金、持仓。
         market_prices: 当前市价 dict。
+        market_volumes: 当前 bar 成交量 dict，成本模型计算市场冲击时使用。
+        :return: 成交时返回 (成交价, 费用)，被拒时返回 None
         """
         logger.info("Executing order: %s", order)
 
-        # 1. 计算执行价格：考虑滑点
+        # 1. 计算执行价格与费用：考虑滑点、冲击与佣金
         base_price = market_prices.get(order.symbol, order.price)
-        fill_price = base_price * (1 + order.slippage if order.order_type == OrderType.BUY else 1 - order.slippage)
-        # 2. 总成本或收益
-        notional = fill_price * order.quantity
-        fee = notional * order.commission
+        if self.cost_model is not None:
+            volume = market_volumes.get(order.symbol) if market_volumes else None
+            fill_price, fee = self.cost_model.order_cost(order, base_price, volume)
+            notional = fill_price * order.quantity
+        else:
+            fill_price = base_price * (1 + order.slippage if order.order_type == OrderType.BUY else 1 - order.slippage)
+            # 2. 总成本或收益
+            notional = fill_price * order.quantity
+            fee = notional * order.commission
 
         try:
             if order.order_type in (OrderType.BUY, OrderType.COVER):
@@ -43,8 +70,9 @@ class Portfolio:
                 self.positions[order.symbol] += order.quantity
                 logger.debug("Bought %d of %s at price %.2f, cost %.2f", order.quantity, order.symbol, fill_price, total_cost)
             elif order.order_type in (OrderType.SELL, OrderType.SHORT):
-                if self.positions[order.symbol] < order.quantity:
-                    raise ValueError("Insufficient position to SELL/SHORT")
+                # SELL 只能平多；SHORT 允许开空（持仓为负）
+                if order.order_type == OrderType.SELL and self.positions[order.symbol] < order.quantity:
+                    raise ValueError("Insufficient position to SELL")
                 self.cash += notional - fee
                 self.positions[order.symbol] -= order.quantity
                 logger.debug("Sold %d of %s at price %.2f, proceeds %.2f", order.quantity, order.symbol, fill_price, notional - fee)
@@ -56,12 +84,72 @@ class Portfolio:
                 "order": order,
                 "reason": str(e)
             })
-            return
+            return None
 
         # 成交记录
+        if self.cost_model is not None:
+            self.cost_model.on_fill(order, fill_price)
         self.trades.append(order)
+        self.ledger.record_fill(order.symbol, order_side(order.order_type), order.quantity, fill_price, fee,
+                                order.timestamp)
         # 记录快照
         self._log_state(order.timestamp, market_prices)
+        return fill_price, fee
+
+    def book_fill(
+            self,
+            timestamp: Any,
+            symbol: str,
+            action: str,
+            quantity: float,
+            price: float,
+            fee: float = 0.0,
+            market_prices: Optional[Dict[str, float]] = None
+    ) -> None:
+        """
+        按实际成交价与费用直接入账（券商回报、事件日志中的成交）：不再叠加滑点与成本模型，
+        也不做资金/持仓检查——成交已在券商侧发生，组合只负责如实记账。
+        :param action: 'BUY' / 'SELL' / 'SHORT' / 'COVER'
+        :param market_prices: 记录资产快照用的市价，默认只按成交价估值该标的
+        """
+        notional = price * quantity
+        order = Order(
+            timestamp=timestamp,
+            symbol=symbol,
+            quantity=quantity,
+            price=price,
+            order_type=OrderType[action],
+            style=OrderStyle.MARKET,
+            commission=fee / notional if notional else 0.0,
+            slippage=0.0
+        )
+        side = order_side(order.order_type)
+        self.cash -= side * notional + fee
+        self.positions[symbol] += side * quantity
+        self.trades.append(order)
+        self.ledger.record_fill(symbol, side, quantity, price, fee, timestamp)
+        self._log_state(timestamp, market_prices or {symbol: price})
+        logger.debug("Booked fill: %s %s %s @ %.4f, fee %.4f", action, quantity, symbol, price, fee)
+
+    def accrue_borrow(self, timestamp: datetime, market_prices: Dict[str, float]) -> float:
+        """
+        按上次计息至今的天数对空头市值收取融券费用（成本模型 borrow_rate 为 0 时不做任何事）。
+        :return: 本次扣除的费用
+        """
+        if self.cost_model is None or not self.cost_model.borrow_rate:
+            return 0.0
+        last, self._last_borrow_ts = self._last_borrow_ts, timestamp
+        if last is None:
+            return 0.0
+        short_notional = sum(-qty * market_prices.get(sym, 0.0) for sym, qty in self.positions.items() if qty < 0)
+        if short_notional <= 0:
+            return 0.0
+        days = (timestamp - last).total_seconds() / 86400
+        fee = self.cost_model.borrow_cost(short_notional, days)
+        self.cash -= fee
+        self.borrow_paid += fee
+        logger.debug("Borrow cost accrued: %.4f on short notional %.2f over %.2f days", fee, short_notional, days)
+        return fee
 
     def _log_state(self, timestamp: datetime, market_prices: Dict[str, float]):
         # 动态市值计算
@@ -78,16 +166,69 @@ class Portfolio:
         logger.debug("Portfolio snapshot: %s", snapshot)
 
     def summary(self) -> dict:
-        win = sum(1 for o in self.trades if o.order_type == OrderType.SELL and o.price * o.quantity > 0)
-        loss = sum(1 for o in self.trades if o.order_type == OrderType.SELL and o.price * o.quantity <= 0)
+        """组合汇总；胜负、已实现盈亏等取自成交台账的累计量，不扫描成交历史"""
         result = {
             "final_cash": self.cash,
             "positions": dict(self.positions),
             "total_trades": len(self.trades),
             "rejected_orders": len(self.rejected),
-            "winning_trades": win,
-            "losing_trades": loss
+            **self.ledger.summary()
         }
         logger.info("Portfolio summary: %s", result)
         return result
 
+    def _history(self) -> Dict[str, list]:
+        """HISTORY_FIELDS 各字段名 -> 对应的只增列表"""
+        return dict(zip(HISTORY_FIELDS, (self.trades, self.rejected, self.trade_log, self.ledger.round_trips)))
+
+    def history_len(self) -> Dict[str, int]:
+        """各只增历史记录的当前长度"""
+        return {name: len(records) for name, records in self._history().items()}
+
+    def history_since(self, offsets: Dict[str, int], lengths: Dict[str, int]) -> Dict[str, List]:
+        """
+        取出各历史记录在 [offsets, lengths) 区间新增的条目（只复制增量）。
+        :param offsets: 上次已持久化的长度
+        :param lengths: 本次快照时的长度（history_len 的结果）
+        """
+        return {name: records[offsets.get(name, 0):lengths[name]] for name, records in self._history().items()}
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        导出可持久化的组合状态：只含现金、持仓、台账批次等标量与小容器，以及各历史记录的长度，
+        开销与成交历史长短无关；历史内容见 history_since。
+        """
+        return {
+            "cash": self.cash,
+            "positions": dict(self.positions),
+            "borrow_paid": self.borrow_paid,
+            "last_borrow_ts": self._last_borrow_ts,
+            "ledger": self.ledger.get_state(include_round_trips=False),
+            "history_len": self.history_len(),
+        }
+
+    def set_state(self, state: Dict[str, Any], history: Optional[Dict[str, List]] = None) -> None:
+        """
+        从快照恢复组合状态。
+        :param history: 增量落盘的历史记录，按快照中的 history_len 截断；旧版快照自带完整历史时忽略
+        """
+        self.cash = state["cash"]
+        self.positions = defaultdict(int, state["positions"])
+        self.borrow_paid = state.get("borrow_paid", 0.0)
+        self._last_borrow_ts = state.get("last_borrow_ts")
+        if "ledger" in state:
+            self.ledger.set_state(state["ledger"])
+        if "history_len" in state:
+            history = history or {}
+            restored = {name: list(history.get(name, []))[:n] for name, n in state["history_len"].items()}
+            missing = {name: n - len(restored[name]) for name, n in state["history_len"].items()
+                       if len(restored[name]) < n}
+            if missing:
+                logger.warning("Portfolio history incomplete on restore, missing records: %s", missing)
+        else:
+            restored = {name: list(state.get(name, [])) for name in ('trades', 'rejected', 'trade_log')}
+            restored["round_trips"] = self.ledger.round_trips
+        self.trades, self.rejected, self.trade_log, self.ledger.round_trips = (
+            restored.get(name, []) for name in HISTORY_FIELDS)
+        logger.info("Portfolio state restored: cash=%.2f, positions=%s", self.cash, dict(self.positions))
+
@@ -1,7 +1,8 @@
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Dict, Any, Union, List, Callable, Tuple
+from typing import Dict, Any, Union, List, Callable, Optional, Tuple
 import logging
+from multi_market_qt_system.core.latency import MetricsRegistry, now_ns
 from multi_market_qt_system.core.order import OrderType
 
 logger = logging.getLogger(__name__)
@@ -28,6 +29,8 @@ class RiskManager:
         self.daily_loss: float = 0.0
         self.daily_trades: int = 0
         self.custom_rules: List[Callable] = []  # List of (order, portfolio) -> (bool, reason)
+        self.metrics: Optional[MetricsRegistry] = None  # 实盘时通过 attach_metrics 注入，记录风控耗时
+        self.order_state = None  # 实盘时通过 attach_order_state 注入 OrderStateStore
 
         logger.info("RiskManager initialized with limits: %s", limits)
 
@@ -36,35 +39,87 @@ class RiskManager:
         self.custom_rules.append(rule_func)
         logger.debug("Custom rule registered: %s", rule_func)
 
+    def attach_metrics(self, metrics: MetricsRegistry) -> None:
+        """注入指标注册表，并预先取好各指标句柄"""
+        self.metrics = metrics
+        self._stage_hist = metrics.histogram('stage_latency_seconds', 'Pipeline stage latency', stage='risk')
+        self._pass_counter = metrics.counter('risk_checks_total', 'Risk checks', result='pass')
+        self._reject_counter = metrics.counter('risk_checks_total', 'Risk checks', result='reject')
+
+    def attach_order_state(self, order_state) -> None:
+        """
+        注入实盘订单状态缓存：持仓限制改为按 券商持仓 + 在途买单 计算（O(1) 查询），
+        避免回报到达前连续下单突破上限。
+        """
+        self.order_state = order_state
+
     def validate(self, order, market_price: Dict[str, float], portfolio) -> bool:
+        if self.metrics is None:
+            return self._validate(order, market_price, portfolio)
+        t0 = now_ns()
+        ok = self._validate(order, market_price, portfolio)
+        self._stage_hist.record(now_ns() - t0)
+        (self._pass_counter if ok else self._reject_counter).inc()
+        return ok
+
+    def _validate(self, order, market_price: Dict[str, float], portfolio) -> bool:
         logger.debug("Validating order: %s", order)
-        now = order.timestamp
-        # 当日初始
-        if self.current_date != now:
-            self.current_date = now
+        self._roll_day(order.timestamp)
+
+        # 1. 持仓量限制
+        if self.order_state is not None:
+            pos = self.order_state.max_long(order.symbol)
+        else:
+            pos = portfolio.get_position(order.symbol)
+        if not self._check_position(order, pos):
+            return False
+
+        # 2~4. 回撤、当日累计亏损与交易次数
+        if not self._check_account(order, self._projected_equity(market_price, portfolio)):
+            return False
+
+        # 5. 自定义风控规则
+        return self._check_custom_rules(order, portfolio)
+
+    def settle(self, order) -> None:
+        """
+        通过风控的订单撮合入账、登记下单或放弃后调用，释放风控为它预留的额度；基础风控不做预留，无操作。
+        """
+        pass
+
+    def _roll_day(self, now) -> None:
+        """当日初始：日期变化时重置当日亏损与交易次数（按日期比较，同一天内的多根 bar 不重置）"""
+        day = now.date() if hasattr(now, 'date') else now
+        if self.current_date != day:
+            self.current_date = day
             self.daily_loss = 0.0
             self.daily_trades = 0
             logger.debug("Date changed, reset daily loss and trades")
 
-        # 1. 持仓量限制
-        pos = portfolio.get_position(order.symbol)
+    def _check_position(self, order, pos: float) -> bool:
         if order.order_type == OrderType.BUY and pos + order.quantity > self.limits.max_position:
             logger.warning("Position limit breached for %s: %d+%d>%d", order.symbol, pos, order.quantity, self.limits.max_position)
             return False
+        return True
 
-        # 2. 预计成交后净值及回撤
+    @staticmethod
+    def _projected_equity(market_price: Dict[str, float], portfolio) -> float:
+        """预计成交后净值"""
         projected_equity = portfolio.cash
-        for sym, qty in portfolio.positions.items():
-            # price = order.price if sym == order.symbol else portfolio.positions[sym]
+        for sym, qty in list(portfolio.positions.items()):
             price = market_price.get(sym, 0.0)
             projected_equity += qty * price
+        return projected_equity
+
+    def _check_account(self, order, projected_equity: float) -> bool:
+        """账户级限制：回撤、当日累计亏损、当日交易次数（会更新 peak_equity 与当日累计值）"""
         self.peak_equity = max(self.peak_equity, projected_equity)
         drawdown = (self.peak_equity - projected_equity) / self.peak_equity
         if drawdown > self.limits.max_drawdown:
             logger.warning("Drawdown limit breached: %.2%>%.2%", drawdown, self.limits.max_drawdown)
             return False
 
-        # 3. 当日累计亏损
+        # 当日累计亏损
         pnl = (-order.price * order.quantity) if order.order_type in (OrderType.BUY,) else (
                     order.price * order.quantity)
         self.daily_loss += pnl
@@ -72,17 +127,34 @@ class RiskManager:
             logger.warning("Daily loss limit breached: %s>%s", abs(self.daily_loss), self.limits.max_daily_loss)
             return False
 
-        # 4. 当日交易次数
+        # 当日交易次数
         self.daily_trades += 1
         if self.limits.max_daily_trades is not None and self.daily_trades > self.limits.max_daily_trades:
             logger.warning("Daily trades limit breached: %d>%d", self.daily_trades, self.limits.max_daily_trades)
             return False
+        return True
 
-        # 5. 自定义风控规则
+    def _check_custom_rules(self, order, portfolio) -> bool:
         for rule in self.custom_rules:
             ok, reason = rule(order, portfolio)
             if not ok:
                 logger.warning("Custom rule blocked: %s", reason)
                 return False
-
         return True
+
+    def get_state(self) -> Dict[str, Any]:
+        """导出日内风控状态（不含 limits 与自定义规则，它们由配置重建）。"""
+        return {
+            "start_equity": self.start_equity,
+            "peak_equity": self.peak_equity,
+            "current_date": self.current_date,
+            "daily_loss": self.daily_loss,
+            "daily_trades": self.daily_trades,
+        }
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """从快照恢复日内风控状态。"""
+        for key in ("start_equity", "peak_equity", "current_date", "daily_loss", "daily_trades"):
+            setattr(self, key, state[key])
+        logger.info("RiskManager state restored: peak_equity=%.2f, daily_loss=%.2f, daily_trades=%d",
+                    self.peak_equity, self.daily_loss, self.daily_trades)
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Literal, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('total_return', 'annual_return', 'annual_volatility', 'sharpe_ratio', 'sortino_ratio', 'max_drawdown')
+# 重排只改变顺序：收益率、波动率、Sharpe、Sortino 对任何排列都不变，只有路径依赖指标有分布
+PATH_METRICS = ('max_drawdown',)
+
+
+@dataclass
+class RobustnessReport:
+    """
+    重采样稳健性分析结果：
+    - method: 'block' (循环块自助法)、'reshuffle' (收益重排) 或 'trades' (回合盈亏重排/自助，见 resample_trades)
+    - n_resamples: 重采样次数
+    - distributions: 指标名 -> 每次重采样的指标值 (ndarray)
+    """
+    method: str
+    n_resamples: int
+    distributions: Dict[str, np.ndarray]
+
+    def confidence_interval(self, metric: str, level: float = 0.95) -> Tuple[float, float]:
+        """
+        百分位置信区间
+        :param metric: 指标名，见 METRICS
+        :param level: 置信水平
+        """
+        alpha = (1 - level) / 2
+        lo, hi = np.nanquantile(self.distributions[metric], [alpha, 1 - alpha])
+        return float(lo), float(hi)
+
+    def summary(self, level: float = 0.95) -> pd.DataFrame:
+        """各指标的均值、标准差与置信区间"""
+        rows = {}
+        for name, dist in self.distributions.items():
+            lo, hi = self.confidence_interval(name, level)
+            rows[name] = {'mean': np.nanmean(dist), 'std': np.nanstd(dist), 'ci_low': lo, 'ci_high': hi}
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+
+def _batch_metrics(
+        samples: np.ndarray,
+        trading_days: int,
+        years: float,
+        risk_free_rate: float
+) -> Dict[str, np.ndarray]:
+    """
+    对 B×n 的收益矩阵逐行计算指标，口径与 PerformanceMetrics.from_equity 一致。
+    """
+    growth = np.cumprod(1 + samples, axis=1)
+    total_return = growth[:, -1] - 1
+    annual_return = (1 + total_return) ** (1 / years) - 1
+    annual_volatility = samples.std(axis=1, ddof=1) * np.sqrt(trading_days)
+    downside_vol = np.minimum(samples, 0).std(axis=1, ddof=1) * np.sqrt(trading_days)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(annual_volatility > 0, (annual_return - risk_free_rate) / annual_volatility, np.nan)
+        sortino = np.where(downside_vol > 0, (annual_return - risk_free_rate) / downside_vol, np.nan)
+    # 净值从 1 起算，回撤需把初始点纳入峰值
+    peak = np.maximum(np.maximum.accumulate(growth, axis=1), 1.0)
+    max_drawdown = ((growth - peak) / peak).min(axis=1)
+    return {
+        'total_return': total_return,
+        'annual_return': annual_return,
+        'annual_volatility': annual_volatility,
+        'sharpe_ratio': sharpe,
+        'sortino_ratio': sortino,
+        'max_drawdown': max_drawdown,
+    }
+
+
+def _resample_chunk(
+        returns: np.ndarray,
+        size: int,
+        method: str,
+        block_size: int,
+        seed: np.random.SeedSequence,
+        trading_days: int,
+        years: float,
+        risk_free_rate: float
+) -> Dict[str, np.ndarray]:
+    """生成一块 size×n 的重采样并计算指标（可在子进程中执行）。"""
+    rng = np.random.default_rng(seed)
+    n = len(returns)
+    if method == 'block':
+        n_blocks = -(-n // block_size)
+        starts = rng.integers(0, n, size=(size, n_blocks))
+        idx = (starts[:, :, None] + np.arange(block_size)) % n
+        samples = returns[idx.reshape(size, -1)[:, :n]]
+    else:
+        samples = rng.permuted(np.broadcast_to(returns, (size, n)), axis=1)
+    return _batch_metrics(samples, trading_days, years, risk_free_rate)
+
+
+def bootstrap_metrics(
+        period_returns: pd.Series,
+        n_resamples: int = 10_000,
+        method: Literal['block', 'reshuffle'] = 'block',
+        block_size: Optional[int] = None,
+        chunk_size: int = 1_000,
+        n_jobs: int = 1,
+        trading_days: int = 252,
+        risk_free_rate: float = 0.0,
+        seed: Optional[int] = None,
+        years: Optional[float] = None
+) -> RobustnessReport:
+    """
+    对每期收益做批量重采样，得到 Sharpe / Sortino / 最大回撤等指标的分布。
+    :param period_returns: PerformanceMetrics.period_returns
+    :param n_resamples: 重采样次数
+    :param method: 'block' 循环块自助法（保留自相关）；'reshuffle' 每期收益顺序重排，
+        只有路径依赖指标（最大回撤）有意义，结果只含 PATH_METRICS；按交易重排见 resample_trades
+    :param block_size: 块长度，默认 n^(1/3)
+    :param chunk_size: 每块重采样数，峰值内存约为 chunk_size×n×8 字节的数倍
+    :param n_jobs: 并行进程数，1 表示在当前进程中计算
+    :param trading_days: 年化因子
+    :param seed: 随机种子，相同种子与 chunk_size 下结果可复现（与 n_jobs 无关）
+    :param years: 年化用的年数，默认由收益序列推断（见 bootstrap_performance 直接取净值跨度）
+    """
+    if method not in ('block', 'reshuffle'):
+        raise ValueError(f"Unknown resampling method: {method}")
+    returns = period_returns.dropna().to_numpy(dtype=np.float64)
+    if len(returns) < 2:
+        raise ValueError("At least two period returns are required")
+    if block_size is None:
+        block_size = max(1, int(round(len(returns) ** (1 / 3))))
+    if years is None:
+        # 收益序列比净值少首个点：跨度向前补一个（中位）周期，与 from_equity 按净值首尾折算同口径；
+        # 无时间索引时按 trading_days 推算
+        index = period_returns.dropna().index
+        if isinstance(index, pd.DatetimeIndex):
+            span = index[-1] - index[0] + pd.Series(index).diff().median()
+            days = max(span.days, 1)
+        else:
+            days = len(returns) * 365.0 / trading_days
+        years = days / 365.0
+
+    sizes = [min(chunk_size, n_resamples - i) for i in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [(returns, size, method, block_size, s, trading_days, years, risk_free_rate)
+            for size, s in zip(sizes, seeds)]
+    logger.info("Bootstrap started: method=%s, n_resamples=%d, block_size=%d, chunks=%d, n_jobs=%d",
+                method, n_resamples, block_size, len(sizes), n_jobs)
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            parts = list(pool.map(_resample_chunk, *zip(*args)))
+    else:
+        parts = [_resample_chunk(*a) for a in args]
+
+    metrics = PATH_METRICS if method == 'reshuffle' else METRICS
+    distributions = {m: np.concatenate([p[m] for p in parts]) for m in metrics}
+    logger.info("Bootstrap completed: max_drawdown median=%.2f%%", np.nanmedian(distributions['max_drawdown']) * 100)
+    return RobustnessReport(method=method, n_resamples=n_resamples, distributions=distributions)
+
+
+def bootstrap_performance(perf, **kwargs) -> RobustnessReport:
+    """
+    对回测结果做 bootstrap_metrics，年化因子与年数直接取自 PerformanceMetrics（净值首尾跨度），与点估计同口径。
+    :param perf: PerformanceMetrics
+    :param kwargs: 透传给 bootstrap_metrics
+    """
+    equity = perf.equity_curve
+    years = max((equity.index[-1] - equity.index[0]).days, 1) / 365.0
+    kwargs.setdefault('trading_days', perf.trading_days)
+    return bootstrap_metrics(perf.period_returns, years=years, **kwargs)
+
+
+def _longest_run(mask: np.ndarray) -> np.ndarray:
+    """B×m 布尔矩阵逐行最长连续 True 长度"""
+    count = np.cumsum(mask, axis=1)
+    reset = np.maximum.accumulate(np.where(mask, 0, count), axis=1)
+    return (count - reset).max(axis=1)
+
+
+def _trade_chunk(
+        pnl: np.ndarray,
+        size: int,
+        replace: bool,
+        seed: np.random.SeedSequence,
+        initial_capital: float
+) -> Dict[str, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    m = len(pnl)
+    if replace:
+        samples = pnl[rng.integers(0, m, size=(size, m))]
+    else:
+        samples = rng.permuted(np.broadcast_to(pnl, (size, m)), axis=1)
+    equity = initial_capital + np.cumsum(samples, axis=1)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), initial_capital)
+    result = {
+        'max_drawdown': ((equity - peak) / peak).min(axis=1),
+        'max_consecutive_losses': _longest_run(samples < 0).astype(np.float64),
+    }
+    if replace:
+        result['total_return'] = equity[:, -1] / initial_capital - 1
+    return result
+
+
+def resample_trades(
+        round_trips: Sequence,
+        initial_capital: float,
+        n_resamples: int = 10_000,
+        replace: bool = False,
+        chunk_size: int = 1_000,
+        seed: Optional[int] = None
+) -> RobustnessReport:
+    """
+    按开平回合（TradeLedger.round_trips，按平仓顺序）的净盈亏序列做重采样，检验结果对交易顺序/交易样本的敏感度。
+    replace=False 时为顺序重排：总盈亏不变，只有最大回撤与最长连亏有分布；
+    replace=True 时为有放回抽样（交易自助法），总收益也有分布。
+    :param round_trips: RoundTrip 序列，需要台账保留回合明细（keep_round_trips=True）
+    :param initial_capital: 初始资金，盈亏按金额累加到该净值上
+    :param n_resamples: 重采样次数
+    """
+    pnl = np.fromiter((rt.pnl for rt in round_trips), dtype=np.float64)
+    if len(pnl) < 2:
+        raise ValueError("At least two round trips are required")
+    sizes = [min(chunk_size, n_resamples - i) for i in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    logger.info("Trade resampling started: %d round trips, n_resamples=%d, replace=%s", len(pnl), n_resamples, replace)
+    parts = [_trade_chunk(pnl, size, replace, s, initial_capital) for size, s in zip(sizes, seeds)]
+    distributions = {m: np.concatenate([p[m] for p in parts]) for m in parts[0]}
+    logger.info("Trade resampling completed: max_drawdown median=%.2f%%",
+                np.nanmedian(distributions['max_drawdown']) * 100)
+    return RobustnessReport(method='trades', n_resamples=n_resamples, distributions=distributions)
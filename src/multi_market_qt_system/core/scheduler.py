@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import heapq
+import logging
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import date, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from multi_market_qt_system.core.market_calendar import MarketCalendar
+
+logger = logging.getLogger(__name__)
+
+NEVER = 2 ** 63 - 1  # 堆为空时的 next_ns，任何 bar 时间戳都小于它
+
+
+def _ns(ts: Any) -> int:
+    return pd.Timestamp(ts).value
+
+
+def _localize(ts: pd.Timestamp, tz) -> pd.Timestamp:
+    """把时间对齐到行情时间戳的时区约定：无时区的按 tz 本地时间解释，带时区的换算到 tz（tz 为 None 时换成 UTC 无时区）"""
+    if ts.tz is None:
+        # 夏令时切换日不存在的本地时刻顺延，重复的本地时刻取第一次
+        return ts if tz is None else ts.tz_localize(tz, ambiguous=True, nonexistent='shift_forward')
+    return ts.tz_convert(tz) if tz is not None else ts.tz_convert('UTC').tz_localize(None)
+
+
+def _from_ns(value: int, tz) -> pd.Timestamp:
+    stamp = pd.Timestamp(value)
+    return stamp if tz is None else stamp.tz_localize('UTC').tz_convert(tz)
+
+
+class ScheduleRule(ABC):
+    """周期规则：给定时间点，返回严格晚于它的下一次触发时间（None 表示不再触发）"""
+
+    @abstractmethod
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        ...
+
+
+def _is_session_day(calendar: Optional[MarketCalendar], day: date) -> bool:
+    """无日历时每个自然日都算；否则按日历的交易星期与节假日判断"""
+    if calendar is None:
+        return True
+    return day.weekday() in calendar.weekdays and day not in calendar.holidays
+
+
+def _next_day_at(ts: pd.Timestamp, at: time, accept: Callable[[date], bool]) -> pd.Timestamp:
+    """从 ts 当天起逐日查找第一个满足 accept 且 (日期 + at) > ts 的时刻；ts 带时区时日期与 at 均按该时区本地时间"""
+    day = ts.date()
+    for _ in range(3660):
+        if accept(day):
+            candidate = _localize(pd.Timestamp.combine(day, at), ts.tz)
+            if candidate > ts:
+                return candidate
+        day += timedelta(days=1)
+    raise ValueError("No matching day within ten years; check the calendar")
+
+
+@dataclass(frozen=True)
+class Once(ScheduleRule):
+    """只在 at 触发一次（无时区的 at 按行情时间戳的时区解释）"""
+    at: Any
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        at = _localize(pd.Timestamp(self.at), ts.tz)
+        return at if at > ts else None
+
+
+@dataclass(frozen=True)
+class Every(ScheduleRule):
+    """固定间隔：在 anchor + k × interval 处触发（默认以零点对齐，如每 15 分钟的整刻）"""
+    interval: timedelta
+    anchor: Any = '1970-01-01'
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        step = pd.Timedelta(self.interval).value
+        anchor = _ns(self.anchor)
+        k = (ts.value - anchor) // step + 1
+        return _from_ns(anchor + k * step, ts.tz)
+
+
+@dataclass(frozen=True)
+class Daily(ScheduleRule):
+    """每个交易日的 at 时刻（如收盘前平仓、日终风控清算）"""
+    at: time = time(0, 0)
+    calendar: Optional[MarketCalendar] = None
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        return _next_day_at(ts, self.at, lambda d: _is_session_day(self.calendar, d))
+
+
+@dataclass(frozen=True)
+class Weekly(ScheduleRule):
+    """每周 weekday（0=周一）的 at 时刻，遇节假日顺延到当周下一个交易日"""
+    weekday: int = 0
+    at: time = time(0, 0)
+    calendar: Optional[MarketCalendar] = None
+
+    def _accept(self, day: date) -> bool:
+        if not _is_session_day(self.calendar, day) or day.weekday() < self.weekday:
+            return False
+        # 当周 weekday 及之后、本日之前没有交易日，本日即为该周的触发日
+        monday = day - timedelta(days=day.weekday())
+        first = monday + timedelta(days=self.weekday)
+        return all(not _is_session_day(self.calendar, first + timedelta(days=i)) for i in range((day - first).days))
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        return _next_day_at(ts, self.at, self._accept)
+
+
+@dataclass(frozen=True)
+class MonthStart(ScheduleRule):
+    """每月第一个交易日的 at 时刻"""
+    at: time = time(0, 0)
+    calendar: Optional[MarketCalendar] = None
+
+    def _accept(self, day: date) -> bool:
+        if not _is_session_day(self.calendar, day):
+            return False
+        return all(not _is_session_day(self.calendar, day.replace(day=i)) for i in range(1, day.day))
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        return _next_day_at(ts, self.at, self._accept)
+
+
+@dataclass(frozen=True)
+class MonthEnd(ScheduleRule):
+    """每月最后一个交易日的 at 时刻（如月末调仓）"""
+    at: time = time(0, 0)
+    calendar: Optional[MarketCalendar] = None
+
+    def _accept(self, day: date) -> bool:
+        if not _is_session_day(self.calendar, day):
+            return False
+        nxt = day + timedelta(days=1)
+        while nxt.month == day.month:
+            if _is_session_day(self.calendar, nxt):
+                return False
+            nxt += timedelta(days=1)
+        return True
+
+    def next_after(self, ts: pd.Timestamp) -> Optional[pd.Timestamp]:
+        return _next_day_at(ts, self.at, self._accept)
+
+
+@dataclass(eq=False)
+class ScheduledEvent:
+    """已登记的定时事件，可用 EventScheduler.cancel 取消"""
+    callback: Callable[[pd.Timestamp], None]
+    name: str
+    priority: int = 0
+    rule: Optional[ScheduleRule] = None
+    when_ns: int = NEVER
+    cancelled: bool = field(default=False, repr=False)
+
+
+class EventScheduler:
+    """
+    定时事件调度器：最小堆按 (触发时间, 优先级, 登记顺序) 排列回调，随行情时间推进。
+    行情循环在处理每根 bar 之前调用 advance_to(bar 时间)：时间不晚于该 bar 的事件按顺序先触发，
+    没有到期事件时只需一次整数比较（next_ns），每次触发为 O(log n)，不再需要每个策略每根 bar 轮询。
+    周期事件触发后按规则计算下一次时间重新入堆；取消为惰性删除。
+    行情时间戳带时区时，回调收到的时间与规则计算均使用该时区。
+    get_state/set_state 导出与恢复待触发事件（回调按名称重新绑定），供实盘快照热重启使用。
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int, int, ScheduledEvent]] = []
+        self._seq = 0
+        self._pending: List[ScheduledEvent] = []  # 尚无当前时间时登记的周期事件，首次推进时计算触发时间
+        self.now: Optional[pd.Timestamp] = None
+        self.fired = 0
+        self._tz = None  # 行情时间戳的时区，首次推进时确定
+
+    def __len__(self) -> int:
+        return sum(1 for *_, ev in self._heap if not ev.cancelled) + len(self._pending)
+
+    @property
+    def next_ns(self) -> int:
+        """最早待触发事件的纳秒时间戳，没有时为 NEVER；有待定的周期事件时为最小值，使下一次推进必然发生"""
+        if self._pending:
+            return -NEVER
+        return self._heap[0][0] if self._heap else NEVER
+
+    def _push(self, event: ScheduledEvent, when: pd.Timestamp) -> None:
+        event.when_ns = when.value
+        self._seq += 1
+        heapq.heappush(self._heap, (event.when_ns, event.priority, self._seq, event))
+
+    def schedule_at(self, when: Any, callback: Callable[[pd.Timestamp], None], name: str = None,
+                    priority: int = 0) -> ScheduledEvent:
+        """
+        登记一次性事件。
+        :param when: 触发时间（无时区时按行情时间戳的时区解释）
+        :param callback: callback(触发时间)；快照恢复时按 name 重新绑定，需要跨重启保留的定时器应使用策略方法
+        :param priority: 同一时刻多个事件时数值小的先触发
+        """
+        event = ScheduledEvent(callback, name or getattr(callback, '__name__', 'event'), priority)
+        self._push(event, _localize(pd.Timestamp(when), self._tz))
+        return event
+
+    def schedule(self, rule: ScheduleRule, callback: Callable[[pd.Timestamp], None], name: str = None,
+                 priority: int = 0, start: Any = None) -> ScheduledEvent:
+        """
+        登记周期事件。
+        :param rule: 周期规则，如 MonthEnd(time(15, 55), calendar)
+        :param start: 从该时间之后开始计算（含该时刻）；默认为当前时间，尚未推进过时为首次推进到的时间
+        """
+        event = ScheduledEvent(callback, name or getattr(callback, '__name__', 'event'), priority, rule)
+        ref = start if start is not None else self.now
+        if ref is None:
+            self._pending.append(event)
+        else:
+            self._schedule_next(event, _localize(pd.Timestamp(ref), self._tz) - pd.Timedelta(1, 'ns'))
+        return event
+
+    def _schedule_next(self, event: ScheduledEvent, after: pd.Timestamp) -> None:
+        when = event.rule.next_after(after)
+        if when is not None:
+            self._push(event, when)
+
+    def cancel(self, event: ScheduledEvent) -> None:
+        event.cancelled = True
+        if event in self._pending:
+            self._pending.remove(event)
+
+    def advance_to(self, ts: Any) -> int:
+        """
+        触发所有时间不晚于 ts 的事件（回调中新登记的到期事件也会在本次触发）。
+        :return: 本次触发的事件数
+        """
+        ts = pd.Timestamp(ts)
+        self._tz = ts.tz
+        if self._pending:
+            pending, self._pending = self._pending, []
+            for event in pending:
+                self._schedule_next(event, ts - pd.Timedelta(1, 'ns'))
+        target = ts.value
+        heap = self._heap
+        fired = 0
+        while heap and heap[0][0] <= target:
+            when_ns, _, _, event = heapq.heappop(heap)
+            if event.cancelled:
+                continue
+            when = _from_ns(when_ns, self._tz)
+            self.now = when
+            logger.debug("Firing scheduled event %s at %s", event.name, when)
+            event.callback(when)
+            fired += 1
+            if event.rule is not None and not event.cancelled:
+                self._schedule_next(event, when)
+        self.now = ts
+        self.fired += fired
+        return fired
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        导出调度状态：当前时间与所有待触发事件（名称、触发时间、优先级、周期规则），不含回调本身。
+        """
+        events = [(ev.name, when_ns, ev.priority, ev.rule)
+                  for when_ns, _, _, ev in sorted(self._heap) if not ev.cancelled]
+        events += [(ev.name, None, ev.priority, ev.rule) for ev in self._pending]
+        return {'now': self.now, 'tz': self._tz, 'fired': self.fired, 'events': events}
+
+    def set_state(self, state: Dict[str, Any], resolve: Callable[[str], Optional[Callable]]) -> None:
+        """
+        从快照恢复调度状态。已登记的同名周期事件（通常由 schedule_events 重新登记）沿用快照中的下一次触发时间，
+        快照中其余事件（运行中登记的一次性定时器等）用 resolve(名称) 重新绑定回调，无法绑定的丢弃并告警。
+        :param state: get_state 导出的 dict
+        :param resolve: 名称 -> 回调，如 StrategyBase.resolve_timer
+        """
+        self._tz = state.get('tz')
+        self.now = state.get('now')
+        self.fired = state.get('fired', 0)
+        registered: Dict[str, List[ScheduledEvent]] = {}
+        for ev in self._pending:
+            registered.setdefault(ev.name, []).append(ev)
+        for name, when_ns, priority, rule in state.get('events', []):
+            same = registered.get(name)
+            if rule is not None and same:
+                event = same.pop(0)
+                self._pending.remove(event)
+            else:
+                callback = resolve(name)
+                if callback is None:
+                    logger.warning("Dropping scheduled event %s on restore: no callback with that name", name)
+                    continue
+                event = ScheduledEvent(callback, name, priority, rule)
+            if when_ns is None:
+                self._pending.append(event)
+            else:
+                self._push(event, _from_ns(when_ns, self._tz))
+        logger.info("Scheduler state restored: %d events, now=%s", len(self), self.now)
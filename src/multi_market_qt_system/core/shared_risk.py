@@ -0,0 +1,89 @@
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from typing import Any, Dict
+
+from multi_market_qt_system.core.order import OrderType
+from multi_market_qt_system.core.risk_manager import RiskLimits, RiskManager
+
+logger = logging.getLogger(__name__)
+
+
+class SharedRiskManager(RiskManager):
+    """
+    多策略共享同一账户时使用的线程安全风控：
+    - 按标的分段加锁（lock striping），不同标的的检查互不阻塞；同一标的的持仓检查与额度预留串行；
+    - 账户级限制（回撤、当日亏损、当日交易次数）在一个很短的全局临界区内原子地“检查并占用”，
+      临界区内只有几次算术运算，不调用自定义规则或读取组合；
+    - 通过持仓检查的买单会预留数量，直到调用 settle() 确认成交或撤单，避免并发下单共同突破持仓上限；
+    - 接入实盘订单状态缓存（attach_order_state）后持仓按 券商持仓 + 在途买单 计，与 RiskManager 一致，
+      预留只覆盖风控通过到订单登记（on_submit）之间的窗口，登记后即应 settle。
+    单线程使用时决策与 RiskManager 完全一致（前提是每次撮合或登记后调用 settle）。
+    """
+
+    def __init__(self, limits: RiskLimits, stripes: int = 64):
+        """
+        :param stripes: 标的锁分段数
+        """
+        super().__init__(limits)
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._global_lock = threading.Lock()
+        self._symbol_locks: Dict[str, threading.Lock] = {}  # 标的 -> 分段锁的缓存，省去每次哈希
+        self._reserved: Dict[str, float] = defaultdict(float)  # 已通过风控、尚未成交的买入数量
+
+    def _stripe(self, symbol: str) -> threading.Lock:
+        lock = self._symbol_locks.get(symbol)
+        if lock is None:
+            lock = self._stripes[zlib.crc32(symbol.encode('utf-8')) % len(self._stripes)]
+            self._symbol_locks[symbol] = lock
+        return lock
+
+    def _validate(self, order, market_price: Dict[str, float], portfolio) -> bool:
+        logger.debug("Validating order (shared): %s", order)
+        is_buy = order.order_type == OrderType.BUY
+        with self._stripe(order.symbol):
+            # 1. 持仓量限制（含在途买单与已通过风控、尚未登记的买单）
+            if self.order_state is not None:
+                pos = self.order_state.max_long(order.symbol)
+            else:
+                pos = portfolio.get_position(order.symbol)
+            pos += self._reserved[order.symbol]
+            if not self._check_position(order, pos):
+                return False
+
+            # 2~4. 账户级限制：净值估算在锁外完成，全局临界区内只做检查与累计
+            equity = self._projected_equity(market_price, portfolio)
+            with self._global_lock:
+                self._roll_day(order.timestamp)
+                if not self._check_account(order, equity):
+                    return False
+
+            # 5. 自定义风控规则（可能较慢，只持有本标的的分段锁）
+            if not self._check_custom_rules(order, portfolio):
+                return False
+
+            if is_buy:
+                self._reserved[order.symbol] += order.quantity
+        return True
+
+    def settle(self, order) -> None:
+        """
+        订单成交入账或撤单后释放预留数量（对未预留的订单调用无副作用）。
+        """
+        if order.order_type != OrderType.BUY:
+            return
+        with self._stripe(order.symbol):
+            left = self._reserved[order.symbol] - order.quantity
+            if left > 0:
+                self._reserved[order.symbol] = left
+            else:
+                self._reserved.pop(order.symbol, None)
+
+    def get_state(self) -> Dict[str, Any]:
+        with self._global_lock:
+            return super().get_state()
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        with self._global_lock:
+            super().set_state(state)
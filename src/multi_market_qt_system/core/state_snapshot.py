@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+@dataclass
+class StateSnapshot:
+    """
+    实盘状态快照：
+    - last_seq: 快照时已处理的最后一个事件序号（重启后只重放其后的事件）
+    - last_timestamp: 最后一个事件的行情时间
+    - strategy / portfolio / risk: 各组件 get_state() 的导出结果（组合只含标量、持仓与历史长度）
+    - scheduler: 定时事件调度器的 get_state()（待触发事件），旧快照或未传入调度器时为 None
+    """
+    version: int
+    created_at: float
+    last_seq: int
+    last_timestamp: Any
+    strategy: Dict[str, Any]
+    portfolio: Dict[str, Any]
+    risk: Dict[str, Any]
+    scheduler: Optional[Dict[str, Any]] = None
+
+
+class SnapshotManager:
+    """
+    周期性二进制快照：热路径只做一次浅拷贝取状态，
+    序列化与落盘（临时文件 + fsync + os.replace 原子替换）在后台线程完成。
+    组合的只增历史（成交、拒单、资产快照、开平回合）不进快照，每次只把上次快照之后的增量追加到 history.pkl，
+    快照大小与抓取开销不随运行时间增长；恢复时按快照记录的长度截取。
+    """
+
+    def __init__(
+            self,
+            directory: str,
+            interval_seconds: float = 60.0,
+            every_n_events: Optional[int] = None,
+            keep: int = 3
+    ) -> None:
+        """
+        :param directory: 快照目录
+        :param interval_seconds: 两次快照之间的最小间隔（秒）
+        :param every_n_events: 每处理 N 个事件强制快照一次，None 表示只按时间
+        :param keep: 保留最近多少个快照文件
+        """
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.interval_seconds = interval_seconds
+        self.every_n_events = every_n_events
+        self.keep = max(1, keep)
+        self._last_time = time.monotonic()
+        self._events_since = 0
+        self._history_path = self.directory / 'history.pkl'
+        self._history_offsets: Dict[str, int] = {}  # 已提交写盘的各历史记录长度
+        # 只保留最新一份待写快照，写盘慢时旧快照被覆盖（其历史增量并入新快照，不会丢失）
+        self._pending: queue.Queue = queue.Queue(maxsize=1)
+        self._writer = threading.Thread(target=self._write_loop, name="snapshot-writer", daemon=True)
+        self._writer.start()
+        logger.info("SnapshotManager initialized: dir=%s, interval=%ss, every_n_events=%s",
+                    self.directory, interval_seconds, every_n_events)
+
+    # —— 热路径 —— #
+    def maybe_snapshot(self, seq: int, timestamp: Any, strategy, portfolio, risk_manager, scheduler=None) -> bool:
+        """
+        在每个事件处理完成后调用，满足时间/事件数条件时提交快照。
+        :return: 是否提交了快照
+        """
+        self._events_since += 1
+        now = time.monotonic()
+        due = now - self._last_time >= self.interval_seconds
+        if self.every_n_events is not None and self._events_since >= self.every_n_events:
+            due = True
+        if not due:
+            return False
+        self.snapshot(seq, timestamp, strategy, portfolio, risk_manager, scheduler)
+        return True
+
+    def snapshot(self, seq: int, timestamp: Any, strategy, portfolio, risk_manager, scheduler=None) -> None:
+        """立即抓取状态并交给后台线程写盘。"""
+        lengths = portfolio.history_len()
+        history = portfolio.history_since(self._history_offsets, lengths)
+        self._history_offsets = lengths
+        snap = StateSnapshot(
+            version=SNAPSHOT_VERSION,
+            created_at=time.time(),
+            last_seq=seq,
+            last_timestamp=timestamp,
+            strategy=strategy.get_state(),
+            portfolio=portfolio.get_state(),
+            risk=risk_manager.get_state(),
+            scheduler=scheduler.get_state() if scheduler is not None else None
+        )
+        self._last_time = time.monotonic()
+        self._events_since = 0
+        try:
+            self._pending.put_nowait((snap, history))
+        except queue.Full:
+            # 丢弃尚未写出的旧快照，换成最新的；旧快照的历史增量排在新增量之前一并写出
+            try:
+                _, older = self._pending.get_nowait()
+                history = {name: older.get(name, []) + records for name, records in history.items()}
+                self._pending.task_done()
+            except queue.Empty:
+                pass
+            self._pending.put_nowait((snap, history))
+        logger.debug("Snapshot queued at seq=%d", seq)
+
+    # —— 后台写盘 —— #
+    def _write_loop(self) -> None:
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            snap, history = item
+            try:
+                self._append_history(history)
+                self._write(snap)
+            except Exception as e:
+                logger.exception("Failed to write snapshot seq=%d: %s", snap.last_seq, e)
+            finally:
+                self._pending.task_done()
+
+    def _append_history(self, history: Dict[str, List]) -> None:
+        """历史增量先于快照落盘，保证任何已写出的快照所需的历史都已在文件中"""
+        if not any(history.values()):
+            return
+        with open(self._history_path, 'ab') as f:
+            pickle.dump(history, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load_history(self) -> Dict[str, List]:
+        """按追加顺序拼接历史增量，末尾残缺的记录（写到一半时崩溃）被忽略"""
+        history: Dict[str, List] = {}
+        if not self._history_path.exists():
+            return history
+        with open(self._history_path, 'rb') as f:
+            while True:
+                try:
+                    chunk = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    logger.warning("Ignoring truncated history record in %s: %s", self._history_path, e)
+                    break
+                for name, records in chunk.items():
+                    history.setdefault(name, []).extend(records)
+        return history
+
+    def _rewrite_history(self, history: Dict[str, List]) -> None:
+        """恢复后把历史文件重写为与恢复状态一致的单条记录，之后的增量从这里继续追加"""
+        tmp = self._history_path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            if any(history.values()):
+                pickle.dump(history, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._history_path)
+
+    def _write(self, snap: StateSnapshot) -> None:
+        payload = pickle.dumps(snap, protocol=pickle.HIGHEST_PROTOCOL)
+        final = self.directory / f"snapshot_{snap.last_seq:012d}.pkl"
+        tmp = final.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, final)
+        logger.info("Snapshot written: %s (%d bytes)", final, len(payload))
+        for old in self._snapshot_files()[:-self.keep]:
+            old.unlink(missing_ok=True)
+
+    def _snapshot_files(self) -> list[Path]:
+        return sorted(self.directory.glob('snapshot_*.pkl'))
+
+    def flush(self) -> None:
+        """阻塞直到所有已提交的快照落盘。"""
+        self._pending.join()
+
+    def close(self) -> None:
+        """写完待处理快照后停止后台线程。"""
+        self._pending.put(None)
+        self._writer.join()
+        logger.info("SnapshotManager closed")
+
+    # —— 恢复 —— #
+    def load_latest(self) -> Optional[StateSnapshot]:
+        """读取最新的可用快照，损坏的文件会被跳过。"""
+        for path in reversed(self._snapshot_files()):
+            try:
+                with open(path, 'rb') as f:
+                    snap = pickle.load(f)
+            except Exception as e:
+                logger.warning("Skipping unreadable snapshot %s: %s", path, e)
+                continue
+            if getattr(snap, 'version', None) != SNAPSHOT_VERSION:
+                logger.warning("Skipping snapshot %s with version %s", path, getattr(snap, 'version', None))
+                continue
+            logger.info("Loaded snapshot %s (seq=%d)", path, snap.last_seq)
+            return snap
+        return None
+
+    def recover(
+            self,
+            strategy,
+            portfolio,
+            risk_manager,
+            events: Optional[Iterable[Tuple[int, Any]]] = None,
+            replay: Optional[Callable[[Any], None]] = None,
+            scheduler=None
+    ) -> int:
+        """
+        热重启：恢复最新快照，再重放快照之后的日志事件。
+        :param events: (seq, event) 可迭代对象，通常来自事件日志
+        :param replay: 处理单个事件的回调（与实盘 on_bar 路径一致）
+        :param scheduler: EventScheduler，快照含调度状态时一并恢复（回调经 strategy.resolve_timer 重新绑定）
+        :return: 恢复后的最后事件序号，无快照时为 -1
+        """
+        snap = self.load_latest()
+        last_seq = -1
+        if snap is not None:
+            strategy.set_state(snap.strategy)
+            portfolio.set_state(snap.portfolio, history=self._load_history())
+            risk_manager.set_state(snap.risk)
+            if scheduler is not None and snap.scheduler is not None:
+                scheduler.set_state(snap.scheduler, strategy.resolve_timer)
+            last_seq = snap.last_seq
+        # 历史文件可能比快照多出若干增量（快照写盘失败），也可能属于已无快照的旧运行：与恢复后的状态对齐
+        lengths = portfolio.history_len()
+        self._rewrite_history(portfolio.history_since({}, lengths))
+        self._history_offsets = lengths
+        replayed = 0
+        if events is not None and replay is not None:
+            for seq, event in events:
+                if seq <= last_seq:
+                    continue
+                replay(event)
+                last_seq = seq
+                replayed += 1
+        logger.info("Recovery complete: last_seq=%d, replayed %d events", last_seq, replayed)
+        return last_seq
@@ -1,9 +1,15 @@
+import copy
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Literal
+from typing import Any, Callable, Dict, List, Literal, Optional
 import logging
 
+from multi_market_qt_system.core.latency import MetricsRegistry, now_ns
+
 logger = logging.getLogger(__name__)
 
+# 不进入快照的运行时属性
+_TRANSIENT_ATTRS = ('signals', 'metrics', '_stage_hist', '_decision_hist', '_signal_counter')
+
 
 class StrategyBase(ABC):
     """
@@ -14,6 +20,7 @@ class StrategyBase(ABC):
     def __init__(self, name: str) -> None:
         self.name = name
         self.signals: List[Dict[str, Any]] = []
+        self.metrics: Optional[MetricsRegistry] = None  # 实盘时通过 attach_metrics 注入，记录决策耗时
         logger.info("Initialized strategy: %s", name)
 
     @abstractmethod
@@ -34,7 +41,10 @@ class StrategyBase(ABC):
         # 清除上次未取信号
         self.signals.clear()
         # 调用子类实现
-        self.generate(bar)
+        if self.metrics is None:
+            self.generate(bar)
+        else:
+            self._timed_generate(bar)
         # 返回并清空缓存
         sigs = self.signals.copy()
         self.signals.clear()
@@ -42,6 +52,49 @@ class StrategyBase(ABC):
         logger.debug("Signals generated by %s: %s", self.name, sigs)
         return sigs
 
+    def schedule_events(self, scheduler) -> None:
+        """
+        登记定时事件（月末调仓、收盘前平仓等），回测与实盘在开始推进行情前各调用一次，默认不登记。
+        回调中用 emit_signal 产生的信号会在下一根 bar 之前被取走处理（按上一根 bar 的价格撮合）。
+        :param scheduler: EventScheduler
+        """
+        pass
+
+    def resolve_timer(self, name: str) -> Optional[Callable]:
+        """
+        快照恢复时按名称找回定时事件的回调，默认取同名的实例方法；回调为 lambda 等匿名函数的定时器无法恢复。
+        :param name: 登记时的事件名（默认为回调的 __name__）
+        """
+        callback = getattr(self, name, None)
+        return callback if callable(callback) else None
+
+    def drain_signals(self) -> List[Dict[str, Any]]:
+        """取走 on_bar 之外（定时回调中）产生的信号"""
+        if not self.signals:
+            return []
+        sigs = self.signals.copy()
+        self.signals.clear()
+        return sigs
+
+    def attach_metrics(self, metrics: MetricsRegistry) -> None:
+        """注入指标注册表，并预先取好各指标句柄，热路径上不再做查找"""
+        self.metrics = metrics
+        self._stage_hist = metrics.histogram('stage_latency_seconds', 'Pipeline stage latency', stage='strategy')
+        self._decision_hist = metrics.histogram('tick_to_decision_seconds', 'Tick receive to strategy decision')
+        self._signal_counter = metrics.counter('signals_total', 'Signals generated', strategy=self.name)
+
+    def _timed_generate(self, bar: Dict[str, Any]) -> None:
+        """带耗时统计的 generate：策略计算耗时，以及自行情接收 (bar['recv_ns']) 至决策完成的耗时"""
+        t0 = now_ns()
+        self.generate(bar)
+        t1 = now_ns()
+        self._stage_hist.record(t1 - t0)
+        recv_ns = bar.get('recv_ns')
+        if recv_ns is not None:
+            self._decision_hist.record(t1 - recv_ns)
+        if self.signals:
+            self._signal_counter.inc(len(self.signals))
+
     def batch_run(self, bars: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         批量回测模式：一次性传入所有 bars，按顺序生成信号。
@@ -76,3 +129,20 @@ class StrategyBase(ABC):
         }
         logger.debug("Strategy %s emit signal: %s", self.name, signal)
         self.signals.append(signal)
+
+    def get_state(self) -> Dict[str, Any]:
+        """
+        导出可持久化的策略状态（用于快照/热重启）。
+        默认对实例属性做浅拷贝（不含信号缓存），子类如有不可序列化的属性可覆盖。
+        """
+        return {k: copy.copy(v) for k, v in vars(self).items()
+                if k not in _TRANSIENT_ATTRS}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        """
+        从快照恢复策略状态。
+        :param state: get_state 导出的 dict
+        """
+        self.__dict__.update(state)
+        self.signals = []
+        logger.info("Strategy %s state restored", self.name)
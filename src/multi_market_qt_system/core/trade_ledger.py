@@ -0,0 +1,161 @@
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Literal
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RoundTrip:
+    """一次开平配对（一个持仓批次中被平掉的部分）"""
+    symbol: str
+    direction: int  # +1 多头 / -1 空头
+    quantity: float
+    entry_time: Any
+    exit_time: Any
+    entry_price: float
+    exit_price: float
+    pnl: float  # 扣除开平两端分摊费用后的净盈亏
+
+
+def _seconds_between(start: Any, end: Any) -> float:
+    delta = end - start
+    return delta.total_seconds() if hasattr(delta, 'total_seconds') else float(delta)
+
+
+class TradeLedger:
+    """
+    成交台账：按 FIFO/LIFO 把成交与持仓批次（lot）逐笔配对为开平回合，并维护滚动汇总。
+    每笔成交最多新增一个批次，每个批次最多被完整弹出一次，摊还 O(1)；
+    已实现盈亏、胜率、平均持有时间、盈亏比、期望收益均为累计量，随时查询无需扫描历史。
+    """
+
+    def __init__(self, method: Literal['fifo', 'lifo'] = 'fifo', keep_round_trips: bool = True):
+        """
+        :param method: 批次匹配顺序
+        :param keep_round_trips: 是否保留每个回合的明细（长时间实盘可关闭以节省内存）
+        """
+        if method not in ('fifo', 'lifo'):
+            raise ValueError(f"Unknown lot matching method: {method}")
+        self.method = method
+        self.keep_round_trips = keep_round_trips
+        # symbol -> 批次队列，批次为 [带符号数量, 成交价, 每单位开仓费用, 开仓时间]，同一标的批次方向一致
+        self.lots: Dict[str, Deque[list]] = {}
+        self.round_trips: List[RoundTrip] = []
+        self.realized_pnl = 0.0
+        self.closed = 0
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.hold_seconds = 0.0
+        self.fees = 0.0
+
+    def record_fill(self, symbol: str, side: int, quantity: float, price: float, fee: float, timestamp: Any) -> float:
+        """
+        登记一笔成交：先按匹配顺序平掉反向批次，剩余数量开新批次。
+        :param side: +1 买入 / -1 卖出
+        :return: 本笔成交实现的净盈亏
+        """
+        self.fees += fee
+        fee_per_unit = fee / quantity if quantity else 0.0
+        lots = self.lots.get(symbol)
+        remaining = quantity
+        realized = 0.0
+        lifo = self.method == 'lifo'
+        while remaining > 0 and lots and (lots[0][0] > 0) != (side > 0):
+            lot = lots[-1] if lifo else lots[0]
+            lot_qty, entry_price, entry_fee, entry_time = lot
+            direction = 1 if lot_qty > 0 else -1
+            matched = min(remaining, abs(lot_qty))
+            pnl = (price - entry_price) * matched * direction - (entry_fee + fee_per_unit) * matched
+            self._close(symbol, direction, matched, entry_time, timestamp, entry_price, price, pnl)
+            realized += pnl
+            remaining -= matched
+            if matched == abs(lot_qty):
+                if lifo:
+                    lots.pop()
+                else:
+                    lots.popleft()
+            else:
+                lot[0] = lot_qty - matched * direction
+        if remaining > 0:
+            if lots is None:
+                lots = self.lots[symbol] = deque()
+            lots.append([remaining * side, price, fee_per_unit, timestamp])
+        elif lots is not None and not lots:
+            del self.lots[symbol]
+        return realized
+
+    def _close(self, symbol, direction, quantity, entry_time, exit_time, entry_price, exit_price, pnl) -> None:
+        self.realized_pnl += pnl
+        self.closed += 1
+        if pnl > 0:
+            self.wins += 1
+            self.gross_profit += pnl
+        else:
+            self.losses += 1
+            self.gross_loss -= pnl
+        self.hold_seconds += _seconds_between(entry_time, exit_time)
+        if self.keep_round_trips:
+            self.round_trips.append(RoundTrip(symbol, direction, quantity, entry_time, exit_time,
+                                              entry_price, exit_price, pnl))
+
+    def open_quantity(self, symbol: str) -> float:
+        """台账中的带符号持仓（O(开放批次数)，仅用于核对）"""
+        return sum(lot[0] for lot in self.lots.get(symbol, ()))
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.closed if self.closed else 0.0
+
+    @property
+    def avg_hold_seconds(self) -> float:
+        return self.hold_seconds / self.closed if self.closed else 0.0
+
+    @property
+    def profit_factor(self) -> float:
+        if self.gross_loss == 0:
+            return float('inf') if self.gross_profit > 0 else 0.0
+        return self.gross_profit / self.gross_loss
+
+    @property
+    def expectancy(self) -> float:
+        """每个回合的平均净盈亏"""
+        return self.realized_pnl / self.closed if self.closed else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "round_trips": self.closed,
+            "winning_trades": self.wins,
+            "losing_trades": self.losses,
+            "win_rate": self.win_rate,
+            "realized_pnl": self.realized_pnl,
+            "profit_factor": self.profit_factor,
+            "expectancy": self.expectancy,
+            "avg_hold_seconds": self.avg_hold_seconds,
+            "fees": self.fees,
+        }
+
+    def get_state(self, include_round_trips: bool = True) -> Dict[str, Any]:
+        """
+        导出台账状态（批次逐个复制，可在其他线程中序列化）。
+        :param include_round_trips: False 时不含回合明细（由调用方增量持久化，见 Portfolio.history_since）
+        """
+        state = {
+            "method": self.method,
+            "lots": {sym: [list(lot) for lot in lots] for sym, lots in self.lots.items()},
+            "aggregates": (self.realized_pnl, self.closed, self.wins, self.losses,
+                           self.gross_profit, self.gross_loss, self.hold_seconds, self.fees),
+        }
+        if include_round_trips:
+            state["round_trips"] = list(self.round_trips)
+        return state
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.method = state["method"]
+        self.lots = {sym: deque(list(lot) for lot in lots) for sym, lots in state["lots"].items()}
+        self.round_trips = list(state.get("round_trips", []))
+        (self.realized_pnl, self.closed, self.wins, self.losses,
+         self.gross_profit, self.gross_loss, self.hold_seconds, self.fees) = state["aggregates"]
@@ -1,10 +1,47 @@
-from core.order import Order
-from execution.gateway import ExecutionGateway
+from typing import Any, Optional
+
+from multi_market_qt_system.core.latency import MetricsRegistry, now_ns
+from multi_market_qt_system.core.order import Order
+from multi_market_qt_system.execution.order_state import OrderStateStore
+
+
+def supports_order_state(gateway: Any) -> bool:
+    """网关既推送逐笔回报又提供对账快照时，才能用 OrderStateStore 跟踪在途订单（否则在途数量永远不会释放）"""
+    return hasattr(gateway, 'subscribe_reports') and hasattr(gateway, 'snapshot')
+
 
 class ExecutionEngine:
-    def __init__(self, gateway: ExecutionGateway):
+    def __init__(self, gateway: Any, metrics: Optional[MetricsRegistry] = None,
+                 order_state: Optional[OrderStateStore] = None):
+        """
+        :param order_state: 订单状态缓存；提供时下单前先登记（生成客户端订单号），网关回报增量更新它。
+            网关须支持回报与快照（见 supports_order_state）
+        """
+        if order_state is not None and not supports_order_state(gateway):
+            raise ValueError(f"{type(gateway).__name__} has no execution reports/snapshots; "
+                             f"cannot track order state")
         self.gateway = gateway
+        self.metrics = metrics
+        self.order_state = order_state
+        if order_state is not None:
+            gateway.subscribe_reports(order_state.on_execution_report)
+        if metrics is not None:
+            self._ack_hist = metrics.histogram('decision_to_ack_seconds', 'Order submit to gateway ack')
+            self._orders_counter = metrics.counter('orders_submitted_total', 'Orders submitted')
+
+    def _send(self, order: Order):
+        # 网关统一接口：send_order(order, client_order_id=None)
+        if self.order_state is None:
+            return self.gateway.send_order(order)
+        state = self.order_state.on_submit(order)
+        return self.gateway.send_order(order, client_order_id=state.client_order_id)
 
     def submit_order(self, order: Order):
-        result = self.gateway.send_order(order)
-        return result
\ No newline at end of file
+        if self.metrics is None:
+            return self._send(order)
+        # 决策到回报：下单请求发出至网关返回（ack）的耗时
+        t0 = now_ns()
+        result = self._send(order)
+        self._ack_hist.record(now_ns() - t0)
+        self._orders_counter.inc()
+        return result
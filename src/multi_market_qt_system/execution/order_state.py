@@ -0,0 +1,335 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import threading
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from multi_market_qt_system.core.cost_model import order_side
+from multi_market_qt_system.core.order import Order
+
+logger = logging.getLogger(__name__)
+
+
+class OrderStatus(Enum):
+    PENDING_NEW = 'PENDING_NEW'  # 已发出、券商尚未确认
+    NEW = 'NEW'
+    PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+    FILLED = 'FILLED'
+    CANCELLED = 'CANCELLED'
+    REJECTED = 'REJECTED'
+
+    @property
+    def is_open(self) -> bool:
+        return self in _OPEN_STATUSES
+
+
+_OPEN_STATUSES = frozenset((OrderStatus.PENDING_NEW, OrderStatus.NEW, OrderStatus.PARTIALLY_FILLED))
+# 生命周期先后：成交量相同时，只接受比当前更靠后的状态（防止乱序的 NEW 覆盖 PARTIALLY_FILLED）
+_STAGE = {OrderStatus.PENDING_NEW: 0, OrderStatus.NEW: 1, OrderStatus.PARTIALLY_FILLED: 2,
+          OrderStatus.FILLED: 3, OrderStatus.CANCELLED: 3, OrderStatus.REJECTED: 3}
+
+
+@dataclass
+class ExecutionReport:
+    """
+    券商逐笔回报（增量）。filled_qty / avg_price 为累计值，重复或乱序到达的旧回报可按累计量识别后丢弃。
+    symbol / side / quantity 仅在本地没有该订单时（如在其他终端下的单）用于补建。
+    """
+    client_order_id: str
+    status: OrderStatus
+    filled_qty: float = 0.0
+    avg_price: float = 0.0
+    symbol: Optional[str] = None
+    side: Optional[int] = None
+    quantity: Optional[float] = None
+    price: float = 0.0
+    exchange_order_id: Optional[str] = None
+    timestamp: Any = None
+
+
+@dataclass
+class AccountSnapshot:
+    """
+    券商侧紧凑快照：只含在途订单的 (状态, 累计成交量, 成交均价) 与各标的净持仓。
+    已完结订单不在其中；需要订单明细时由 order_details 提供本地未知订单的 (symbol, side, quantity, price)。
+    券商支持按订单号查询时，final_orders 提供本地仍在途、券商侧已完结订单的终态 (状态, 累计成交量, 成交均价)；
+    缺省时对账按持仓差额推断这些订单漏收的成交。
+    """
+    orders: Dict[str, Tuple[OrderStatus, float, float]]
+    positions: Dict[str, float]
+    order_details: Dict[str, Tuple[str, int, float, float]] = field(default_factory=dict)
+    final_orders: Dict[str, Tuple[OrderStatus, float, float]] = field(default_factory=dict)
+
+
+@dataclass
+class OrderState:
+    client_order_id: str
+    symbol: str
+    side: int
+    quantity: float
+    price: float
+    status: OrderStatus = OrderStatus.PENDING_NEW
+    filled_qty: float = 0.0
+    avg_price: float = 0.0
+    exchange_order_id: Optional[str] = None
+    updated: Any = None
+    action: Optional[str] = None  # 本地下单时的 OrderType 名称；补建的外部订单为 None
+
+    @property
+    def remaining(self) -> float:
+        return self.quantity - self.filled_qty if self.status.is_open else 0.0
+
+
+@dataclass
+class ReconcileReport:
+    """一次对账的差异（均已按券商快照修正到本地状态）"""
+    fills_applied: int = 0  # 本地漏收的成交（含按持仓差额归到已完结订单的成交）
+    closed: List[str] = field(default_factory=list)  # 本地在途、券商已无的订单（回报丢失），已标记完结
+    adopted: List[str] = field(default_factory=list)  # 券商有、本地未知的在途订单，已补建
+    position_breaks: Dict[str, Tuple[float, float]] = field(default_factory=dict)  # symbol -> (本地, 券商)
+
+    @property
+    def clean(self) -> bool:
+        return not (self.fills_applied or self.closed or self.adopted or self.position_breaks)
+
+
+class OrderStateStore:
+    """
+    实盘订单/持仓状态缓存：按客户端订单号与标的索引，由券商增量回报驱动更新。
+    - 每个标的维护净持仓与在途买/卖剩余数量，风控与策略查询敞口为 O(1) 字典读取（无需加锁）；
+    - 回报按累计成交量幂等处理，重复、乱序或已完结订单的回报直接丢弃；
+    - reconcile 用券商紧凑快照与本地状态逐项比对，只修正差异，而不是整体重建。
+    写操作（回报、下单、对账）由一把锁串行化，可在网关回调线程中直接调用。
+    """
+
+    def __init__(self, id_prefix: str = 'mmqt', max_purged: int = 100_000):
+        """
+        :param id_prefix: 本地生成客户端订单号的前缀（多进程/多账户时应互不相同）
+        :param max_purged: 墓碑集合保留的已丢弃订单号上限，超出时先淘汰最早丢弃的
+        """
+        self.orders: Dict[str, OrderState] = {}
+        self.open_orders: Dict[str, OrderState] = {}
+        self.open_by_symbol: Dict[str, Dict[str, OrderState]] = defaultdict(dict)
+        self.positions: Dict[str, float] = defaultdict(float)
+        self.pending_buy: Dict[str, float] = defaultdict(float)  # 在途买单剩余数量
+        self.pending_sell: Dict[str, float] = defaultdict(float)  # 在途卖单剩余数量
+        self.open_notional = 0.0  # 全部在途订单剩余数量 × 委托价
+        self._ids = itertools.count(1)
+        self._prefix = id_prefix
+        self._lock = threading.RLock()
+        self._unconfirmed: set = set()  # 上次对账时快照中没有的 PENDING_NEW 订单
+        self._purged: set = set()  # purge_closed 丢弃过明细的订单号：之后迟到的回报不得再补建
+        self._purged_order: deque = deque()  # _purged 中的订单号按丢弃先后排列，用于淘汰最旧的墓碑
+        self._max_purged = max_purged
+        self._fill_listeners: List[Callable[[OrderState, float, float], None]] = []
+        self.reports_applied = 0
+        self.reports_ignored = 0
+
+    def add_fill_listener(self, callback: Callable[[OrderState, float, float], None]) -> None:
+        """
+        登记成交回调 callback(订单状态, 本次成交量, 本次成交均价)，回报或对账补记成交时在写锁内同步调用。
+        对账归到丢失回报订单上的成交同样触发；无法归到任何订单的持仓差异只修正持仓，不触发回调。
+        """
+        self._fill_listeners.append(callback)
+
+    # —— O(1) 敞口查询 —— #
+    def position(self, symbol: str) -> float:
+        return self.positions.get(symbol, 0.0)
+
+    def max_long(self, symbol: str) -> float:
+        """在途买单全部成交后的最大多头持仓"""
+        return self.positions.get(symbol, 0.0) + self.pending_buy.get(symbol, 0.0)
+
+    def max_short(self, symbol: str) -> float:
+        """在途卖单全部成交后的最小持仓（可能为负）"""
+        return self.positions.get(symbol, 0.0) - self.pending_sell.get(symbol, 0.0)
+
+    def open_orders_for(self, symbol: str) -> List[OrderState]:
+        return list(self.open_by_symbol.get(symbol, {}).values())
+
+    # —— 增量更新 —— #
+    def _track_open(self, state: OrderState, remaining_before: float) -> None:
+        """订单剩余量变化后同步在途计数与索引"""
+        delta = state.remaining - remaining_before
+        if delta:
+            book = self.pending_buy if state.side > 0 else self.pending_sell
+            book[state.symbol] += delta
+            self.open_notional += delta * state.price
+        if not state.status.is_open and self.open_orders.pop(state.client_order_id, None) is not None:
+            by_symbol = self.open_by_symbol[state.symbol]
+            by_symbol.pop(state.client_order_id, None)
+            if not by_symbol:
+                del self.open_by_symbol[state.symbol]
+
+    def _add(self, state: OrderState) -> OrderState:
+        self.orders[state.client_order_id] = state
+        if state.status.is_open:
+            self.open_orders[state.client_order_id] = state
+            self.open_by_symbol[state.symbol][state.client_order_id] = state
+            self._track_open(state, 0.0)
+        return state
+
+    def on_submit(self, order: Order, client_order_id: str = None) -> OrderState:
+        """
+        登记即将发出的订单（PENDING_NEW），在途数量立即计入敞口，避免回报到达前重复下单。
+        :return: 订单状态，client_order_id 需随订单一起发给券商
+        """
+        with self._lock:
+            coid = client_order_id or f"{self._prefix}-{next(self._ids)}"
+            if coid in self.orders:
+                raise ValueError(f"Duplicate client order id: {coid}")
+            return self._add(OrderState(coid, order.symbol, order_side(order.order_type), order.quantity, order.price,
+                                        updated=order.timestamp, action=order.order_type.name))
+
+    def on_execution_report(self, report: ExecutionReport) -> bool:
+        """
+        应用一条券商回报。
+        :return: 是否改变了本地状态（重复/过期回报返回 False）
+        """
+        with self._lock:
+            state = self.orders.get(report.client_order_id)
+            if state is None:
+                if report.client_order_id in self._purged:
+                    # 已完结并丢弃明细的订单：迟到回报的成交早已计入持仓
+                    self.reports_ignored += 1
+                    return False
+                if report.symbol is None or report.side is None or report.quantity is None:
+                    logger.warning("Report for unknown order %s without order details", report.client_order_id)
+                    self.reports_ignored += 1
+                    return False
+                state = self._add(OrderState(report.client_order_id, report.symbol, report.side, report.quantity,
+                                             report.price, exchange_order_id=report.exchange_order_id))
+            if not state.status.is_open or report.filled_qty < state.filled_qty or (
+                    report.filled_qty == state.filled_qty and _STAGE[report.status] <= _STAGE[state.status]):
+                self.reports_ignored += 1
+                return False
+            self._apply(state, report.status, report.filled_qty, report.avg_price)
+            if report.exchange_order_id:
+                state.exchange_order_id = report.exchange_order_id
+            state.updated = report.timestamp
+            self.reports_applied += 1
+            return True
+
+    def _settle_lost(self, state: OrderState, gaps: Dict[str, float]) -> bool:
+        """
+        完结回报丢失、快照也没有终态的订单：该标的持仓差额（券商 - 本地）与订单同向的部分视为其漏收的成交，
+        按委托价补记（gaps 同步扣减），补满时标记 FILLED，否则 CANCELLED。
+        :return: 是否补记了成交
+        """
+        fill = min(state.quantity - state.filled_qty, max(gaps.get(state.symbol, 0.0) * state.side, 0.0))
+        if fill <= 0:
+            self._apply(state, OrderStatus.CANCELLED, state.filled_qty, state.avg_price)
+            return False
+        gaps[state.symbol] -= fill * state.side
+        filled_qty = state.filled_qty + fill
+        avg_price = (state.avg_price * state.filled_qty + state.price * fill) / filled_qty
+        status = OrderStatus.FILLED if filled_qty >= state.quantity else OrderStatus.CANCELLED
+        self._apply(state, status, filled_qty, avg_price)
+        return True
+
+    def _apply(self, state: OrderState, status: OrderStatus, filled_qty: float, avg_price: float) -> None:
+        remaining_before = state.remaining
+        fill = filled_qty - state.filled_qty
+        fill_price = 0.0
+        if fill > 0:
+            self.positions[state.symbol] += fill * state.side
+            # 累计均价还原本次成交价；券商未给均价时按委托价
+            fill_price = ((avg_price * filled_qty - state.avg_price * state.filled_qty) / fill
+                          if avg_price else state.price)
+        state.filled_qty = filled_qty
+        state.avg_price = avg_price or state.avg_price
+        state.status = status
+        self._track_open(state, remaining_before)
+        if fill > 0:
+            for callback in self._fill_listeners:
+                callback(state, fill, fill_price)
+
+    # —— 对账 —— #
+    def reconcile(self, snapshot: AccountSnapshot) -> ReconcileReport:
+        """
+        用券商快照修正本地状态：补记漏收的成交、完结券商侧已不存在的在途订单、补建本地未知的订单，
+        最后以券商持仓为准修正持仓差异。只遍历在途订单与持仓，不重建已完结订单。
+        券商已完结的订单优先按 final_orders 中的终态补记；没有终态时，把持仓差额归到这些订单上作为成交，
+        经成交回调入账，归不到订单的剩余差额才作为 position_breaks 直接修正。
+        快照须与回报流同序获取（如在网关回报线程中调用），否则快照之后到达的成交会被当作差异回滚。
+        """
+        result = ReconcileReport()
+        with self._lock:
+            broker_orders = snapshot.orders
+            matched = 0
+            unconfirmed = set()
+            lost = []
+            for coid, state in list(self.open_orders.items()):
+                entry = broker_orders.get(coid)
+                if entry is None:
+                    # 未确认的订单可能刚发出、尚未进入快照：连续两次快照都没有才视为已完结
+                    if state.status == OrderStatus.PENDING_NEW and coid not in self._unconfirmed:
+                        unconfirmed.add(coid)
+                        continue
+                    result.closed.append(coid)
+                    entry = snapshot.final_orders.get(coid)
+                    if entry is None:
+                        # 回报丢失且没有终态：等其余订单处理完后按持仓差额推断成交
+                        lost.append(state)
+                        continue
+                else:
+                    matched += 1
+                status, filled_qty, avg_price = entry
+                # 快照可能比刚处理的回报旧：只接受更多的成交或更靠后的状态
+                if filled_qty > state.filled_qty:
+                    result.fills_applied += 1
+                    self._apply(state, status, filled_qty, avg_price)
+                elif filled_qty == state.filled_qty and _STAGE[status] > _STAGE[state.status]:
+                    self._apply(state, status, filled_qty, avg_price)
+
+            # 只有券商在途订单多于已匹配的本地订单时才需要找出本地未知的订单
+            if len(broker_orders) > matched:
+                for coid, (status, filled_qty, avg_price) in broker_orders.items():
+                    if coid in self.orders or coid in self._purged:
+                        continue
+                    details = snapshot.order_details.get(coid)
+                    if details is None:
+                        logger.warning("Broker order %s unknown locally and has no details", coid)
+                        continue
+                    symbol, side, quantity, price = details
+                    state = self._add(OrderState(coid, symbol, side, quantity, price))
+                    self._apply(state, status, filled_qty, avg_price)
+                    result.adopted.append(coid)
+
+            self._unconfirmed = unconfirmed
+            if lost:
+                gaps = {symbol: snapshot.positions.get(symbol, 0.0) - self.positions.get(symbol, 0.0)
+                        for symbol in {state.symbol for state in lost}}
+                for state in lost:
+                    result.fills_applied += self._settle_lost(state, gaps)
+            for symbol in set(self.positions) | set(snapshot.positions):
+                local = self.positions.get(symbol, 0.0)
+                broker = snapshot.positions.get(symbol, 0.0)
+                if local != broker:
+                    result.position_breaks[symbol] = (local, broker)
+                    self.positions[symbol] = broker
+        if not result.clean:
+            logger.warning("Reconciliation fixed %d fills, closed %d, adopted %d, %d position breaks",
+                           result.fills_applied, len(result.closed), len(result.adopted),
+                           len(result.position_breaks))
+        return result
+
+    def purge_closed(self) -> int:
+        """
+        丢弃已完结订单的明细（长时间运行时控制内存），返回丢弃数。
+        订单号留在墓碑集合中，迟到的回报或快照明细不会把它当作未知订单补建、重复计入成交；
+        墓碑最多保留 max_purged 个，更早的订单号视为不会再有回报。
+        """
+        with self._lock:
+            closed = [coid for coid, state in self.orders.items() if not state.status.is_open]
+            for coid in closed:
+                del self.orders[coid]
+            self._purged.update(closed)
+            self._purged_order.extend(closed)
+            while len(self._purged_order) > self._max_purged:
+                self._purged.discard(self._purged_order.popleft())
+        return len(closed)
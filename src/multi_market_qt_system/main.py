@@ -1,14 +1,19 @@
 import logging
 import os
 import click
+import pandas as pd
 import yaml
+from multi_market_qt_system.core.market_calendar import configure_calendars
 from multi_market_qt_system.core.performance import PerformanceMetrics
 from multi_market_qt_system.logs.logging_config import init_logging
 from multi_market_qt_system.visualization.plotting import create_performance_dashboard
 from .core.data_client import DataClient
+from .backtest.backtester import iter_bar_frames
+from .backtest.factory import build_backtester
+from .backtest.optimizer import HalvingTPEOptimizer, param_space_from_conf
+from .backtest.walk_forward import WalkForwardAnalyzer
+from .backtest.sharded import FileWorkQueue, ShardedBacktestRunner, serve_queue, summary_table, task_conf
 from .strategies.dual_ma_strategy import DualMAStrategy, DualMAStrategyConfig
-from .core.risk_manager import RiskManager, RiskLimits
-from .backtest.backtester import Backtester
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
@@ -36,6 +41,7 @@ def cli(ctx, config):
     # 2) 环境变量覆盖
     conf['mode'] = os.getenv('MODE', conf.get('mode', 'backtest'))
     logger.debug("Configuration loaded: %s", conf)
+    configure_calendars(conf)
     ctx.obj = conf
 
     # —— 从配置中初始化日志 —— #
@@ -55,8 +61,13 @@ def cli(ctx, config):
 @click.option('--start', default='2023-01-01', help="回测开始日期 YYYY-MM-DD")
 @click.option('--end', default='2025-06-01', help="回测结束日期 YYYY-MM-DD")
 @click.option('--provider', default='yfinance', help="数据提供方，覆盖 config.market_data.source")
+@click.option('--rolling-window', default=63, type=int, help="滚动绩效指标窗口（周期数）")
+@click.option('--benchmark', default=None, help="基准标的（如 SPY），提供时计算并绘制滚动 beta")
+@click.option('--workers', '-w', default=1, type=int, help="并行回测进程数，>1 时按标的分片并行，只输出汇总表")
+@click.option('--queue-dir', default=None, help="共享工作队列目录：提交任务并等待 `worker` 命令执行（可跨机器）")
+@click.option('--lease-seconds', default=300.0, type=float, help="队列任务租约（秒），worker 超时未续约的任务重新排队")
 @click.pass_context
-def backtest(ctx, symbol, start, end, provider):
+def backtest(ctx, symbol, start, end, provider, rolling_window, benchmark, workers, queue_dir, lease_seconds):
     """
     运行回测，输出绩效指标。
     """
@@ -64,55 +75,58 @@ def backtest(ctx, symbol, start, end, provider):
     symbols = [s.strip() for s in symbol.split(',')]
     logger.info("Begin backtest for symbols: %s from %s to %s with provider %s", symbols, start, end, provider)
 
-    # 1. 数据客户端
+    provider = provider or conf['market_data']['source']
+
+    # 1. 多标的并行：分片到本机进程池，或提交到共享目录工作队列由多台机器的 worker 执行
+    if queue_dir or workers > 1:
+        if queue_dir:
+            queue = FileWorkQueue(queue_dir, lease_seconds=lease_seconds)
+            task_ids = [queue.enqueue({'symbol': sym, 'start': start, 'end': end, 'provider': provider,
+                                       'conf': task_conf(conf)})
+                        for sym in symbols]
+            click.echo(f"Enqueued {len(task_ids)} tasks to {queue_dir}, waiting for workers...")
+            results = queue.gather(task_ids)
+        else:
+            results = ShardedBacktestRunner(conf, workers=workers).run(symbols, start, end, provider)
+        collected = []
+        for res in results:
+            collected.append(res)
+            status = f"error: {res['error']}" if 'error' in res else f"sharpe={res['sharpe_ratio']:.2f}"
+            click.echo(f"[{len(collected)}/{len(symbols)}] {res['symbol']} {status}")
+        click.echo("\n=== Backtest Summary ===")
+        click.echo(summary_table(collected).to_string())
+        return
+
+    # 2. 数据客户端
     data_client = DataClient(conf['mode'], conf)
     logger.debug("DataClient initialized: mode=%s, source=%s", conf['mode'], conf.get('market_data', {}))
 
-    # 2. 策略实例化
-    strat_cfg = DualMAStrategyConfig(**conf['strategy']['params'])
-    strat_name = conf['strategy']['name']
-    strategy = DualMAStrategy(name=strat_name, config=strat_cfg)
-    logger.debug("Strategy %s initialized with config %s", strat_name, strat_cfg)
-
-    # 3. 风控管理器
-    rc_conf = conf.get('risk_control', {})
-    limits = RiskLimits(
-        max_position=rc_conf.get('max_position', 100),
-        max_drawdown=rc_conf.get('max_drawdown', 0.2),
-        max_daily_loss=rc_conf.get('max_daily_loss'),
-        max_daily_trades=rc_conf.get('max_daily_trades')
-    )
-    risk_mgr = RiskManager(limits)
-    logger.debug("RiskManager initialized with limits: %s", limits)
-
-    # 4. 回测引擎
-    bt = Backtester(
-        data_client=data_client,
-        strategy=strategy,
-        risk_manager=risk_mgr,
-        initial_cash=conf.get('initial_cash', 1_000_000),
-        commission=conf.get('commission', 0.0005),
-        slippage=conf.get('slippage', 0.0002)
-    )
-    logger.info("Backtester created: initial_cash=%s, commission=%s, slippage=%s", conf.get('initial_cash'),
-                conf.get('commission'), conf.get('slippage'))
+    # 基准收盘价（同一复权口径），对齐到各标的净值时间轴后求每期收益
+    bench_close = None
+    if benchmark:
+        bench_frames = iter_bar_frames(data_client, benchmark, start, end, provider,
+                                       adjustment=conf['market_data'].get('adjustment', 'raw'))
+        bench_close = pd.concat(list(bench_frames))['close']
 
-    # 5. 执行回测
+    # 3. 执行回测：每个标的使用独立的策略与风控实例
+    curves = {}
     for sym in symbols:
         logger.info("Running backtest for %s", sym)
+        bt = build_backtester(conf, data_client=data_client)
         try:
             perf: PerformanceMetrics = bt.run(
                 symbol=sym,
                 start=start,
                 end=end,
-                provider=provider or conf['market_data']['source']
+                provider=provider
             )
             logger.info("Backtest completed for %s: total_return=%.2f%%", sym, perf.total_return * 100)
         except Exception as e:
             logger.exception("Backtest failed for %s: %s", sym, e)
             continue
+        curves[sym] = perf.equity_curve
 
-        # 6. 打印结果
+        # 4. 打印结果
         click.echo(f"\n=== Backtest Results for {sym}: {start} → {end} ===")
         click.echo(f"Total Return:      {perf.total_return:.2%}")
         click.echo(f"Annual Return:     {perf.annual_return:.2%}")
@@ -122,14 +136,122 @@ def backtest(ctx, symbol, start, end, provider):
         click.echo(f"Sortino Ratio:     {perf.sortino_ratio:.2f}")
         click.echo(f"Calmar Ratio:      {perf.calmar_ratio:.2f}")
 
-        # 7.可视化
+        # 5.可视化
         fig = create_performance_dashboard(
             perf.equity_curve,
             perf.period_returns,
-            output_path='src/multi_market_qt_system/visualization/reports/perf_dashboard.html'
+            output_path='src/multi_market_qt_system/visualization/reports/perf_dashboard.html',
+            rolling=perf.rolling_metrics(
+                rolling_window,
+                benchmark_returns=(None if bench_close is None else
+                                   bench_close.reindex(perf.equity_curve.index, method='ffill').pct_change())
+            )
         )
         # fig.show()
 
+    # 6. 多标的（可跨市场）等权组合：合并时间线后按市场日历年化
+    if len(curves) > 1:
+        combined = PerformanceMetrics.from_equity_curves(curves)
+        click.echo(f"\n=== Equal-weight Combined ({', '.join(curves)}) ===")
+        click.echo(f"Total Return:      {combined.total_return:.2%}")
+        click.echo(f"Annual Volatility: {combined.annual_volatility:.2%}")
+        click.echo(f"Sharpe Ratio:      {combined.sharpe_ratio:.2f}")
+        click.echo(f"Max Drawdown:      {combined.max_drawdown:.2%}")
+
+
+@cli.command()
+@click.option('--queue-dir', required=True, help="共享工作队列目录")
+@click.option('--workers', '-w', default=None, type=int, help="本机进程数，默认 CPU 核数")
+@click.option('--exit-when-empty', is_flag=True, help="队列为空时退出")
+@click.option('--lease-seconds', default=300.0, type=float, help="任务租约（秒），需与提交方一致；每 1/3 租约续约一次")
+@click.pass_context
+def worker(ctx, queue_dir, workers, exit_when_empty, lease_seconds):
+    """
+    回测 worker：从共享目录工作队列认领任务并执行，可在多台机器上同时运行。
+    """
+    completed = serve_queue(ctx.obj, queue_dir, workers=workers, exit_when_empty=exit_when_empty,
+                            lease_seconds=lease_seconds)
+    click.echo(f"Worker finished, {completed} tasks completed.")
+
+
+@cli.command()
+@click.option('--symbol', '-s', default='AAPL', help="寻优标的")
+@click.option('--start', default='2015-01-01', help="样本开始日期 YYYY-MM-DD")
+@click.option('--end', default='2025-06-01', help="样本结束日期 YYYY-MM-DD")
+@click.option('--provider', default='yfinance', help="数据提供方")
+@click.option('--workers', '-w', default=None, type=int, help="并行进程数，默认 CPU 核数")
+@click.option('--seed', default=None, type=int, help="随机种子")
+@click.pass_context
+def optimize(ctx, symbol, start, end, provider, workers, seed):
+    """
+    策略参数寻优：逐次减半剪枝 + TPE 提议，搜索空间见配置 optimizer.space。
+    """
+    conf = ctx.obj
+    opt_conf = conf.get('optimizer', {})
+    frames = iter_bar_frames(DataClient(conf['mode'], conf), symbol, start, end, provider,
+                             adjustment=conf['market_data'].get('adjustment', 'raw'))
+    bars = pd.concat(list(frames))
+    optimizer = HalvingTPEOptimizer(
+        conf, DualMAStrategy, DualMAStrategyConfig,
+        space=param_space_from_conf(opt_conf.get('space', {})),
+        metric=opt_conf.get('metric', 'sharpe_ratio'),
+        n_initial=opt_conf.get('n_initial', 27),
+        eta=opt_conf.get('eta', 3),
+        min_fraction=opt_conf.get('min_fraction', 1 / 9),
+        n_tpe=opt_conf.get('n_tpe', 20),
+        workers=workers,
+        seed=seed
+    )
+    result = optimizer.optimize(symbol, bars)
+    click.echo(f"\n=== Optimization Results for {symbol}: {start} → {end} ===")
+    click.echo(f"Best params:  {result.best_params}")
+    click.echo(f"Best {optimizer.metric}: {result.best_score:.4f}")
+    click.echo(f"Backtests:    {result.n_backtests} ({result.budget:.1f} full-history equivalents)")
+    click.echo(result.table().head(10).to_string())
+
+
+@cli.command('walk-forward')
+@click.option('--symbol', '-s', default='AAPL', help="检验标的")
+@click.option('--start', default='2010-01-01', help="样本开始日期 YYYY-MM-DD")
+@click.option('--end', default='2025-06-01', help="样本结束日期 YYYY-MM-DD")
+@click.option('--provider', default='yfinance', help="数据提供方")
+@click.option('--workers', '-w', default=None, type=int, help="并行进程数（按窗口并行），默认 CPU 核数")
+@click.option('--seed', default=None, type=int, help="随机种子")
+@click.pass_context
+def walk_forward(ctx, symbol, start, end, provider, workers, seed):
+    """
+    滚动样本外检验：逐窗口样本内寻优、样本外回测，输出拼接后的样本外绩效。
+    """
+    conf = ctx.obj
+    opt_conf = conf.get('optimizer', {})
+    wf_conf = conf.get('walk_forward', {})
+    frames = iter_bar_frames(DataClient(conf['mode'], conf), symbol, start, end, provider,
+                             adjustment=conf['market_data'].get('adjustment', 'raw'))
+    bars = pd.concat(list(frames))
+    analyzer = WalkForwardAnalyzer(
+        conf, DualMAStrategy, DualMAStrategyConfig,
+        space=param_space_from_conf(opt_conf.get('space', {})),
+        train_size=wf_conf.get('train_size', 756),
+        test_size=wf_conf.get('test_size', 252),
+        step=wf_conf.get('step'),
+        anchored=wf_conf.get('anchored', False),
+        warmup=wf_conf.get('warmup'),
+        workers=workers,
+        metric=opt_conf.get('metric', 'sharpe_ratio'),
+        n_initial=opt_conf.get('n_initial', 27),
+        eta=opt_conf.get('eta', 3),
+        min_fraction=opt_conf.get('min_fraction', 1 / 9),
+        n_tpe=opt_conf.get('n_tpe', 20),
+        seed=seed
+    )
+    result = analyzer.run(symbol, bars)
+    perf = result.performance
+    click.echo(f"\n=== Walk-Forward Results for {symbol}: {start} → {end} ({len(result.folds)} folds) ===")
+    click.echo(result.table().to_string())
+    click.echo(f"\nOOS Total Return:  {perf.total_return:.2%}")
+    click.echo(f"OOS Sharpe Ratio:  {perf.sharpe_ratio:.2f}")
+    click.echo(f"OOS Max Drawdown:  {perf.max_drawdown:.2%}")
+
 
 @cli.command()
 @click.pass_context
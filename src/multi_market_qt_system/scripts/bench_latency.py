@@ -0,0 +1,50 @@
+"""
+测量延迟埋点自身的开销：裸 generate 与带埋点 on_bar 的单次耗时差，以及 LatencyHistogram.record 的单次耗时。
+用法：python -m multi_market_qt_system.scripts.bench_latency [事件数]
+"""
+import sys
+import time
+
+from multi_market_qt_system.core.latency import LatencyHistogram, MetricsRegistry, now_ns
+from multi_market_qt_system.strategies.dual_ma_strategy import DualMAStrategy, DualMAStrategyConfig
+
+
+def _bars(n: int):
+    price = 100.0
+    for i in range(n):
+        price *= 1.0005 if (i * 7919) % 13 < 7 else 0.9995
+        yield {'timestamp': i, 'symbol': 'AAPL', 'close': price}
+
+
+def _run(strategy: DualMAStrategy, n: int, stamped: bool) -> float:
+    start = time.perf_counter()
+    for bar in _bars(n):
+        if stamped:
+            bar['recv_ns'] = now_ns()
+        strategy.on_bar(bar)
+    return (time.perf_counter() - start) / n * 1e9
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    cfg = DualMAStrategyConfig(short_window=5, long_window=20, trade_size=1)
+
+    plain = _run(DualMAStrategy('bench', cfg), n, stamped=False)
+    instrumented_strategy = DualMAStrategy('bench', cfg)
+    registry = MetricsRegistry()
+    instrumented_strategy.attach_metrics(registry)
+    instrumented = _run(instrumented_strategy, n, stamped=True)
+
+    hist = LatencyHistogram()
+    start = time.perf_counter()
+    for i in range(n):
+        hist.record(i * 37 % 5_000_000)
+    record_ns = (time.perf_counter() - start) / n * 1e9
+
+    print(f"events:                {n}")
+    print(f"on_bar (plain):        {plain:8.0f} ns/event")
+    print(f"on_bar (instrumented): {instrumented:8.0f} ns/event")
+    print(f"instrumentation cost:  {instrumented - plain:8.0f} ns/event")
+    print(f"histogram.record:      {record_ns:8.0f} ns/call")
+    print()
+    print(registry.render())
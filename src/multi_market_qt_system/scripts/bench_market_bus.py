@@ -0,0 +1,76 @@
+"""
+共享内存行情总线扇出基准：一个写进程按固定速率发布 bar，N 个读进程各自读取，
+统计发布到读取之间的延迟分位数（各进程同用单调时钟）以及丢失条数，随读者数增加观察延迟变化。
+用法：python -m multi_market_qt_system.scripts.bench_market_bus [消息数] [发布间隔微秒] [最大读者数]
+"""
+import multiprocessing as mp
+import sys
+
+import numpy as np
+
+from multi_market_qt_system.core.latency import now_ns
+from multi_market_qt_system.core.market_data_bus import BusReader, MarketDataBus
+
+BUS_NAME = 'mmqt_bench_bus'
+
+
+def _consume(consumer_id: int, n: int, ready, results) -> None:
+    bus = MarketDataBus.attach(BUS_NAME)
+    reader = BusReader(bus, consumer_id)
+    ready.release()
+    latencies = np.empty(n, dtype=np.int64)
+    got = 0
+    while got + reader.dropped < n:
+        batch = reader.wait(timeout=2.0, spin=10 ** 6)
+        if not len(batch):
+            break
+        recv = now_ns()
+        k = min(len(batch), n - got)
+        latencies[got:got + k] = recv - batch['pub_ns'][:k]
+        got += k
+    reader.close()
+    bus.close()
+    lat = latencies[:got] / 1000
+    results.put((consumer_id, got, reader.dropped, np.percentile(lat, [50, 99, 99.9]) if got else [np.nan] * 3))
+
+
+def _run(n_consumers: int, n: int, interval_us: float):
+    bus = MarketDataBus.create(BUS_NAME, capacity=1 << 14, max_consumers=max(n_consumers, 1))
+    ready = mp.Semaphore(0)
+    results = mp.Queue()
+    procs = [mp.Process(target=_consume, args=(i, n, ready, results)) for i in range(n_consumers)]
+    for p in procs:
+        p.start()
+    for _ in procs:
+        ready.acquire()
+    bar = {'timestamp': 0, 'symbol': 'AAPL', 'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1.0}
+    publish_ns = 0
+    next_ns = now_ns()
+    for i in range(n):
+        while now_ns() < next_ns:
+            pass
+        bar['timestamp'] = i
+        t0 = now_ns()
+        bus.publish(bar)
+        publish_ns += now_ns() - t0
+        next_ns += int(interval_us * 1000)
+    stats = sorted(results.get() for _ in procs)
+    for p in procs:
+        p.join()
+    bus.close()
+    return publish_ns / n / 1000, stats
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    interval_us = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+    max_consumers = int(sys.argv[3]) if len(sys.argv) > 3 else max(mp.cpu_count() - 1, 1)
+    print(f"{n} messages every {interval_us:.0f}us, latency in us (p50 / p99 / p99.9, worst consumer)")
+    k = 1
+    while k <= max_consumers:
+        publish_us, stats = _run(k, n, interval_us)
+        worst = np.max([s[3] for s in stats], axis=0)
+        dropped = sum(s[2] for s in stats)
+        print(f"consumers={k:<3d} publish={publish_us:6.2f}us  latency={worst[0]:8.1f} /{worst[1]:8.1f} /{worst[2]:8.1f}"
+              f"  dropped={dropped}")
+        k *= 2
@@ -0,0 +1,76 @@
+"""
+风控并发基准：N 个策略线程（各自交易不同标的）共用一个账户，
+对比“单把大锁包住 RiskManager.validate”与 SharedRiskManager 的吞吐。
+自定义规则中的 sleep 模拟会释放 GIL 的慢检查（如查询保证金/券商接口）。
+用法：python -m multi_market_qt_system.scripts.bench_risk_contention [每线程订单数] [规则耗时微秒]
+"""
+import logging
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from multi_market_qt_system.core.order import Order, OrderStyle, OrderType
+from multi_market_qt_system.core.portfolio import Portfolio
+from multi_market_qt_system.core.risk_manager import RiskLimits, RiskManager
+from multi_market_qt_system.core.shared_risk import SharedRiskManager
+
+
+class CoarseLockedRisk:
+    """对照组：整个 validate 串行化"""
+
+    def __init__(self, risk: RiskManager):
+        self.risk = risk
+        self.lock = threading.Lock()
+
+    def validate(self, order, market_price, portfolio):
+        with self.lock:
+            return self.risk.validate(order, market_price, portfolio)
+
+    def settle(self, order):
+        pass
+
+
+def _limits() -> RiskLimits:
+    return RiskLimits(max_position=10 ** 9, max_drawdown=1.0)
+
+
+def _run(risk, n_threads: int, n_orders: int, rule_us: float) -> float:
+    if rule_us > 0:
+        target = risk.risk if isinstance(risk, CoarseLockedRisk) else risk
+        target.register_rule(lambda order, portfolio: (time.sleep(rule_us / 1e6) or True, ''))
+    portfolio = Portfolio(cash=1e9)
+    ts = pd.Timestamp('2024-01-02')
+    barrier = threading.Barrier(n_threads + 1)
+
+    def worker(i: int):
+        symbol = f'SYM{i}'
+        orders = [Order(ts, symbol, 1, 10.0, OrderType.BUY, OrderStyle.MARKET) for _ in range(n_orders)]
+        prices = {symbol: 10.0}
+        barrier.wait()
+        for order in orders:
+            if risk.validate(order, prices, portfolio):
+                risk.settle(order)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return n_threads * n_orders / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    n_orders = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    rule_us = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+
+    print(f"orders/thread={n_orders}, slow rule={rule_us:.0f}us")
+    print(f"{'threads':>8} {'coarse lock':>14} {'shared':>14}")
+    for n_threads in (1, 2, 4, 8):
+        coarse = _run(CoarseLockedRisk(RiskManager(_limits())), n_threads, n_orders, rule_us)
+        shared = _run(SharedRiskManager(_limits()), n_threads, n_orders, rule_us)
+        print(f"{n_threads:>8} {coarse:>12,.0f}/s {shared:>12,.0f}/s")
@@ -0,0 +1,32 @@
+"""
+重放实盘事件日志并与日志中的决策逐条比对（回归测试 / 事后复盘）。
+用法：python -m multi_market_qt_system.scripts.replay_journal [日志目录] [journal|simulate|none]
+"""
+import sys
+
+import yaml
+
+from multi_market_qt_system.backtest.factory import build_risk_manager, build_strategy
+from multi_market_qt_system.core.journal import JournalReader, JournalReplayer
+from multi_market_qt_system.core.portfolio import Portfolio
+
+if __name__ == '__main__':
+    conf = yaml.safe_load(open('config/config.yaml'))
+    journal_dir = sys.argv[1] if len(sys.argv) > 1 else conf.get('live', {}).get('journal_dir', 'state/journal')
+    fills = sys.argv[2] if len(sys.argv) > 2 else 'journal'
+
+    reader = JournalReader(journal_dir, tz=conf.get('live', {}).get('journal_tz', 'UTC'))
+    replayer = JournalReplayer(
+        build_strategy(conf),
+        build_risk_manager(conf),
+        Portfolio(cash=conf.get('initial_cash', 1_000_000)),
+        commission=conf.get('commission', 0.0005),
+        slippage=conf.get('slippage', 0.0002)
+    )
+    result = replayer.replay(reader, fills=fills)
+    print(f"events={result.events} signals={result.signals} orders={result.orders} fills={result.fills}")
+    print(f"throughput={result.events_per_second:,.0f} events/s")
+    if result.mismatches:
+        print(f"DIVERGED: {result.mismatches} mismatches, first (replayed, journaled) = {result.first_mismatch}")
+        sys.exit(1)
+    print("replay matches journal")
@@ -0,0 +1,40 @@
+"""
+行情进程：订阅实时行情并发布到共享内存行情总线，供多个策略进程（run_live 配置 live.market_bus）零拷贝读取。
+定期检查各读者游标，落后超过阈值的慢消费者记录告警。
+用法：python -m multi_market_qt_system.scripts.run_feed_handler
+"""
+import logging
+import threading
+
+import yaml
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.market_data_bus import MarketDataBus
+
+logger = logging.getLogger(__name__)
+
+if __name__ == '__main__':
+    conf = yaml.safe_load(open('config/config.yaml'))
+    bus_conf = conf.get('live', {}).get('market_bus') or {}
+    data_client = DataClient('live', conf)
+    bus = MarketDataBus.create(
+        bus_conf.get('name') or 'mmqt_bars',
+        capacity=bus_conf.get('capacity', 1 << 16),
+        max_consumers=bus_conf.get('max_consumers', 64)
+    )
+    stop = threading.Event()
+
+    def watch_consumers():
+        threshold = bus_conf.get('slow_consumer_threshold', 0.5)
+        while not stop.wait(bus_conf.get('check_interval', 5)):
+            for consumer_id in bus.slow_consumers(threshold):
+                logger.warning("Slow consumer %d lagging %d messages (capacity %d)", consumer_id,
+                               bus.consumer_lag()[consumer_id], bus.capacity)
+
+    threading.Thread(target=watch_consumers, name='bus-watchdog', daemon=True).start()
+    try:
+        # 总线为单写者：各标的的行情回调须在同一线程内调用 bus.publish
+        for symbol in bus_conf.get('symbols') or ['AAPL']:
+            data_client.subscribe(symbol, bus.publish)
+    finally:
+        stop.set()
+        bus.close()
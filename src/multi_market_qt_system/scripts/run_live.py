@@ -1,26 +1,201 @@
+import queue
+import threading
+import time
+
 import yaml
-from multi_market_qt_system import DataClient
-from multi_market_qt_system import DualMAStrategy
-from multi_market_qt_system import RiskManager
-from multi_market_qt_system import ExecutionEngine
-from multi_market_qt_system import FutuGateway
-from multi_market_qt_system import BinanceGateway
+from multi_market_qt_system.core.data_client import DataClient
+from multi_market_qt_system.core.journal import EventJournal, JournalReader, to_ns
+from multi_market_qt_system.core.latency import MetricsRegistry
+from multi_market_qt_system.core.market_calendar import configure_calendars
+from multi_market_qt_system.core.market_data_bus import BusReader, MarketDataBus
+from multi_market_qt_system.core.order import Order, OrderType, OrderStyle
+from multi_market_qt_system.core.portfolio import Portfolio
+from multi_market_qt_system.backtest.factory import build_risk_manager
+from multi_market_qt_system.core.scheduler import EventScheduler
+from multi_market_qt_system.core.state_snapshot import SnapshotManager
+from multi_market_qt_system.strategies.dual_ma_strategy import DualMAStrategy, DualMAStrategyConfig
+from multi_market_qt_system.execution.execution_engine import ExecutionEngine, supports_order_state
+from multi_market_qt_system.execution.order_state import OrderStateStore
+from multi_market_qt_system.broker.futu_gateway import FutuGateway
+from multi_market_qt_system.broker.binance_gateway import BinanceGateway
+from multi_market_qt_system.broker.mock_gateway import MockBroker
 
 if __name__ == '__main__':
     conf = yaml.safe_load(open('config/config.yaml'))
-    data_client = DataClient(conf)
-    strategy = DualMAStrategy(conf)
-    risk_mgr = RiskManager(conf)
+    live_conf = conf.get('live', {})
+    configure_calendars(conf)
+    data_client = DataClient('live', conf)
+    strategy = DualMAStrategy(conf['strategy']['name'], DualMAStrategyConfig(**conf['strategy']['params']))
+    risk_mgr = build_risk_manager(conf)
+    portfolio = Portfolio(cash=conf.get('initial_cash', 1_000_000))
     gateways = []
     if conf['brokers']['futu']['enable']:
         gateways.append(FutuGateway(conf['brokers']['futu']))
     if conf['brokers']['binance']['enable']:
         gateways.append(BinanceGateway(conf['brokers']['binance']))
-    engine = ExecutionEngine(gateways)
+    if (conf['brokers'].get('mock') or {}).get('enable'):
+        gateways.append(MockBroker(drop_rate=conf['brokers']['mock'].get('drop_rate', 0.0)))
+
+    # 延迟与吞吐指标：各阶段注入同一个注册表
+    metrics = MetricsRegistry()
+    metrics_conf = live_conf.get('metrics') or {}
+    data_client.metrics = metrics
+    strategy.attach_metrics(metrics)
+    risk_mgr.attach_metrics(metrics)
+    # 订单/持仓状态缓存：网关回报增量更新，风控按 券商持仓 + 在途买单 检查持仓上限。
+    # 只有能推送回报并提供对账快照的网关才启用，否则在途数量永远不会释放
+    gateway = gateways[0] if gateways else None
+    order_state = OrderStateStore() if gateway is not None and supports_order_state(gateway) else None
+    engine = ExecutionEngine(gateway, metrics=metrics, order_state=order_state) if gateway is not None else None
+    queue_depth = metrics.gauge('bar_queue_depth', 'Bars waiting between feed and strategy')
+
+    # 热重启：恢复最近一次快照，避免重新拉取 long_window 根历史 K 线
+    snapshots = SnapshotManager(
+        live_conf.get('snapshot_dir', 'state/snapshots'),
+        interval_seconds=live_conf.get('snapshot_interval', 60),
+        every_n_events=live_conf.get('snapshot_every_n_events')
+    )
+
+    # 定时事件（月末调仓、收盘前平仓等）随行情时间推进，恢复重放时同样触发以保持状态一致
+    scheduler = EventScheduler()
+    strategy.schedule_events(scheduler)
+
+    commission = conf.get('commission', 0.0005)
+    bar_ts = None  # 最近一根 bar 的时间，作为成交记录的时间戳（回报不一定带时间）
+
+    def on_fill(symbol, action, quantity, price):
+        """
+        每笔成交计入组合（风控的回撤、持仓检查据此更新）并写入事件日志，
+        恢复与重放（JournalReplayer fills='journal'）据此重建组合
+        """
+        fee = quantity * price * commission
+        portfolio.book_fill(bar_ts, symbol, action, quantity, price, fee)
+        if journal is not None:
+            journal.record_fill(bar_ts, symbol, action, quantity, price, fee)
+
+    def replay_event(event):
+        """恢复重放：成交按日志入账，行情走 on_bar（不下单）"""
+        if 'action' in event:
+            portfolio.book_fill(event['timestamp'], event['symbol'], event['action'], event['quantity'],
+                                event['price'], event['fee'])
+        else:
+            on_bar(event, live=False)
+
+    if order_state is not None:
+        # 回报/对账补记的成交；外部补建的订单没有原始方向，卖出按 SHORT 记（入账效果与 SELL 相同且允许开空）
+        order_state.add_fill_listener(lambda state, qty, price: on_fill(
+            state.symbol, state.action or ('BUY' if state.side > 0 else 'SHORT'), qty, price))
+
+    def on_bar(bar, live=True):
+        """live=False 时为恢复重放：只推进策略与风控状态，不再下单、不再写日志"""
+        global seq, bar_ts
+        bar_ts = bar['timestamp']
+        if live:
+            seq = journal.record_bar(bar) if journal is not None else seq + 1
+        # 先触发不晚于本根 bar 的定时事件，其信号排在本根 bar 的信号之前
+        timed = []
+        if to_ns(bar['timestamp']) >= scheduler.next_ns:
+            scheduler.advance_to(bar['timestamp'])
+            timed = strategy.drain_signals()
+        for sig in timed + strategy.on_bar(bar):
+            if live and journal is not None:
+                journal.record_signal(sig)
+            order = Order(
+                timestamp=sig['timestamp'],
+                symbol=sig['symbol'],
+                quantity=sig['quantity'],
+                price=sig['price'],
+                order_type=OrderType[sig['action']],
+                style=OrderStyle.MARKET,
+                commission=conf.get('commission', 0.0005),
+                slippage=conf.get('slippage', 0.0002)
+            )
+            market_price = {bar['symbol']: bar['close']}
+            accepted = risk_mgr.validate(order, market_price, portfolio)
+            if live and journal is not None:
+                journal.record_order(order, accepted)
+            if live and accepted and engine is not None:
+                engine.submit_order(order)
+                if order_state is None:
+                    # 网关没有成交回报：下单确认即按委托价记为全部成交（近似）
+                    on_fill(order.symbol, order.order_type.name, order.quantity, order.price)
+            if accepted:
+                # 订单已登记到订单状态缓存或已入账（恢复重放时直接放弃），释放风控预留
+                risk_mgr.settle(order)
+        if live:
+            # 快照序号取日志中最后一条记录（含本根 bar 之后的成交），恢复时不会重复入账
+            last = journal.last_seq if journal is not None else seq
+            snapshots.maybe_snapshot(last, bar['timestamp'], strategy, portfolio, risk_mgr, scheduler)
+
+    # 二进制事件日志：恢复时重放快照之后的行情，之后继续追加（序号连续）
+    journal_dir = live_conf.get('journal_dir')
+    journal = None
+    events = JournalReader(journal_dir, tz=live_conf.get('journal_tz', 'UTC')).events(fills=True) \
+        if journal_dir else None
+    seq = snapshots.recover(strategy, portfolio, risk_mgr, events=events,
+                            replay=replay_event, scheduler=scheduler)
+    # 恢复重放按快照中的组合持仓做风控，之后才切换到实盘订单状态
+    if order_state is not None:
+        risk_mgr.attach_order_state(order_state)
+    if journal_dir:
+        journal = EventJournal(journal_dir, segment_bytes=live_conf.get('journal_segment_mb', 64) * 1024 * 1024)
+
+    # 行情回调只入队，策略/风控/下单在单独线程中消费，队列深度即积压程度
+    bars: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def enqueue(bar):
+        bars.put(bar)
+        queue_depth.set(bars.qsize())
+
+    reconcile_interval = live_conf.get('reconcile_interval', 30)
+
+    def consume():
+        next_reconcile = time.monotonic() + reconcile_interval
+        while not stop.is_set():
+            try:
+                bar = bars.get(timeout=0.5)
+            except queue.Empty:
+                bar = None
+            if bar is not None:
+                on_bar(bar)
+                queue_depth.set(bars.qsize())
+            # 定期用券商紧凑快照对账，只修正差异。在下单线程中进行：网关回报在下单调用中同步推送，
+            # 快照与回报流同序，不会把快照之后到达的成交当作差异回滚
+            if order_state is not None and time.monotonic() >= next_reconcile:
+                order_state.reconcile(engine.gateway.snapshot())
+                next_reconcile = time.monotonic() + reconcile_interval
+
+    def export_metrics():
+        while not stop.wait(metrics_conf.get('export_interval', 15)):
+            metrics.write_textfile(metrics_conf['textfile'])
+
+    if metrics_conf.get('http_port'):
+        metrics.serve(metrics_conf['http_port'])
+    threading.Thread(target=consume, name='bar-consumer', daemon=True).start()
+    if metrics_conf.get('textfile'):
+        threading.Thread(target=export_metrics, name='metrics-export', daemon=True).start()
 
-    def on_bar(bar):
-        signal = strategy.on_bar(bar)
-        if signal and risk_mgr.check(signal, 0, {}):
-            engine.execute(signal)
+    # 配置了共享内存行情总线时，从 run_feed_handler 发布的总线读取（多个策略进程共享一路行情），否则直接订阅
+    bus_conf = live_conf.get('market_bus') or {}
+    reader = None
+    if bus_conf.get('name'):
+        reader = BusReader(MarketDataBus.attach(bus_conf['name']), bus_conf.get('consumer_id', 0))
 
-    data_client.subscribe('AAPL', on_bar)
\ No newline at end of file
+    try:
+        if reader is not None:
+            for bar in reader.bars():
+                enqueue(bar)
+        else:
+            data_client.subscribe('AAPL', enqueue)
+    finally:
+        stop.set()
+        if reader is not None:
+            reader.close()
+            reader.bus.close()
+        if metrics_conf.get('textfile'):
+            metrics.write_textfile(metrics_conf['textfile'])
+        metrics.shutdown()
+        snapshots.close()
+        if journal is not None:
+            journal.close()
@@ -0,0 +1,44 @@
+import logging
+from dataclasses import dataclass
+
+import numpy as np
+
+from multi_market_qt_system.backtest.matrix_backtester import CrossSectionalStrategy
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CrossSectionalMomentumConfig:
+    lookback: int = 252  # 动量回看期数
+    skip: int = 21  # 跳过最近 N 期（规避短期反转）
+    top_quantile: float = 0.1  # 做多动量最高的比例
+
+
+class CrossSectionalMomentumStrategy(CrossSectionalStrategy):
+    """
+    截面动量策略：每个调仓日等权持有过去 lookback 期（跳过最近 skip 期）收益最高的 top_quantile 标的。
+    """
+
+    def __init__(self, name: str, config: CrossSectionalMomentumConfig):
+        super().__init__(name)
+        assert config.skip < config.lookback, "skip must be < lookback"
+        assert 0 < config.top_quantile <= 1, "top_quantile must be in (0, 1]"
+        self.config = config
+        logger.info("Initialized CrossSectionalMomentumStrategy %s with config %s", name, config)
+
+    def target_weights(self, prices: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        weights = np.zeros((len(rows), prices.shape[1]))
+        valid = rows >= self.config.lookback
+        if not valid.any():
+            return weights
+        r = rows[valid]
+        # 只在调仓日取两行价格，不计算整张动量矩阵
+        score = prices[r - self.config.skip] / prices[r - self.config.lookback] - 1
+        with np.errstate(all='ignore'):
+            threshold = np.nanquantile(score, 1 - self.config.top_quantile, axis=1, keepdims=True)
+        selected = score >= threshold  # NaN 比较结果为 False
+        counts = selected.sum(axis=1, keepdims=True)
+        weights[valid] = np.divide(selected, counts, out=np.zeros(selected.shape), where=counts > 0)
+        logger.debug("Momentum weights computed for %d rebalance dates", int(valid.sum()))
+        return weights
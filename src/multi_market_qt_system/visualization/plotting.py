@@ -9,14 +9,16 @@ from plotly.subplots import make_subplots
 def create_performance_dashboard(
     equity: pd.Series,
     returns: pd.Series,
-    output_path: str = None
+    output_path: str = None,
+    rolling: pd.DataFrame = None
 ) -> go.Figure:
     """
-    生成 2x2 子图的大型 Performance Dashboard。可选保存到 HTML。
+    生成 2x2 子图的大型 Performance Dashboard；提供 rolling 时追加一行滚动指标子图。可选保存到 HTML。
 
     :param equity: 时间序列净值
     :param returns: 时间序列收益率
     :param output_path: 如果指定，则保存 HTML
+    :param rolling: PerformanceMetrics.rolling_metrics() 的结果
     :return: Plotly Figure
     """
     # 计算回撤
@@ -33,15 +35,20 @@ def create_performance_dashboard(
     heat_df['month'] = heat_df.index.month
     pivot = heat_df.pivot(index='year', columns='month', values='monthly_return')
 
-    # 创建 2x2 子图
+    # 创建 2x2 子图（含滚动指标时为 3x2）
+    titles = [
+        'Equity Curve', 'Drawdown',
+        'Return Distribution', 'Monthly Heatmap'
+    ]
+    rows = 2
+    if rolling is not None:
+        rows = 3
+        titles += ['Rolling Sharpe / Beta', 'Rolling Volatility / Drawdown']
     fig = make_subplots(
-        rows=2, cols=2,
-        subplot_titles=[
-            'Equity Curve', 'Drawdown',
-            'Return Distribution', 'Monthly Heatmap'
-        ],
+        rows=rows, cols=2,
+        subplot_titles=titles,
         horizontal_spacing=0.1,
-        vertical_spacing=0.12
+        vertical_spacing=0.12 if rows == 2 else 0.08
     )
 
     # 子图① 净值曲线
@@ -80,9 +87,37 @@ def create_performance_dashboard(
         ), row=2, col=2
     )
 
+    # 子图⑤⑥ 滚动指标
+    if rolling is not None:
+        fig.add_trace(
+            go.Scatter(
+                x=rolling.index, y=rolling['rolling_sharpe'].values,
+                mode='lines', name='Rolling Sharpe'
+            ), row=3, col=1
+        )
+        if 'rolling_beta' in rolling:
+            fig.add_trace(
+                go.Scatter(
+                    x=rolling.index, y=rolling['rolling_beta'].values,
+                    mode='lines', name='Rolling Beta'
+                ), row=3, col=1
+            )
+        fig.add_trace(
+            go.Scatter(
+                x=rolling.index, y=rolling['rolling_volatility'].values,
+                mode='lines', name='Rolling Volatility'
+            ), row=3, col=2
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=rolling.index, y=rolling['rolling_drawdown'].values,
+                mode='lines', name='Rolling Drawdown', line=dict(color='firebrick')
+            ), row=3, col=2
+        )
+
     # 布局调整
     fig.update_layout(
-        height=900,
+        height=900 if rows == 2 else 1300,
         width=1400,
         title_text='Performance Dashboard',
         template='plotly_white'